@@ -5,6 +5,7 @@ from typing import Optional
 
 from .configs import ProtogenieConfiguration
 from .dispatch import split_files, files_from_memory, glue
+from .memory import convert_memory
 from .cli_utils import check_ratio
 
 import click
@@ -38,7 +39,18 @@ def cli_scheme(dest):
 @click.option("-d", "--dev", "dev", default=0., type=float, help="Ratio (on 1) of data to use for dev set")
 @click.option("-e", "--test", "test", default=0.2, type=float, help="Ratio (on 1) of data to use for test set")
 @click.option("-v", "--verbose", default=False, is_flag=True, help="Print text level stats")
-def cli_build(file, output="./output", no_split=False, clear=False, train=0.8, dev=.0, test=0.2, verbose=False):
+@click.option("-s", "--single-pass", default=False, is_flag=True,
+              help="Read each file only once, using temporary storage for units until they are dispatched")
+@click.option("--seed", default=None, type=int, help="Seed for random dispatching")
+@click.option("--hash", "hash_dispatch", default=None, type=click.Choice(["content", "index"]),
+              help="Dispatch each unit from a hash of its content or of its position in its file instead of randomly")
+@click.option("--salt", default="", type=str, help="Salt of the --hash dispatch")
+@click.option("-j", "--jobs", default=1, type=click.IntRange(min=1),
+              help="Number of files processed at the same time (Use --seed for reproducible outputs)")
+@click.option("-i", "--inline-postprocessing", default=False, is_flag=True,
+              help="Apply post-processings to sentences before they are written instead of rewriting output files")
+def cli_build(file, output="./output", no_split=False, clear=False, train=0.8, dev=.0, test=0.2, verbose=False,
+              single_pass=False, seed=None, hash_dispatch=None, salt="", jobs=1, inline_postprocessing=False):
     """ Uses [FILE] to split and pre-process a training corpus for NLP Tasks. File should follow the schema, see
     protogeneia get-scheme"""
 
@@ -59,7 +71,13 @@ def cli_build(file, output="./output", no_split=False, clear=False, train=0.8, d
         test=test,
         dev=dev,
         output_dir=output,
-        verbose=verbose
+        verbose=verbose,
+        single_pass=single_pass,
+        seed=seed,
+        hash_dispatch=hash_dispatch,
+        salt=salt,
+        jobs=jobs,
+        inline_postprocessing=inline_postprocessing
     )
 
 
@@ -72,7 +90,15 @@ def cli_build(file, output="./output", no_split=False, clear=False, train=0.8, d
               help="[New file only] Percentage of data to use for dev set")
 @click.option("-e", "--test", "test", default=None, type=float,
               help="[New file only] Percentage of data to use for test set")
-def cli_rebuild(file, memory, output, clear=False, dev=.0, test=0.2):
+@click.option("--seed", default=None, type=int, help="[New file only] Seed for random dispatching")
+@click.option("-i", "--inline-postprocessing", default=False, is_flag=True,
+              help="Apply post-processings to sentences before they are written instead of rewriting output files")
+@click.option("-m", "--new-memory", default=None, type=click.Path(file_okay=True, dir_okay=False),
+              help="Write the memory, with rows of new files, to this new file instead of appending to [MEMORY]")
+@click.option("-j", "--jobs", default=1, type=click.IntRange(min=1),
+              help="Number of files processed at the same time (Use --seed for reproducible new files)")
+def cli_rebuild(file, memory, output, clear=False, dev=.0, test=0.2, seed=None, inline_postprocessing=False,
+                new_memory=None, jobs=1):
     """Given [MEMORY] file, uses [FILE] config file to generate a new corpus
 
     This method detects new files and treat them if --test and --dev are given
@@ -92,27 +118,50 @@ def cli_rebuild(file, memory, output, clear=False, dev=.0, test=0.2):
         memory_file=memory,
         test_ratio=test,
         dev_ratio=dev,
-        output_dir=output
+        output_dir=output,
+        seed=seed,
+        inline_postprocessing=inline_postprocessing,
+        new_memory_file=new_memory,
+        jobs=jobs
     )
 
 
+@main.command("convert-memory")
+@click.argument("source", type=click.Path(exists=True, file_okay=True, dir_okay=False))
+@click.argument("destination", type=click.Path(file_okay=True, dir_okay=False))
+def cli_convert_memory(source, destination):
+    """Convert the [SOURCE] memory to [DESTINATION], as CSV or in the compact format given by its extension
+    (.mem, .mem.gz or .mem.xz)"""
+    convert_memory(source, destination)
+    click.echo("Converted to {}".format(os.path.abspath(destination)))
+
+
 @main.command("concat")
 @click.argument("config", type=click.Path(exists=True, file_okay=True, dir_okay=False))
 @click.argument("output",  type=click.Path(exists=True, file_okay=False, dir_okay=True))
 @click.option("-r", "--reduce", type=click.FLOAT, default=None, help="Reduce training corpus to the given percentage")
 @click.option("-p", "--prefix", type=click.STRING, default="", help="Prefix for output files")
 @click.option("-v", "--verbose", default=False, is_flag=True, help="Print text level stats")
-def cli_concat(config, output, reduce, verbose, prefix):
+@click.option("-j", "--jobs", default=1, type=click.IntRange(min=1),
+              help="Number of files written at the same time, each one at its place in the output")
+@click.option("--shards", default=None, type=click.IntRange(min=1),
+              help="Split each dataset in this number of files with about the same number of tokens")
+@click.option("--max-shard-tokens", default=None, type=click.IntRange(min=1),
+              help="Split each dataset in files of at most this number of tokens")
+def cli_concat(config, output, reduce, verbose, prefix, jobs=1, shards=None, max_shard_tokens=None):
     """Given [CONFIG] file, uses files found in [OUTPUT] to collate files together
 
     This method detects new files and treat them if --test and --dev are given
     """
-    concat(config, output, verbose=verbose, reduce=reduce, prefix=prefix)
+    concat(config, output, verbose=verbose, reduce=reduce, prefix=prefix, jobs=jobs,
+           shards=shards, max_shard_tokens=max_shard_tokens)
 
 
 def dispatch(
         train: float, test: float, dev: float, config: str, output_dir: str,
-        verbose=False, concat: bool = False) -> ProtogenieConfiguration:
+        verbose=False, concat: bool = False, single_pass: bool = False,
+        seed: Optional[int] = None, hash_dispatch: Optional[str] = None, salt: str = "",
+        jobs: int = 1, inline_postprocessing: bool = False) -> ProtogenieConfiguration:
     """
 
     :param train:
@@ -122,6 +171,12 @@ def dispatch(
     :param output_dir:
     :param verbose:
     :param concat:
+    :param single_pass: Read each file only once
+    :param seed: Seed for random dispatching
+    :param hash_dispatch: Dispatch units from a hash of their `content` or of their `index` instead of randomly
+    :param salt: Salt of the hash dispatch
+    :param jobs: Number of files processed at the same time
+    :param inline_postprocessing: Apply post-processings to sentences before they are written
     :return: PPAConfiguration for test purposes
     """
 
@@ -138,7 +193,9 @@ def dispatch(
     print("Processing...")
     # I run over each files
     for file, ratios in split_files(output_folder=output_dir, verbose=verbose, dev_ratio=dev, test_ratio=test,
-                                    config=config, no_split=no_split):
+                                    config=config, no_split=no_split, single_pass=single_pass,
+                                    seed=seed, hash_dispatch=hash_dispatch, salt=salt, jobs=jobs,
+                                    inline_postprocessing=inline_postprocessing):
 
         print("{} has been transformed".format(file))
         for key, value in ratios.items():
@@ -149,7 +206,9 @@ def dispatch(
 
 
 def from_memory(memory_file: str, config: str, output_dir: str,
-                dev_ratio: float = None, test_ratio: float = None) -> ProtogenieConfiguration:
+                dev_ratio: float = None, test_ratio: float = None,
+                seed: Optional[int] = None, inline_postprocessing: bool = False,
+                new_memory_file: Optional[str] = None, jobs: int = 1) -> ProtogenieConfiguration:
     config = ProtogenieConfiguration.from_xml(config)
 
     os.makedirs(output_dir, exist_ok=True)
@@ -157,7 +216,9 @@ def from_memory(memory_file: str, config: str, output_dir: str,
         os.makedirs(os.path.join(output_dir, subset), exist_ok=True)
 
     for file, ratios in files_from_memory(config=config, memory_file=memory_file, output_folder=output_dir,
-                                          dev_ratio=dev_ratio, test_ratio=test_ratio):
+                                          dev_ratio=dev_ratio, test_ratio=test_ratio, seed=seed,
+                                          inline_postprocessing=inline_postprocessing,
+                                          new_memory_file=new_memory_file, jobs=jobs):
         print("{} has been transformed".format(file))
         for key, value in ratios.items():
             if value:
@@ -167,11 +228,13 @@ def from_memory(memory_file: str, config: str, output_dir: str,
 
 
 def concat(config: str, output_dir: str, verbose: bool = True, reduce: Optional[float] = None,
-           prefix: str = ""
+           prefix: str = "", jobs: int = 1, shards: Optional[int] = None, max_shard_tokens: Optional[int] = None
            ) -> ProtogenieConfiguration:
     if reduce is not None:
         if reduce > 1 or reduce < 0.:
             raise click.BadParameter("Reduce should be in the range ]0:1]")
+    if shards and max_shard_tokens:
+        raise click.BadParameter("--shards and --max-shard-tokens cannot be used together")
     config = ProtogenieConfiguration.from_xml(config)
     dataset = None
 
@@ -179,7 +242,8 @@ def concat(config: str, output_dir: str, verbose: bool = True, reduce: Optional[
     template = '    {:'+str(max_len)+'s} {:>10d} {:>10d}'
     chunks_lines = {}
     for data_type, filename, nb_chunks, nb_lines in glue(
-            config=config, output_folder=output_dir, verbose=verbose, reduce=reduce, prefix=prefix):
+            config=config, output_folder=output_dir, verbose=verbose, reduce=reduce, prefix=prefix, jobs=jobs,
+            shards=shards, max_shard_tokens=max_shard_tokens):
         if dataset != data_type:
             if dataset in chunks_lines:
                 click.echo("# {}'s statistics".format(dataset))
@@ -1,4 +1,4 @@
-from typing import Dict, Optional, Any, Type, List
+from typing import Dict, Optional, Any, Type, List, Iterator
 import os.path
 import lxml.etree as ET
 from copy import deepcopy
@@ -89,21 +89,19 @@ class CorpusConfiguration:
     def unit_name(self):
         return self.UNIT_NAMES[self.splitter_name]
 
-    def splitter_reset(self):
-        """ This function can be useful to reset a splitter in between passes
-        """
-        self.splitter.reset()
-
-    def build_dataset_dispatch_list(self, units_count, test_ratio=0.2, dev_ratio=0.0001):
-        """ Build a list of dataset target that will be used by the dispatching loop
+    def build_dataset_dispatch_list(self, units_count, test_ratio=0.2, dev_ratio=0.0001,
+                                    seed=None) -> Iterator[str]:
+        """ Build the dataset targets that will be used by the dispatching loop
 
+        Targets are produced one at a time, the dispatching loop takes the next one for each unit.
 
         :param units_count: Number of units to dispatch (either sentence or dispatch depending on self.splitter)
         :param test_ratio: Ratio of data to be put in test
         :param dev_ratio: Ratio of data to be put in dev
-        :return: List of dataset name targets (list of "train", "test" and "dev")
+        :param seed: [Optional] Seed for random dispatching
+        :return: Iterator over dataset name targets ("train", "test" and "dev")
         """
-        return self.splitter.dispatch(units_count, test_ratio=test_ratio, dev_ratio=dev_ratio)
+        return self.splitter.dispatch(units_count, test_ratio=test_ratio, dev_ratio=dev_ratio, seed=seed)
 
 
 class ProtogenieConfiguration:
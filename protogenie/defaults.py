@@ -4,3 +4,7 @@
 DEFAULT_SPLITTER = "punctuation"
 DEFAULT_SENTENCE_MARKERS = ";:."
 DEFAULT_COLUMN_MARKER = "TAB"
+DEFAULT_SPILL_SIZE = 64 * 1024 * 1024  # Bytes of units kept in memory by single pass dispatch before using the disk
+DEFAULT_WRITER_BUFFER_SIZE = 1024 * 1024  # Buffer size of each file kept open by a writer pool
+DEFAULT_WRITER_MAX_OPEN = 64  # Number of files a writer pool keeps open at the same time
+DEFAULT_COPY_SIZE = 1024 * 1024  # Bytes read at once when concat copies output files as they are
@@ -1,13 +1,23 @@
-from .io_utils import add_sentence, get_name
-from .configs import CorpusConfiguration, ProtogenieConfiguration
+from .io_utils import add_sentence, count_lines, get_name, read_lines, read_range, WriterPool
+from .memory import format_from_path, is_binary, memory_writer, read_memory, update_memory
+from .manifest import count_sentences, load_manifest, manifest_entry, write_manifest, OutputCounter
+from .configs import CorpusConfiguration, ProtogenieConfiguration, Output
 from dataclasses import dataclass
-from typing import Dict, Optional, List, Set, Tuple
-from .splitters import LineSplitter
-from .reader import ColumnNotFound
+from .defaults import DEFAULT_SPILL_SIZE, DEFAULT_COPY_SIZE
+from typing import Dict, Optional, List, Set, Tuple, Iterable, Iterator, IO, Any, Callable, BinaryIO
+from concurrent.futures import ProcessPoolExecutor
+from .splitters import LineSplitter, FileSplitter, TokenWindowSplitter, _DispatcherHash
+from .reader import ColumnNotFound, Reader
+from .postprocessing import apply_postprocessings, InlinePostProcessings
 import glob
 import os
 import math
-import csv
+import tempfile
+import random
+import locale
+import re
+import json
+from itertools import islice
 
 
 __all__ = ["split_files", "files_from_memory", "ConfigError"]
@@ -19,18 +29,28 @@ class ConfigError(Exception):
 
 @dataclass
 class _Range:
-    """Just a class to deal with typing. End is the end of the range, dataset is [train|dev|test]"""
+    """Just a class to deal with typing. End is the end of the range, dataset is [train|dev|test]
+
+    Offset and length are the position of the range in bytes, when the memory holds them"""
     end: int
     dataset: str
+    offset: Optional[int] = None
+    length: Optional[int] = None
 
 
 @dataclass
 class _CorpusDispatched:
     """ Item that contains informations about dispatching
 
-    Using dataclass mainly for typing"""
+    Using dataclass mainly for typing. Ranges read from the memory are written to the file at MEMORY,
+    `ordered` tells whether they were found sorted by start line and `offsets` whether all of them have one"""
     config: CorpusConfiguration
-    lines: Dict[int, _Range]
+    unix_path: str
+    memory: str = ""
+    rows: int = 0
+    ordered: bool = True
+    offsets: bool = True
+    last_start: int = -1
 
 
 ################
@@ -40,7 +60,9 @@ class _CorpusDispatched:
 
 def split_files(
         config: ProtogenieConfiguration, output_folder: str, dev_ratio: float, test_ratio: float,
-        verbose: bool = True, no_split: bool = False):
+        verbose: bool = True, no_split: bool = False, single_pass: bool = False,
+        writer_pool: Optional[WriterPool] = None, seed: Optional[int] = None,
+        hash_dispatch: Optional[str] = None, salt: str = "", jobs: int = 1, inline_postprocessing: bool = False):
     """ Dispatch sentence for each file in files
 
     :param config: Configuration for PPA Splitter
@@ -49,32 +71,74 @@ def split_files(
     :param test_ratio: Ratio of data to put in test
     :param verbose: Verbosity (Adds some print during process)
     :param no_split: Do not apply splitting
+    :param single_pass: Read each file only once, spilling units to a temporary file until they can be dispatched
+    :param writer_pool: [Optional] Pool used to write output files
+    :param seed: [Optional] Seed for random dispatching. Each file gets its own seed derived from it
+    :param hash_dispatch: [Optional] Dispatch units from a hash of their `content` or of their `index` in their
+                          file instead of randomly. Files are then read once
+    :param salt: Salt of the hash dispatch
+    :param jobs: Number of processes dispatching files at the same time. Largest files are dispatched first,
+                 stats and memory are still produced in file order
+    :param inline_postprocessing: Apply post-processings to sentences before writing them instead of rewriting
+                                  output files. Post-processings that need statistics over the whole file
+                                  (such as capitalize) and the ones following them are still applied afterwards
 
     :yield: File, Dispatch stats about file
     """
 
     memory, memory_file = None, None
+    outputs: Dict[str, List[str]] = {}
+    counter = OutputCounter(config.output.column_marker)
     if config.memory:
-        memory_file = open(config.memory, "w")
-        memory = csv.writer(memory_file)
-
-    # For each file
-    for unix_path, current_config in config.corpora.items():
-        unix_path = os.path.join(config.dir, unix_path)
-        for file in glob.glob(unix_path):
-           yield from _single_file_dispatch(
-               file, current_config=current_config, memory=memory,
-               dev_ratio=dev_ratio, test_ratio=test_ratio, output_folder=output_folder,
-               config=config, verbose=verbose, no_split=no_split
-           )
+        memory_format = format_from_path(config.memory)
+        memory_file = open(config.memory, "wb" if is_binary(memory_format) else "w")
+        memory = memory_writer(memory_file, memory_format)
+
+    options = dict(
+        dev_ratio=dev_ratio, test_ratio=test_ratio, output_folder=output_folder,
+        verbose=verbose, no_split=no_split, single_pass=single_pass,
+        seed=seed, hash_dispatch=hash_dispatch, salt=salt, inline_postprocessing=inline_postprocessing
+    )
+    # Files, in order, with the path of their corpus
+    files: List[Tuple[str, str]] = [
+        (file, unix_path)
+        for unix_path in config.corpora
+        for file in glob.glob(os.path.join(config.dir, unix_path))
+    ]
+
+    if jobs > 1:
+        for file, training_tokens, memory_rows in _parallel_dispatch(
+                config, files, jobs=jobs, options=options, counter=counter):
+            if memory:
+                memory.writerows(memory_rows)
+            _add_outputs(outputs, output_folder, file, training_tokens)
+            yield file, training_tokens
+    else:
+        pool = writer_pool or WriterPool(counter=counter)
+        try:
+            # For each file
+            for file, unix_path in files:
+                for _, training_tokens in _single_file_dispatch(
+                        file, current_config=config.corpora[unix_path], memory=memory,
+                        config=config, pool=pool, **options):
+                    _add_outputs(outputs, output_folder, file, training_tokens)
+                    # Post-processings of the file are applied once it has been yielded
+                    yield file, training_tokens
+        finally:
+            pool.close_all()
 
     if memory:
+        memory.close()
         memory_file.close()
 
+    if outputs:
+        write_manifest(output_folder, outputs, counter.counts())
+
 
 def files_from_memory(
         config: ProtogenieConfiguration, output_folder: str, memory_file: str,
-        verbose: bool = True, dev_ratio: float = None, test_ratio: float = None):
+        verbose: bool = True, dev_ratio: float = None, test_ratio: float = None, seed: Optional[int] = None,
+        inline_postprocessing: bool = False, new_memory_file: Optional[str] = None, jobs: int = 1):
     """ Regenerate a corpus using the same previously selected lined but potentially
     adding files and different post-processing
 
@@ -84,253 +148,861 @@ def files_from_memory(
     :param verbose: Whether to print stuff
     :param dev_ratio: Dev Ratio
     :param test_ratio: Test ratio
+    :param seed: [Optional] Seed for random dispatching of new files
+    :param inline_postprocessing: Apply post-processings to sentences before writing them (See split_files())
+    :param new_memory_file: [Optional] Write the memory, with rows of new files, to this file instead of
+                            appending them to MEMORY_FILE
+    :param jobs: Number of processes rebuilding files at the same time (See split_files())
     """
-    with open(memory_file) as memory:
-        memory_reader = list(csv.reader(memory))
-
     dispatcher: Dict[str, _CorpusDispatched] = {
-        os.path.realpath(real_path): _CorpusDispatched(config=corpus_config, lines={})
+        os.path.realpath(real_path): _CorpusDispatched(config=corpus_config, unix_path=unix_path)
         for unix_path, corpus_config in config.corpora.items()
         for real_path in glob.glob(os.path.join(config.dir, unix_path))
     }
 
-    # For each file, we build a map of the lines that needs to be dispatched
-    for line in memory_reader:
-        if not line:
-            continue
-        current_file, line_range, dataset_target = line
-
-        real_path = os.path.realpath(current_file)
-        if real_path in dispatcher:
-            start, end = tuple(map(int, line_range.split("-")))
-            dispatcher[real_path].lines[start] = _Range(end=end, dataset=dataset_target)
-
-    new_files = []
-    for file, dispatching in dispatcher.items():
-        if not dispatching.lines:
-            new_files.append((file, dispatching.config))
-            pass
-
-        # We set up a dictionary of token count to print nice
-        #  information later
-        training_tokens = {"test": 0, "dev": 0, "train": 0}
-
-        current_config = dispatching.config
-
-        header_line = []
-        created_files = set()
-        sentence = []
-        blanks = 0
-        current_set: Optional[_Range] = None
-
-        with open(file) as f:
-            for line_no, line in enumerate(f):
-                if line_no == 0:
-                    if current_config.reader.has_header:
-                        header_line = current_config.reader.set_header(line)
-                        continue
-                    else:
-                        header_line = current_config.reader.header
-                elif not line.strip() and not isinstance(current_config.splitter, LineSplitter):
-                    # Only count is we already have written or the sentence writing has started
-                    if len(sentence) > 0:
-                        blanks += 1
-                    continue
-
-                if line_no in dispatching.lines:                  # We begin a set
-                    current_set = dispatching.lines[line_no]
-                    sentence.append(line)
-                elif current_set and line_no != current_set.end:  # We are in the set
-                    sentence.append(line)
-                elif current_set and line_no == current_set.end:  # We are at the end of the set
-                    sentence.append(line)
-                    blanks = 0  # ToDo: Blanks are not really taken into account here...
-                    sentence = [x for x in sentence if x.strip()]
-                    add_sentence(
-                        output_folder=output_folder,
-                        dataset=current_set.dataset,
-                        filename=file,
-                        sentence=sentence,
-                        source_marker=current_config.column_marker,
-                        output_marker=config.output.column_marker
-                    )
-                    training_tokens[current_set.dataset] += len(sentence)
-                    sentence = []
-
-            # Finally, if there is something remaining
-            if len(sentence) and current_set:
-                add_sentence(
-                    output_folder=output_folder,
-                    dataset=current_set.dataset,
-                    filename=file,
-                    sentence=sentence,
-                    source_marker=current_config.column_marker,
-                    output_marker=config.output.column_marker
-                )
-                training_tokens[current_set.dataset] += len(sentence)
-
-        # Add the header to the files
-        created_files.update(
-            _add_header(
-                output_folder=output_folder, training_tokens=training_tokens, header_line=header_line,
-                current_config=current_config, file=file
-            )
-        )
+    options = dict(output_folder=output_folder, inline_postprocessing=inline_postprocessing)
+    outputs: Dict[str, List[str]] = {}
+    counter = OutputCounter(config.output.column_marker)
+    with WriterPool(counter=counter) as pool:
+        with tempfile.TemporaryDirectory() as directory:
+            # For each file, we gather the ranges that need to be dispatched
+            _partition_memory(memory_file, dispatcher, directory)
+
+            # Files, in order, with their ranges
+            files: List[Tuple[str, _CorpusDispatched]] = list(dispatcher.items())
+            new_files: List[Tuple[str, str]] = [
+                (file, dispatching.unix_path)
+                for file, dispatching in files
+                if not dispatching.rows
+            ]
+
+            if jobs > 1:
+                for file, training_tokens, _ in _parallel_dispatch(
+                        config, files, jobs=jobs, options=options, worker=_rebuild_group, counter=counter):
+                    _add_outputs(outputs, output_folder, file, training_tokens)
+                    yield file, training_tokens
+            else:
+                for file, dispatching in files:
+                    for _, training_tokens in _single_file_from_memory(
+                            file, dispatching, config=config, pool=pool, **options):
+                        _add_outputs(outputs, output_folder, file, training_tokens)
+                        yield file, training_tokens
+
+        # Rows of new files are only added to the memory once every file has been dispatched
+        with update_memory(memory_file, new_path=new_memory_file) as writer:
+            if new_files:
+                # We have new files, we need to deal with them per usual
+                if not test_ratio:
+                    raise ConfigError("Ratios were not given and we have a new file.")
+
+                options.update(dev_ratio=dev_ratio, test_ratio=test_ratio, verbose=verbose, seed=seed)
+                if jobs > 1:
+                    for file, training_tokens, memory_rows in _parallel_dispatch(
+                            config, new_files, jobs=jobs, options=options, counter=counter):
+                        writer.writerows(memory_rows)
+                        _add_outputs(outputs, output_folder, file, training_tokens)
+                        yield file, training_tokens
+                else:
+                    for file, unix_path in new_files:
+                        for _, training_tokens in _single_file_dispatch(
+                                file, current_config=config.corpora[unix_path], memory=writer,
+                                config=config, pool=pool, **options):
+                            _add_outputs(outputs, output_folder, file, training_tokens)
+                            yield file, training_tokens
 
-        yield file, training_tokens
-
-        if config.postprocessings:
-            for post_processings in config.postprocessings:
-                for output_file in created_files:
-                    post_processings.apply(output_file, current_config)
-
-    memory = open(memory_file, "w")
-    writer = csv.writer(memory)
-    writer.writerows(memory_reader)
-
-    if new_files:
-        # We have new files, we need to deal with them per usual
-        if not test_ratio:
-            raise ConfigError("Ratios were not given and we have a new file.")
-
-        for file, current_config in new_files:
-            yield from _single_file_dispatch(
-                config=config,
-                dev_ratio=dev_ratio,
-                test_ratio=test_ratio,
-                current_config=current_config,
-                verbose=verbose,
-                file=file,
-                output_folder=output_folder,
-                memory=writer
-            )
-    memory.close()
+    if outputs:
+        write_manifest(output_folder, outputs, counter.counts())
 
 
 def glue(config: ProtogenieConfiguration, output_folder: str,
-         verbose: bool = True, reduce: Optional[float] = None, prefix: str = ""):
+         verbose: bool = True, reduce: Optional[float] = None, prefix: str = "", jobs: int = 1,
+         shards: Optional[int] = None, max_shard_tokens: Optional[int] = None):
     """
 
     :param config:
     :param output_folder:
     :param verbose:
     :param reduce: [Optional] Take only a portion of a float
+    :param jobs: Number of processes writing files at the same time. The size of each file in the output is
+                 computed first, so that each one is written in place
+    :param shards: [Optional] Split each dataset in this number of files with about the same number of tokens
+    :param max_shard_tokens: [Optional] Split each dataset in files of at most this number of tokens, unless
+                             a sentence is longer
     :return: Generator[data_type, filename, nb_chunks, nb_lines]
+
+    Sentences and tokens of files which did not change since the build are taken from its manifest instead of
+    being counted first.
     """
-    def write_sentence(sents: List[List[str]], dataset):
-        dataset.write("\n".join(config.output.column_marker.join(sent) for sent in sents)+"\n\n") # 2 new lines
-
-    for dataset_type in ["train", "test", "dev"]:
-        cur_dir = os.path.join(output_folder, dataset_type)
-
-        out = os.path.join(output_folder, prefix + dataset_type + ".tsv")
-        out = open(out, "w")
-        out.write(config.output.column_marker.join(config.output.header)+"\n")
-
-        for _, _, files in os.walk(cur_dir, topdown=False):
-            for file in files:
-                basename = os.path.basename(file)
-                tokens = [0]
-
-                # Output files necessarly have headers and empty lines as markers
-                with open(os.path.join(cur_dir, file)) as f:
-                    sentences = []
-                    sentence = []
-                    for line_numb, line in enumerate(f.readlines()):
-                        line = line.strip()
-                        # If we met the header
-                        if line_numb == 0:
-                            cols = line.split(config.output.column_marker)
-                            header_map = [cols.index(head) for head in config.output.header]
-                            continue
-
-                        # If we have a sentence
-                        if not line and sentence:
-                            sentences.append(sentence)
-                            sentence = []
-                            tokens.append(0)
-                            continue
-
-                        mapped = line.split(config.output.column_marker)
-                        if not "".join(mapped).strip():
-                            continue
-                        try:
-                            mapped = [mapped[index] for index in header_map]
-                        except IndexError:
-                            raise ValueError(f"Line {line_numb} failing in {file}: {mapped}")
-                        tokens[-1] += 1
-                        sentence.append(mapped)
-
-                    if sentence:
-                        sentences.append(sentence)
-
-                    max_int = len(sentences)
-                    if reduce:# and dataset_type == "train":
-                        max_int = math.ceil(reduce * max_int)
-
-                    for sentence in sentences[:max_int]:
-                        #if dataset_type == "dev":
-                        #    print(sentence)
-                        write_sentence(sentence, out)
-
-                yield dataset_type, basename, len(sentences[:max_int]), sum(tokens[:max_int])
-
-        out.close()
+    manifest = load_manifest(output_folder)
+    executor = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 and hasattr(os, "pwrite") else None
+    try:
+        for dataset_type in ["train", "test", "dev"]:
+            cur_dir = os.path.join(output_folder, dataset_type)
+            files = [
+                (path, file, manifest_entry(manifest, output_folder, path))
+                for _, _, files in os.walk(cur_dir, topdown=False)
+                for file in files
+                for path in [os.path.join(cur_dir, file)]
+            ]
+
+            out = os.path.join(output_folder, prefix + dataset_type + ".tsv")
+            header = (config.output.column_marker.join(config.output.header)+"\n").encode(
+                locale.getpreferredencoding(False)
+            )
+            if shards or max_shard_tokens:
+                shard_writer = _Shards(os.path.join(output_folder, prefix + dataset_type), header, count=shards)
+                yield from _sharded_glue(
+                    shard_writer, config.output, dataset_type, files, reduce=reduce, executor=executor,
+                    shards=shards, max_shard_tokens=max_shard_tokens
+                )
+                continue
+            elif executor:
+                yield from _parallel_glue(executor, config.output, dataset_type, files, out, header, reduce)
+                continue
+
+            with open(out, "wb") as f:
+                f.write(header)
+                for path, file, entry in files:
+                    nb_chunks, nb_lines = 0, 0
+                    for block, chunks, lines in _glue_file(path, file, config.output, reduce, entry=entry):
+                        f.write(block)
+                        nb_chunks += chunks
+                        nb_lines += lines
+                    yield dataset_type, os.path.basename(file), nb_chunks, nb_lines
+    finally:
+        if executor:
+            executor.shutdown()
     return []
 
+
+def _parallel_glue(executor: ProcessPoolExecutor, output: Output, dataset_type: str,
+                   files: List[Tuple[str, str, Optional[Dict]]], out: str, header: bytes, reduce: Optional[float] = None):
+    """ Concatenate FILES in OUT with the processes of EXECUTOR: the size of each file in OUT is measured,
+    OUT is allocated and each file is written at its offset
+
+    :yield: data_type, filename, nb_chunks, nb_lines, in the order of FILES
+    """
+    measures = [
+        future.result()
+        for future in [
+            executor.submit(_measure_glued, path, file, output, reduce, entry) for path, file, entry in files
+        ]
+    ]
+
+    offsets, offset = [], len(header)
+    for size, _, _ in measures:
+        offsets.append(offset)
+        offset += size
+
+    with open(out, "wb") as f:
+        f.write(header)
+        f.flush()
+        try:
+            if hasattr(os, "posix_fallocate") and offset > len(header):
+                os.posix_fallocate(f.fileno(), len(header), offset - len(header))
+        except OSError:  # The file system does not support it, only its size is set
+            pass
+        f.truncate(offset)
+
+    writes = [
+        executor.submit(_write_glued, path, file, output, reduce, out, file_offset, entry)
+        for (path, file, entry), file_offset in zip(files, offsets)
+    ]
+    for (path, file, _), write, (_, nb_chunks, nb_lines) in zip(files, writes, measures):
+        write.result()
+        yield dataset_type, os.path.basename(file), nb_chunks, nb_lines
+
+
+class _Shards:
+    """ Files of a dataset split in shards, named after PATH (`PATH.00.tsv`, `PATH.01.tsv`...), and their index
+    (`PATH.index.json`), which reports the sentences and tokens of each shard.
+
+    Numbers of shards have the same width, the one of COUNT when the number of shards is known first, so that shards
+    sort in their order. Shards of a previous concatenation in PATH are removed when the first shard is started.
+    """
+    def __init__(self, path: str, header: bytes, count: Optional[int] = None):
+        self.path: str = path
+        self.header: bytes = header
+        self.index: List[Dict[str, Any]] = []
+        self.width: int = max(2, len(str(count - 1))) if count else 2
+        self._handle: Optional[BinaryIO] = None
+
+    def _name(self, number: int, width: int) -> str:
+        return "{}.{:0{}d}.tsv".format(self.path, number, width)
+
+    def _remove_previous(self) -> None:
+        """ Remove the shards of PATH left by a previous concatenation"""
+        shard = re.compile(re.escape(os.path.basename(self.path)) + r"\.\d+\.tsv")
+        for name in glob.glob(glob.escape(self.path) + ".*.tsv"):
+            if shard.fullmatch(os.path.basename(name)):
+                os.remove(name)
+
+    def new(self) -> None:
+        """ Close the current shard and start the next one"""
+        self.close()
+        if not self.index:
+            self._remove_previous()
+        name = self._name(len(self.index), self.width)
+        self._handle = open(name, "wb")
+        self._handle.write(self.header)
+        self.index.append({"file": os.path.basename(name), "sentences": 0, "tokens": 0})
+
+    @property
+    def tokens(self) -> int:
+        return self.index[-1]["tokens"] if self.index else 0
+
+    def write(self, sentence: bytes, tokens: int) -> None:
+        self._handle.write(sentence)
+        self.index[-1]["sentences"] += 1
+        self.index[-1]["tokens"] += tokens
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def write_index(self) -> None:
+        # Shards numbered beyond the width are renamed, now that their number is known
+        width = max(self.width, len(str(len(self.index) - 1)))
+        if width != self.width:
+            for number, shard in enumerate(self.index):
+                name = self._name(number, width)
+                os.replace(os.path.join(os.path.dirname(self.path), shard["file"]), name)
+                shard["file"] = os.path.basename(name)
+            self.width = width
+        with open(self.path + ".index.json", "w") as f:
+            json.dump({"shards": self.index}, f, indent=2)
+
+
+def _sharded_glue(shard_writer: _Shards, output: Output, dataset_type: str,
+                  files: List[Tuple[str, str, Optional[Dict]]],
+                  reduce: Optional[float] = None, executor: Optional[ProcessPoolExecutor] = None,
+                  shards: Optional[int] = None, max_shard_tokens: Optional[int] = None):
+    """ Concatenate FILES in the shards of SHARD_WRITER, cut between sentences
+
+    With SHARDS, shards are balanced on the total of tokens, which is taken from the manifest entries of FILES
+    or measured first (by EXECUTOR if any). With
+    MAX_SHARD_TOKENS, a new shard is started when the next sentence would not fit in the current one.
+
+    :yield: data_type, filename, nb_chunks, nb_lines, in the order of FILES
+    """
+    total = 0
+    if shards and not reduce and all(entry for _, _, entry in files):
+        total = sum(entry["tokens"] for _, _, entry in files)
+    elif shards:
+        if executor:
+            measures = [
+                future.result()
+                for future in [
+                    executor.submit(_measure_glued, path, file, output, reduce, entry) for path, file, entry in files
+                ]
+            ]
+        else:
+            measures = [_measure_glued(path, file, output, reduce, entry) for path, file, entry in files]
+        total = sum(nb_lines for _, _, nb_lines in measures)
+
+    written = 0  # Tokens written in previous shards and in the current one
+    shard_writer.new()
+    try:
+        for path, file, entry in files:
+            nb_chunks, nb_lines = 0, 0
+            for block, _, _ in _glue_file(path, file, output, reduce, entry=entry):
+                for sentence in block.split(b"\n\n")[:-1]:
+                    tokens = sentence.count(b"\n") + 1
+                    if shards:
+                        # The sentence goes to the next shard when most of it is after the end of the current one
+                        if len(shard_writer.index) < shards and \
+                                written + tokens / 2 > total * len(shard_writer.index) / shards:
+                            shard_writer.new()
+                    elif shard_writer.tokens and shard_writer.tokens + tokens > max_shard_tokens:
+                        shard_writer.new()
+                    shard_writer.write(sentence + b"\n\n", tokens)
+                    written += tokens
+                    nb_chunks += 1
+                    nb_lines += tokens
+            yield dataset_type, os.path.basename(file), nb_chunks, nb_lines
+
+        # Balanced datasets always have their number of shards, even if some are empty
+        while shards and len(shard_writer.index) < shards:
+            shard_writer.new()
+    finally:
+        shard_writer.close()
+    shard_writer.write_index()
+
+
+def _measure_glued(path: str, file: str, output: Output, reduce: Optional[float] = None,
+                   entry: Optional[Dict] = None) -> Tuple[int, int, int]:
+    """ Measure (in a worker process) FILE once concatenated
+
+    :return: Bytes, chunks and tokens of FILE in the concatenated file
+    """
+    size, nb_chunks, nb_lines = 0, 0, 0
+    for block, chunks, lines in _glue_file(path, file, output, reduce, entry=entry):
+        size += len(block)
+        nb_chunks += chunks
+        nb_lines += lines
+    return size, nb_chunks, nb_lines
+
+
+def _write_glued(path: str, file: str, output: Output, reduce: Optional[float], out: str, offset: int,
+                 entry: Optional[Dict] = None) -> None:
+    """ Write (in a worker process) FILE in the concatenated file OUT, from OFFSET"""
+    fd = os.open(out, os.O_WRONLY)
+    try:
+        for block, _, _ in _glue_file(path, file, output, reduce, entry=entry):
+            view = memoryview(block)
+            while view:
+                written = os.pwrite(fd, view, offset)
+                view = view[written:]
+                offset += written
+    finally:
+        os.close(fd)
+
+
+def _glue_file(path: str, file: str, output: Output, reduce: Optional[float] = None,
+               block_size: int = DEFAULT_COPY_SIZE, entry: Optional[Dict] = None) -> Iterator[Tuple[bytes, int, int]]:
+    """ Read the sentences of the output file at PATH as they are concatenated, by blocks of about BLOCK_SIZE bytes
+
+    :param entry: [Optional] Entry of the file in the manifest of the build, which gives its number of sentences
+    :yield: Block, chunks and tokens in the block
+    """
+    encoding = locale.getpreferredencoding(False)
+
+    # Sentences are streamed to the output: reducing needs their number first
+    max_int = None
+    if reduce and entry:
+        max_int = math.ceil(reduce * entry["sentences"])
+    elif reduce:# and dataset_type == "train":
+        with open(path) as f:
+            next(f, None)  # Output files necessarly have headers
+            max_int = math.ceil(reduce * count_sentences(f, output.column_marker)[0])
+
+    with open(path, "rb") as f:
+        header = f.readline().decode(encoding).strip()
+        # Files with the output header are copied by blocks, without parsing their lines
+        if header.split(output.column_marker) == output.header:
+            for block in _copy_sentences(f, max_int, block_size=block_size):
+                yield block, block.count(b"\n\n"), block.count(b"\n") - block.count(b"\n\n")
+            return
+
+    with open(path) as f:
+        block, nb_chunks, nb_lines = [], 0, 0
+        size = 0
+        for sentence in islice(_read_sentences(f, file, output), max_int):
+            block.append("\n".join(output.column_marker.join(sent) for sent in sentence)+"\n\n")  # 2 new lines
+            nb_chunks += 1
+            nb_lines += len(sentence)
+            size += len(block[-1])
+            if size >= block_size:
+                yield "".join(block).encode(encoding), nb_chunks, nb_lines
+                block, nb_chunks, nb_lines, size = [], 0, 0, 0
+        if block:
+            yield "".join(block).encode(encoding), nb_chunks, nb_lines
+
+
 ##################
 # Shared functions
 ##################
 
 
-def _preview(file: str, current_config: CorpusConfiguration) -> Tuple[List[str], int, int, int]:
+_BLANK_LINES = re.compile(rb"\n(?:[ \t\r\f\v]*\n)+")
+_LEADING_BLANK_LINES = re.compile(rb"(?:[ \t\r\f\v]*\n)*")
+_TRAILING_BLANK = re.compile(rb"(?:^|(?<=\n))[ \t\r\f\v]*$")
+
+
+def _copy_sentences(f: BinaryIO, max_int: Optional[int] = None,
+                    block_size: int = DEFAULT_COPY_SIZE) -> Iterator[bytes]:
+    """ Read F, an output file opened in binary mode after its header, by blocks of whole sentences, each followed
+    by a single blank line, and stop after MAX_INT sentences. Lines are otherwise kept as they are
+
+    >>> import io
+    >>> list(_copy_sentences(io.BytesIO(b"\\n a\\n\\n\\n  \\nb\\nc\\n\\nd\\n \\n"), block_size=4))
+    [b' a\\n\\n', b'b\\nc\\n\\n', b'd\\n\\n']
+    >>> list(_copy_sentences(io.BytesIO(b"a\\n\\nb\\n\\nc"), max_int=2))
+    [b'a\\n\\nb\\n\\n']
+    """
+    rest = b""
+    while max_int is None or max_int > 0:
+        block = f.read(block_size)
+        # REST always starts at the beginning of a sentence, blank lines before it are not kept
+        data = rest + block
+        data = _BLANK_LINES.sub(b"\n\n", data[_LEADING_BLANK_LINES.match(data).end():])
+
+        if block:
+            end = data.rfind(b"\n\n") + 2 if b"\n\n" in data else 0
+        else:  # End of file: the last sentence might miss its blank line
+            data = _TRAILING_BLANK.sub(b"", data, count=1)
+            if data and not data.endswith(b"\n\n"):
+                data += b"\n" if data.endswith(b"\n") else b"\n\n"
+            end = len(data)
+        chunk, rest = data[:end], data[end:]
+
+        if max_int is not None:
+            sentences = chunk.count(b"\n\n")
+            if sentences >= max_int:
+                end = -2
+                for _ in range(max_int):
+                    end = chunk.find(b"\n\n", end + 2)
+                chunk = chunk[:end + 2]
+            max_int -= min(sentences, max_int)
+
+        if chunk:
+            yield chunk
+        if not block:
+            break
+
+
+def _read_sentences(f: IO[str], file: str, output: Output) -> Iterator[List[List[str]]]:
+    """ Read the sentences of F, an output file, one at a time, with their columns in the order of the OUTPUT header
+    """
+    sentence = []
+    # Output files necessarly have headers and empty lines as markers
+    for line_numb, line in enumerate(f):
+        line = line.strip()
+        # If we met the header
+        if line_numb == 0:
+            cols = line.split(output.column_marker)
+            header_map = [cols.index(head) for head in output.header]
+            continue
+
+        # If we have a sentence
+        if not line and sentence:
+            yield sentence
+            sentence = []
+            continue
+
+        mapped = line.split(output.column_marker)
+        if not "".join(mapped).strip():
+            continue
+        try:
+            mapped = [mapped[index] for index in header_map]
+        except IndexError:
+            raise ValueError(f"Line {line_numb} failing in {file}: {mapped}")
+        sentence.append(mapped)
+
+    if sentence:
+        yield sentence
+
+
+class _MemoryRows:
+    """ Memory rows kept in memory by a worker until the main process writes them"""
+    def __init__(self):
+        self.rows: List[List[str]] = []
+
+    def writerow(self, row: List[str]) -> None:
+        self.rows.append(row)
+
+
+def _dispatch_group(
+        config: ProtogenieConfiguration, group: List[Tuple[str, str]], options: Dict[str, Any]
+) -> Tuple[List[Tuple[str, Dict[str, int], List[List[str]]]], Dict[str, Optional[Tuple[int, int]]]]:
+    """ Dispatch (in a worker process) files sharing the same output files, one after the other
+
+    :return: File, Dispatch stats about file, memory rows of the file, for each file, and the counts of the
+             output files (See OutputCounter.counts())
+    """
+    results = []
+    with WriterPool(counter=OutputCounter(config.output.column_marker)) as pool:
+        for file, unix_path in group:
+            memory = _MemoryRows()
+            for _, training_tokens in _single_file_dispatch(
+                    file, current_config=config.corpora[unix_path], memory=memory,
+                    config=config, pool=pool, **options):
+                results.append((file, training_tokens, memory.rows))
+    return results, pool.counter.counts()
+
+
+def _rebuild_group(
+        config: ProtogenieConfiguration, group: List[Tuple[str, _CorpusDispatched]], options: Dict[str, Any]
+) -> Tuple[List[Tuple[str, Dict[str, int], List[List[str]]]], Dict[str, Optional[Tuple[int, int]]]]:
+    """ Rebuild (in a worker process) files sharing the same output files from their ranges, one after the other
+
+    :return: File, Dispatch stats about file, no memory rows, for each file, and the counts of the output files
+    """
+    results = []
+    with WriterPool(counter=OutputCounter(config.output.column_marker)) as pool:
+        for file, dispatching in group:
+            for _, training_tokens in _single_file_from_memory(
+                    file, dispatching, config=config, pool=pool, **options):
+                results.append((file, training_tokens, []))
+    return results, pool.counter.counts()
+
+
+def _parallel_dispatch(
+        config: ProtogenieConfiguration, files: List[Tuple[str, Any]], jobs: int, options: Dict[str, Any],
+        worker: Callable[..., Tuple[List[Tuple[str, Dict[str, int], List[List[str]]]], Dict]] = _dispatch_group,
+        counter: Optional[OutputCounter] = None
+) -> Iterator[Tuple[str, Dict[str, int], List[List[str]]]]:
+    """ Dispatch FILES over a pool of JOBS processes, largest files first
+
+    Files that write to the same output files are dispatched by the same worker, in order. Each file comes with
+    what WORKER needs to dispatch it: the path of its corpus for _dispatch_group(), its ranges for _rebuild_group()
+    Counts of the output files written by workers are added to COUNTER.
+
+    :yield: File, Dispatch stats about file, memory rows of the file, in the order of FILES
+    """
+    groups: Dict[str, List[Tuple[str, Any]]] = {}
+    for file, item in files:
+        groups.setdefault(os.path.basename(file), []).append((file, item))
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            name: executor.submit(worker, config, group, options)
+            for name, group in sorted(
+                groups.items(),
+                key=lambda item: sum(os.path.getsize(file) for file, _ in item[1]),
+                reverse=True
+            )
+        }
+        results: Dict[str, Iterator[Tuple[str, Dict[str, int], List[List[str]]]]] = {}
+        for file, _ in files:
+            name = os.path.basename(file)
+            if name not in results:
+                group_results, counts = futures[name].result()
+                results[name] = iter(group_results)
+                if counter is not None:
+                    counter.update(counts)
+            yield next(results[name])
+
+
+def _partition_memory(memory_file: str, dispatcher: Dict[str, _CorpusDispatched], directory: str) -> None:
+    """ Read MEMORY_FILE once and write the ranges of each file of DISPATCHER to its own file in DIRECTORY,
+    so that they can be read along with their file without keeping the whole memory in RAM"""
+    for index, dispatching in enumerate(dispatcher.values()):
+        dispatching.memory = os.path.join(directory, f"{index}.tsv")
+
+    real_paths: Dict[str, Optional[str]] = {}
+    with WriterPool() as pool:
+        for line in read_memory(memory_file):
+            if not line:
+                continue
+            # Memories written before byte offsets were recorded only have the first three columns
+            current_file, line_range, dataset_target, *span = line
+
+            if current_file not in real_paths:
+                real_path = os.path.realpath(current_file)
+                real_paths[current_file] = real_path if real_path in dispatcher else None
+            real_path = real_paths[current_file]
+            if real_path is None:
+                continue
+
+            dispatching = dispatcher[real_path]
+            start, end = line_range.split("-")
+            dispatching.rows += 1
+            dispatching.ordered = dispatching.ordered and int(start) > dispatching.last_start
+            dispatching.last_start = int(start)
+            dispatching.offsets = dispatching.offsets and bool(span)
+            pool.write(dispatching.memory, "\t".join([start, end, dataset_target, *span]) + "\n")
+
+
+def _memory_ranges(dispatching: _CorpusDispatched) -> Iterator[Tuple[int, _Range]]:
+    """ Read back the ranges of DISPATCHING sorted by start line (See _partition_memory())
+
+    Memories written by dispatch are already sorted, so only hand-made ones are sorted here, one file at a time"""
+    if not dispatching.rows:
+        return
+
+    def parse(record: str) -> Tuple[int, _Range]:
+        start, end, dataset, *span = record.rstrip("\n").split("\t")
+        offset, length = tuple(map(int, span)) if span else (None, None)
+        return int(start), _Range(end=int(end), dataset=dataset, offset=offset, length=length)
+
+    with open(dispatching.memory) as f:
+        if dispatching.ordered:
+            yield from map(parse, f)
+        else:
+            # When a start is found twice, the last range wins
+            yield from sorted(dict(map(parse, f)).items())
+
+
+def _memory_units_by_lines(file: str, ranges: Iterator[Tuple[int, _Range]], current_config: CorpusConfiguration,
+                           reader: Reader) -> Iterator[Tuple[str, List[str]]]:
+    """ Read FILE line by line along with RANGES, sorted by start line, and yield the units, with their dataset"""
+    keep_empty_lines = isinstance(current_config.splitter, LineSplitter)
+    sentence = []
+    current_set: Optional[_Range] = None
+    upcoming = next(ranges, None)
+
+    with open(file) as f:
+        for line_no, line in enumerate(f):
+            if line_no == 0 and reader.has_header:
+                reader.set_header(line)
+                continue
+            elif not line.strip() and not keep_empty_lines:
+                continue
+
+            # Ranges starting on a line that is skipped are never dispatched
+            while upcoming is not None and upcoming[0] < line_no:
+                upcoming = next(ranges, None)
+
+            if upcoming is not None and upcoming[0] == line_no:  # We begin a set
+                current_set = upcoming[1]
+                upcoming = next(ranges, None)
+                sentence.append(line)
+            elif current_set and line_no != current_set.end:  # We are in the set
+                sentence.append(line)
+            elif current_set and line_no == current_set.end:  # We are at the end of the set
+                sentence.append(line)
+                yield current_set.dataset, [x for x in sentence if x.strip()]
+                sentence = []
+
+        # Finally, if there is something remaining
+        if len(sentence) and current_set:
+            yield current_set.dataset, sentence
+
+
+def _memory_units_by_offsets(file: str, ranges: Iterator[Tuple[int, _Range]],
+                             reader: Reader) -> Iterator[Tuple[str, List[str]]]:
+    """ Read the units of RANGES from FILE, going straight to their byte offset, and yield them
+    with their dataset"""
+    if reader.has_header:
+        for _, _, line in read_lines(file):
+            reader.set_header(line)
+            break
+
+    with open(file, "rb") as f:
+        for _, rng in ranges:
+            yield rng.dataset, [line for line in read_range(f, rng.offset, rng.length) if line.strip()]
+
+
+def _preview(file: str, current_config: CorpusConfiguration,
+             reader: Optional[Reader] = None) -> Tuple[List[str], int, int, int]:
     # We count things in the file
     unit_counts = 0
     empty_lines = 0
     header_line = []
-
-    if not current_config.reader.has_header:
-        header_line = current_config.reader.header
+    reader = reader or current_config.reader.copy()
+    state = current_config.splitter.new_state()
+
+    if not reader.has_header:
+        header_line = reader.header
+
+    # Units of these splitters only depend on the number of lines and of blank lines, which are counted
+    #  without reading lines one by one. Subclasses may change how units are found, they are not counted this way
+    splitter = current_config.splitter
+    if type(splitter) in (LineSplitter, TokenWindowSplitter, FileSplitter):
+        counts = count_lines(file, header=reader.has_header)
+        if counts is not None:
+            if reader.has_header:
+                header_line = reader.set_header(counts.header)
+            tokens = counts.lines - counts.blank_lines
+            if isinstance(splitter, LineSplitter):
+                unit_counts = counts.breaks
+            elif isinstance(splitter, TokenWindowSplitter):
+                unit_counts = tokens // splitter.window if splitter.window > 0 else 0
+            else:
+                unit_counts = tokens
+            return header_line, unit_counts, counts.blank_lines, tokens
 
     with open(file) as f:
         for line_no, line in enumerate(f):
             if line_no == 0:
-                if current_config.reader.has_header:
-                    header_line = current_config.reader.set_header(line)
+                if reader.has_header:
+                    header_line = reader.set_header(line)
                     continue
 
-            if line_no == 0 and current_config.reader.has_header:
+            if line_no == 0 and reader.has_header:
                 continue  # Skip the first line in count if we have a header
             try:
-                unit_counts += int(current_config.splitter(line, reader=current_config.reader))
+                unit_counts += int(current_config.splitter(line, reader=reader, state=state))
             except ColumnNotFound as E:
                 print(f"ERROR: Line {line_no} is badly formated, column not found error encountered. "
                       f"Text=`{line.strip()}`")
             empty_lines += int(not bool(line.strip()))  # Count only lines if they are empty
 
-    return header_line, unit_counts, empty_lines, line_no - int(current_config.reader.has_header) - empty_lines + 1
+    return header_line, unit_counts, empty_lines, line_no - int(reader.has_header) - empty_lines + 1
+
+
+def _read_units(file: str, current_config: CorpusConfiguration, reader: Reader, state: Any,
+                stats: Optional[Dict[str, int]] = None) -> Iterator[Tuple[str, List[str], bool, Tuple[int, int]]]:
+    """ Read FILE and yield each unit found by the splitter of CURRENT_CONFIG
+
+    :param file: File to read
+    :param current_config: Configuration of the corpus the file belongs to
+    :param reader: Reader of the file, its header is set when the file has one
+    :param state: State of the splitter for this file (See _SplitterPrototype.new_state())
+    :param stats: [Optional] Dictionary filled with the number of `lines` and `empty_lines` read
+    :yield: Line range ("start-end"), lines of the unit, whether the unit was closed by the splitter,
+            offset and length in bytes of the unit in FILE
+    """
+    keep_empty_lines = isinstance(current_config.splitter, LineSplitter)
+    empty_lines = 0
+    line_no = 0
+
+    sentence = []
+    blanks = 0
+    start, end = 0, 0  # Byte offsets of the current unit
+    for line_no, (offset, line_end, line) in enumerate(read_lines(file)):
+        if line_no == 0 and reader.has_header:
+            reader.set_header(line)
+            continue
+        elif not line.strip():
+            empty_lines += 1
+            if not keep_empty_lines:
+                # Only count is we already have written or the sentence writing has started
+                if len(sentence) > 0:
+                    blanks += 1
+                continue
+
+        try:
+            is_a_split = current_config.splitter(line, reader=reader, state=state)
+        except ColumnNotFound:
+            print(f"ERROR: Line {line_no} is badly formated, column not found error encountered. "
+                  f"Text=`{line.strip()}`")
+            continue
+
+        if not sentence:
+            start = offset
+        sentence.append(line)
+        end = line_end
+        if is_a_split:
+            yield "{}-{}".format(line_no - len(sentence) + 1 - blanks, line_no), \
+                  [x for x in sentence if x.strip()], True, (start, end - start)
+            blanks = 0
+            sentence = []
+
+    # Finally, if there is something remaining
+    if len(sentence):
+        yield "{}-{}".format(line_no - len(sentence) + 1 - blanks, line_no), sentence, False, (start, end - start)
+
+    if stats is not None:
+        stats["lines"] = line_no - int(reader.has_header) - empty_lines + 1
+        stats["empty_lines"] = empty_lines
+
+
+def _spill_units(file: str, current_config: CorpusConfiguration, reader: Reader,
+                 spill: IO[str]) -> Tuple[int, int, int]:
+    """ Read FILE once and spill its units into SPILL so that they can be dispatched once
+    the number of units is known.
+
+    :return: Number of units, number of empty lines, number of full lines
+    """
+    stats = {}
+    unit_counts = 0
+    state = current_config.splitter.new_state()
+    for line_range, sentence, complete, span in _read_units(file, current_config, reader, state, stats=stats):
+        spill.write("{}\t{}\t{}\t{}\t{}\n".format(line_range, int(complete), len(sentence), *span))
+        spill.write("".join(sentence))
+        unit_counts += int(complete)
+    return unit_counts, stats["empty_lines"], stats["lines"]
+
+
+def _replay_units(spill: IO[str]) -> Iterator[Tuple[str, List[str], bool, Tuple[int, int]]]:
+    """ Read back units written by _spill_units()"""
+    spill.seek(0)
+    while True:
+        record = spill.readline()
+        if not record:
+            break
+        line_range, complete, size, offset, length = record.split("\t")
+        yield line_range, [spill.readline() for _ in range(int(size))], complete == "1", (int(offset), int(length))
+
+
+def _single_file_from_memory(
+        file: str, dispatching: _CorpusDispatched, config: ProtogenieConfiguration, output_folder: str,
+        pool: WriterPool, inline_postprocessing: bool = False):
+    """ Rebuild the outputs of FILE from the ranges of DISPATCHING
+
+    :yield: File, Dispatch stats about file
+    """
+    # We set up a dictionary of token count to print nice
+    #  information later
+    training_tokens = {"test": 0, "dev": 0, "train": 0}
+
+    current_config = dispatching.config
+    reader = current_config.reader.copy()
+    inline = _inline_postprocessings(config, current_config, inline_postprocessing)
+    remaining = inline.remaining if inline else config.postprocessings
+    if remaining:
+        _count_when_rewritten(pool, output_folder, file, training_tokens)
+
+    header: Optional[str] = None
+    written_files = set()
+
+    if dispatching.offsets:
+        units = _memory_units_by_offsets(file, _memory_ranges(dispatching), reader)
+    else:
+        units = _memory_units_by_lines(file, _memory_ranges(dispatching), current_config, reader)
+
+    for dataset, sentence in units:
+        if header is None:  # The header is known once the first line has been read
+            header = _header(reader.header, current_config)
+        written_files.add(add_sentence(
+            output_folder=output_folder,
+            dataset=dataset,
+            filename=file,
+            sentence=sentence,
+            source_marker=current_config.column_marker,
+            output_marker=config.output.column_marker,
+            pool=pool,
+            header=header,
+            postprocessings=inline
+        ))
+        training_tokens[dataset] += len(sentence)
+
+    created_files = _close_outputs(
+        pool, output_folder=output_folder, file=file, training_tokens=training_tokens,
+        written_files=written_files, postprocessings=inline
+    )
+
+    yield file, training_tokens
+
+    if remaining:
+        apply_postprocessings(remaining, created_files, current_config, counter=pool.counter)
 
 
 def _single_file_dispatch(
         file: str, current_config: CorpusConfiguration,
         config: ProtogenieConfiguration, output_folder: str, dev_ratio: float, test_ratio: float,
-        verbose: bool = True, memory=None, no_split: bool = False
+        verbose: bool = True, memory=None, no_split: bool = False, single_pass: bool = False,
+        pool: Optional[WriterPool] = None, seed: Optional[int] = None,
+        hash_dispatch: Optional[str] = None, salt: str = "", inline_postprocessing: bool = False
 ):
-    # We do two passes here
+    # By default, we do two passes here
     #  1. The first one is used to collect informations about the file. In order to not keep data in memory,
     #     we iterate over it and count the number of real lines + the number of sentences.
     #     Sentences are counted on the base of the Configuration.split function
-    #  2. We read the file again and dispatch according to the ratio and the data we got before
-    #      Note : We use .pop(0) to move from start to end. If we have one day a performance issue
-    #      we might want to move to a yield system
+    #  2. We read the file again and dispatch according to the ratio and the data we got before.
+    #     Targets are drawn one unit at a time from the dispatcher
     #
     # This method is slower but allows for memory efficiency.
-
-    header_line, unit_counts, empty_lines, lines = _preview(file, current_config)
+    #
+    # With single_pass, the file is read only once: units are spilled to a temporary file (kept in memory
+    #  up to DEFAULT_SPILL_SIZE) and dispatched once their number is known. The FileSplitter needs
+    #  its targets to find its units, so it always uses two passes.
+    #
+    # With hash_dispatch, each unit's dataset is computed from the unit itself: no count is needed
+    #  and the file is read once. The FileSplitter cuts files in order and ignores it.
+    #
+    # With inline_postprocessing, post-processings are applied to units before they are written, up to
+    #  the first one which needs to scan whole output files.
+    single_pass = single_pass and not isinstance(current_config.splitter, FileSplitter)
+    hasher: Optional[_DispatcherHash] = None
+    if hash_dispatch and not no_split and not isinstance(current_config.splitter, FileSplitter):
+        hasher = _DispatcherHash(test_ratio=test_ratio, dev_ratio=dev_ratio, salt=salt, on=hash_dispatch)
+    spill: Optional[IO[str]] = None
+    unit_counts, empty_lines, lines = 0, 0, 0
+    # Each file gets its own reader, the configuration ones are shared by every file of the corpus
+    reader = current_config.reader.copy()
+
+    if hasher:
+        pass
+    elif not single_pass:
+        _, unit_counts, empty_lines, lines = _preview(file, current_config, reader=reader)
+    elif not no_split:
+        # Lines are only ended by line feeds in the spill: carriage returns kept inside lines stay there
+        spill = tempfile.SpooledTemporaryFile(
+            mode="w+", encoding="utf-8", newline="\n", max_size=DEFAULT_SPILL_SIZE
+        )
+        unit_counts, empty_lines, lines = _spill_units(file, current_config, reader, spill)
 
     if verbose:
         if no_split is True:
             print("Not splitting file {filename}".format(filename=file))
+        elif hasher:
+            print("Dispatching {unit_name} of {filename} by hash of their {on}".format(
+                filename=file, unit_name=current_config.unit_name, on=hasher.on
+            ))
         else:
             print("{unit_count} {unit_name} to dispatch in {filename} ({lines} full, {lines_empty} empty)".format(
                 filename=file, unit_name=current_config.unit_name, unit_count=unit_counts,
@@ -343,124 +1015,147 @@ def _single_file_dispatch(
         target_dataset = current_config.build_dataset_dispatch_list(
             units_count=unit_counts,
             test_ratio=test_ratio,
-            dev_ratio=dev_ratio
+            dev_ratio=dev_ratio,
+            seed=_file_seed(seed, file, config)
         )
 
         # We set up a dictionary of token count to print nice
         #  information later
         training_tokens = {"test": 0, "dev": 0, "train": 0}
     else:
+        target_dataset = iter(())
         training_tokens = {"output": 0}
 
-    # ToDo: When file splitter, the number of lines should be passed here probably ? Or is reset the issue ? ...
-
-    current_config.splitter.reset()
-    if not no_split:
-        current_config.splitter.set_targets(target_dataset)
-
-    created_files = set()
-
-    with open(file) as f:
-        sentence = []
-        blanks = 0
-        for line_no, line in enumerate(f):
-            if line_no == 0 and current_config.reader.has_header:
-                continue
-            elif not line.strip() and not isinstance(current_config.splitter, LineSplitter):
-                # Only count is we already have written or the sentence writing has started
-                if len(sentence) > 0:
-                    blanks += 1
-                continue
-
-            try:
-                is_a_split = current_config.splitter(line, reader=current_config.reader)
-            except ColumnNotFound:
-                print(f"ERROR: Line {line_no} is badly formated, column not found error encountered. "
-                      f"Text=`{line.strip()}`")
-                continue
-
-            sentence.append(line)
-            if is_a_split:
-                if no_split:
-                    dataset = "output"
-                else:
-                    dataset = target_dataset.pop(0)
-
-                if memory:
-                    memory.writerow([os.path.relpath(file),
-                                     "{}-{}".format(line_no - len(sentence) + 1 - blanks, line_no),
-                                     dataset])
-                    blanks = 0
-
-                sentence = [x for x in sentence if x.strip()]
-                add_sentence(
-                    output_folder=output_folder,
-                    dataset=dataset,
-                    filename=file,
-                    sentence=sentence,
-                    source_marker=current_config.column_marker,
-                    output_marker=config.output.column_marker,
-                    subfolder=not no_split
-                )
-                training_tokens[dataset] += len(sentence)
-                sentence = []
+    # The FileSplitter finds its units from the sizes carried by its targets
+    state = current_config.splitter.new_state(None if no_split else target_dataset)
+
+    written_files = set()
+    header: Optional[str] = None
+    if pool is None:
+        pool = WriterPool()
+    inline = _inline_postprocessings(config, current_config, inline_postprocessing)
+    remaining = inline.remaining if inline else config.postprocessings
+    if remaining:
+        _count_when_rewritten(pool, output_folder, file, training_tokens, subfolder=not no_split)
+
+    # Paths are computed once for the whole file rather than for each unit
+    memory_path = os.path.relpath(file)
+    hash_path = os.path.relpath(file, config.dir)
+
+    try:
+        if spill:
+            units = _replay_units(spill)
+        else:
+            units = _read_units(file, current_config, reader, state)
 
-        # Finally, if there is something remaining
-        if len(sentence):
-            try:
-                dataset = target_dataset.pop(0)
-                # print("last dataset ?")
-            except Exception:
-                if no_split:
-                    dataset = "output"
-                else:
-                    dataset = "train"
+        for index, (line_range, sentence, complete, (offset, length)) in enumerate(units):
+            if no_split:
+                dataset = "output"
+            elif hasher:
+                dataset = hasher(sentence, hash_path, index)
+            else:
+                dataset = next(target_dataset, "train")
 
             if memory:
-                memory.writerow([file, "{}-{}".format(line_no - len(sentence) + 1 - blanks, line_no), dataset])
+                memory.writerow([memory_path, line_range, dataset, offset, length])
+
+            if header is None:  # The header is known once the first line has been read
+                header = _header(reader.header, current_config)
 
-            add_sentence(
+            written_files.add(add_sentence(
                 output_folder=output_folder,
                 dataset=dataset,
                 filename=file,
                 sentence=sentence,
                 source_marker=current_config.column_marker,
                 output_marker=config.output.column_marker,
-                subfolder=not no_split
-            )
+                subfolder=not no_split,
+                pool=pool,
+                header=header,
+                postprocessings=inline
+            ))
             training_tokens[dataset] += len(sentence)
+    finally:
+        if spill:
+            spill.close()
 
-    created_files.update(
-        _add_header(
-            output_folder=output_folder, training_tokens=training_tokens, header_line=header_line,
-            current_config=current_config, file=file,
-            subfolder=not no_split
-        )
+    created_files = _close_outputs(
+        pool, output_folder=output_folder, file=file, training_tokens=training_tokens,
+        written_files=written_files, subfolder=not no_split, postprocessings=inline
     )
 
     yield file, training_tokens
 
-    if config.postprocessings:
-        for post_processings in config.postprocessings:
-            for output_file in created_files:
-                post_processings.apply(output_file, current_config)
+    if remaining:
+        if seed is not None:
+            # Post-processing randomness of a file does not depend on the files processed before it
+            random.seed(_file_seed(seed, file, config))
+        apply_postprocessings(remaining, created_files, current_config, counter=pool.counter)
+
+
+def _file_seed(seed: Optional[int], file: str, config: ProtogenieConfiguration) -> Optional[str]:
+    """ Derive the seed of FILE from the global SEED, so that the dispatch of a file does not depend
+    on the files processed before it"""
+    if seed is None:
+        return None
+    return "{}:{}".format(seed, os.path.relpath(file, config.dir))
+
+
+def _header(header_line: List[str], current_config: CorpusConfiguration) -> str:
+    return current_config.column_marker.join(header_line)+"\n"
+
+
+def _inline_postprocessings(config: ProtogenieConfiguration, current_config: CorpusConfiguration,
+                            inline_postprocessing: bool) -> Optional[InlinePostProcessings]:
+    if inline_postprocessing and config.postprocessings:
+        return InlinePostProcessings(config.postprocessings, current_config)
+    return None
+
+
+def _count_when_rewritten(pool: WriterPool, output_folder: str, file: str, datasets: Iterable[str],
+                          subfolder: bool = True) -> None:
+    """ Do not count the output files of FILE while units are written: post-processings rewrite them afterwards
+    and count them then"""
+    if pool.counter is not None:
+        for dataset in datasets:
+            pool.counter.discard(get_name(output_folder, dataset if subfolder else "", file))
 
 
-def _add_header(output_folder: str, file: str,
-                training_tokens: Dict[str, int], current_config: CorpusConfiguration,
-                header_line: List[str],
-                subfolder: bool = True
-                ) -> Set[str]:
+def _close_outputs(pool: WriterPool, output_folder: str, file: str,
+                   training_tokens: Dict[str, int], written_files: Set[str],
+                   subfolder: bool = True, postprocessings: Optional[InlinePostProcessings] = None) -> List[str]:
+    """ Flush and close the output files of FILE. Files that were written to but got no token are removed.
+
+    When POSTPROCESSINGS are applied inline, what they still hold is written before closing.
+
+    :return: Output files holding tokens, sorted so that post-processings draw random numbers for them
+             in the same order whatever the hash seed
+    """
     files = set()
     for dataset, tokens in training_tokens.items():
+        if subfolder:
+            trg = get_name(output_folder, dataset, file)
+        else:
+            trg = get_name(output_folder, "", file)
+        if postprocessings is not None:
+            remainder = postprocessings.close(trg)
+            if remainder:
+                pool.write(trg, remainder)
+        pool.close(trg)
         if tokens:
-            if subfolder:
-                trg = get_name(output_folder, dataset, file)
-            else:
-                trg = get_name(output_folder, "", file)
             files.add(trg)  # We add the file to the one we created
-            with open(trg) as f:
-                content = f.read()
-            with open(trg, "w") as f:
-                f.write(current_config.column_marker.join(header_line)+"\n"+content)
-    return files
+            continue
+        if trg in written_files:
+            os.remove(trg)
+        if pool.counter is not None:
+            pool.counter.remove(trg)
+    return sorted(files)
+
+
+def _add_outputs(outputs: Dict[str, List[str]], output_folder: str, file: str,
+                 training_tokens: Dict[str, int]) -> None:
+    """ Add the output files holding tokens of FILE to OUTPUTS, output files with the files they come from"""
+    for dataset, tokens in training_tokens.items():
+        if tokens:
+            trg = get_name(output_folder, "" if dataset == "output" else dataset, file)
+            outputs.setdefault(trg, []).append(os.path.relpath(file))
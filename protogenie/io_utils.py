@@ -1,30 +1,300 @@
-from typing import List
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, NamedTuple, Optional, TextIO, BinaryIO, IO, Set, Iterator, Tuple
+import codecs
+import io
+import locale
+import mmap
 import os
+import re
+import shutil
+import tempfile
+
+from .defaults import DEFAULT_COPY_SIZE, DEFAULT_WRITER_BUFFER_SIZE, DEFAULT_WRITER_MAX_OPEN
+if False:
+    from .postprocessing import InlinePostProcessings
+    from .manifest import OutputCounter
 
 
 def get_name(output_folder, dataset, filename):
     return os.path.join(output_folder, dataset, os.path.basename(filename))
 
 
+class WriterPool:
+    """ Keeps buffered handles open on output files, so that a file is opened once and not for every sentence.
+
+    At most `max_open` handles are kept open: when a new file is required, the least recently used one
+    is flushed and closed (it is reopened in append mode if it is written to again).
+
+    A header can be given with each write: it is written before the first content of a file, until the file
+    is closed with `close()`.
+
+    Everything that is written is also given to COUNTER, if any, which counts the sentences of each file.
+
+    >>> from tempfile import TemporaryDirectory
+    >>> with TemporaryDirectory() as directory:
+    ...     path = os.path.join(directory, "out.tsv")
+    ...     with WriterPool(max_open=1) as pool:
+    ...         pool.write(path, "a\\n", header="header\\n")
+    ...         pool.write(os.path.join(directory, "other.tsv"), "c\\n")  # Closes out.tsv
+    ...         pool.write(path, "b\\n", header="header\\n")
+    ...     print(open(path).read(), end="")
+    header
+    a
+    b
+    """
+    def __init__(self, buffer_size: int = DEFAULT_WRITER_BUFFER_SIZE, max_open: int = DEFAULT_WRITER_MAX_OPEN,
+                 counter: Optional["OutputCounter"] = None):
+        self.buffer_size: int = buffer_size
+        self.max_open: int = max_open
+        self.counter: Optional["OutputCounter"] = counter
+        self._handles: "OrderedDict[str, TextIO]" = OrderedDict()
+        self._started: Set[str] = set()
+
+    def write(self, path: str, content: str, header: Optional[str] = None) -> None:
+        """ Append CONTENT to the file at PATH, preceded by HEADER if nothing was written to it yet"""
+        handle = self._handles.get(path)
+        if handle is None:
+            while len(self._handles) >= self.max_open:
+                _, oldest = self._handles.popitem(last=False)
+                oldest.close()
+            handle = open(path, "a", buffering=self.buffer_size)
+            if self.counter is not None:
+                self.counter.open(path, handle.tell())
+            self._handles[path] = handle
+        else:
+            self._handles.move_to_end(path)
+        if path not in self._started:
+            self._started.add(path)
+            if header:
+                handle.write(header)
+                if self.counter is not None:
+                    self.counter.write(path, header)
+        handle.write(content)
+        if self.counter is not None:
+            self.counter.write(path, content)
+
+    def close(self, path: str) -> None:
+        """ Flush and close the handle of PATH if it is open"""
+        self._started.discard(path)
+        handle = self._handles.pop(path, None)
+        if handle is not None:
+            handle.close()
+
+    def close_all(self) -> None:
+        self._started.clear()
+        while self._handles:
+            _, handle = self._handles.popitem(last=False)
+            handle.close()
+
+    def __enter__(self) -> "WriterPool":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close_all()
+
+
+def _decode(raw: bytes, encoding: str) -> str:
+    """ Decode a RAW line the way a file opened in text mode would"""
+    line = raw.decode(encoding)
+    if line.endswith("\r\n"):
+        return line[:-2] + "\n"
+    return line
+
+
+def read_lines(path: str) -> Iterator[Tuple[int, int, str]]:
+    """ Read the lines of PATH as open(PATH) would, along with the byte offsets at which each line starts and ends
+
+    >>> from tempfile import TemporaryDirectory
+    >>> with TemporaryDirectory() as directory:
+    ...     path = os.path.join(directory, "in.tsv")
+    ...     _ = open(path, "wb").write("é\\r\\na\\n\\nb".encode(locale.getpreferredencoding(False)))
+    ...     print(list(read_lines(path)))
+    ...     with open(path, "rb") as f:
+    ...         print(read_range(f, 4, 3))
+    [(0, 4, 'é\\n'), (4, 6, 'a\\n'), (6, 7, '\\n'), (7, 8, 'b')]
+    ['a\\n', '\\n']
+    """
+    encoding = locale.getpreferredencoding(False)
+    offset = 0
+    with open(path, "rb") as f:
+        for raw in f:
+            yield offset, offset + len(raw), _decode(raw, encoding)
+            offset += len(raw)
+
+
+def read_range(handle: BinaryIO, offset: int, length: int) -> List[str]:
+    """ Read the lines found in LENGTH bytes from OFFSET in HANDLE, a file opened in binary mode
+    (See read_lines())"""
+    encoding = locale.getpreferredencoding(False)
+    handle.seek(offset)
+    return [_decode(raw, encoding) for raw in io.BytesIO(handle.read(length))]
+
+
+# Characters removed by str.strip(), except line feeds, in UTF-8
+_SPACES = rb"(?:[\t\x0b\x0c\r\x1c-\x1f ]|\xc2[\x85\xa0]|\xe1\x9a\x80|\xe2\x80[\x80-\x8a\xa8\xa9\xaf]|" \
+          rb"\xe2\x81\x9f|\xe3\x80\x80)*"
+_BLANK_LINE = re.compile(rb"\n" + _SPACES + rb"(?=\n)")  # Line feed followed by a blank line
+_FIRST_BLANK_LINE = re.compile(_SPACES + rb"\n")
+_LAST_BLANK_LINE = re.compile(_SPACES + rb"\Z")
+_EMPTY_LINE = re.compile(rb"\n(?=\r?\n)")  # Line feed followed by an empty line
+_EMPTY_LINES = re.compile(rb"\n(?=\r?\n\r?\n)")  # Line feed followed by two empty lines
+_FIRST_EMPTY_LINE = re.compile(rb"\r?\n")
+_LONE_CARRIAGE_RETURN = re.compile(rb"\r(?!\n)")
+
+
+class LineCounts(NamedTuple):
+    header: Optional[str]  # First line, when it is a header
+    lines: int  # Lines after the header
+    blank_lines: int  # Lines after the header which are empty once stripped
+    breaks: int  # Lines after the header which are "\n" and follow a line after the header which is not
+
+
+def count_lines(path: str, header: bool = False) -> Optional[LineCounts]:
+    """ Count the lines of PATH as open(PATH) would read them, with bytes.count() and regular expressions over a
+    memory map of the file instead of a loop over its lines. Only blank lines are visited one by one.
+
+    Files which cannot be counted this way give None: empty files, files with carriage returns which do not end
+    a line and files read with another encoding than UTF-8.
+
+    :param header: Whether the first line is a header, which is not counted
+
+    >>> from tempfile import TemporaryDirectory
+    >>> with TemporaryDirectory() as directory:
+    ...     path = os.path.join(directory, "in.tsv")
+    ...     _ = open(path, "wb").write(b"head\\n\\na\\n \\n\\nb\\r\\n\\r\\nc")
+    ...     counts = count_lines(path, header=True)
+    >>> counts if codecs.lookup(locale.getpreferredencoding(False)).name == "utf-8" else "Not UTF-8"
+    LineCounts(header='head\\n', lines=7, blank_lines=4, breaks=2)
+    """
+    if codecs.lookup(locale.getpreferredencoding(False)).name != "utf-8" or not os.path.getsize(path):
+        return None
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if _LONE_CARRIAGE_RETURN.search(mm):
+            return None
+
+        size = len(mm)
+        lines = sum(mm[block:block + DEFAULT_COPY_SIZE].count(b"\n") for block in range(0, size, DEFAULT_COPY_SIZE))
+        lines += mm[size - 1] != ord("\n")  # The last line has no line feed
+
+        start, first_line = 0, None
+        if header:
+            start = mm.find(b"\n") + 1 or size
+            first_line = _decode(mm[:start], "utf-8")
+            lines -= 1
+
+        blank_lines = sum(1 for _ in _BLANK_LINE.finditer(mm, max(start - 1, 0)))
+        if start == 0 and _FIRST_BLANK_LINE.match(mm):
+            blank_lines += 1
+        last_line = mm.rfind(b"\n") + 1
+        if last_line < size and last_line >= start and _LAST_BLANK_LINE.match(mm, last_line):
+            blank_lines += 1
+
+        # Empty lines end a unit when the line before them is not empty: these are the empty lines following a
+        #  line (but the first one, if it is empty) minus the empty lines following an empty line
+        first_empty = _FIRST_EMPTY_LINE.match(mm, start)
+        breaks = sum(1 for _ in _EMPTY_LINE.finditer(mm, first_empty.end() if first_empty else start)) - \
+            sum(1 for _ in _EMPTY_LINES.finditer(mm, start))
+
+    return LineCounts(header=first_line, lines=lines, blank_lines=blank_lines, breaks=breaks)
+
+
+@contextmanager
+def replace_file(path: str, like: Optional[str] = None, binary: bool = False) -> Iterator[IO]:
+    """ Open a temporary file, in the directory of PATH, which replaces PATH once the block is exited.
+    If the block fails, PATH is left untouched.
+
+    The new file gets the permissions of LIKE, or of PATH by default.
+
+    >>> from tempfile import TemporaryDirectory
+    >>> with TemporaryDirectory() as directory:
+    ...     path = os.path.join(directory, "out.tsv")
+    ...     _ = open(path, "w").write("before\\n")
+    ...     with replace_file(path) as f:
+    ...         _ = f.write("after\\n")
+    ...     print(open(path).read(), end="")
+    ...     print(os.listdir(directory))
+    after
+    ['out.tsv']
+    """
+    temp = tempfile.NamedTemporaryFile(
+        mode="wb" if binary else "w", dir=os.path.dirname(os.path.abspath(path)),
+        prefix="." + os.path.basename(path) + ".", suffix=".tmp", delete=False
+    )
+    try:
+        with temp:
+            yield temp
+        shutil.copymode(like or path, temp.name)
+        os.replace(temp.name, path)
+    except BaseException:
+        if os.path.exists(temp.name):
+            os.remove(temp.name)
+        raise
+
+
+@contextmanager
+def append_file(path: str, binary: bool = False) -> Iterator[IO]:
+    """ Open a temporary file whose content is appended to PATH once the block is exited.
+    If the block fails, PATH is left untouched.
+
+    >>> from tempfile import TemporaryDirectory
+    >>> with TemporaryDirectory() as directory:
+    ...     path = os.path.join(directory, "memory.csv")
+    ...     _ = open(path, "w").write("a\\n")
+    ...     with append_file(path) as f:
+    ...         _ = f.write("b\\n")
+    ...     print(open(path).read(), end="")
+    a
+    b
+    """
+    with tempfile.TemporaryFile(mode="w+b" if binary else "w+") as temp:
+        yield temp
+        temp.seek(0)
+        size = os.path.getsize(path)
+        try:
+            with open(path, "ab" if binary else "a") as f:
+                shutil.copyfileobj(temp, f)
+        except BaseException:
+            os.truncate(path, size)
+            raise
+
+
 def add_sentence(
         output_folder: str, dataset: str, filename: str,
         sentence: List[str], source_marker: str, output_marker: str,
-        subfolder: bool = True):
+        subfolder: bool = True, pool: Optional[WriterPool] = None, header: Optional[str] = None,
+        postprocessings: Optional["InlinePostProcessings"] = None) -> str:
     """ Write a sentence in the given dataset
 
     :param output_folder:
     :param dataset:
     :param filename:
     :param sentence:
-    :return:
+    :param pool: [Optional] Pool of opened files to write with. If none is given, the file is opened
+                 and closed for this sentence only
+    :param header: [Optional] Header line written first when the output file is created
+    :param postprocessings: [Optional] Post-processings applied to the sentence before it is written
+    :return: Path of the output file
     """
     if subfolder:
         filename = get_name(output_folder, dataset, filename)
     else:
         filename = get_name(output_folder, "", filename)
+
+    content = "".join([s.replace(source_marker, output_marker) for s in sentence])+"\n"  # Add a secondary line break to keep things separated
+    if postprocessings is not None:
+        content = postprocessings.write(filename, content, header=header)
+        header = None
+    if pool is not None:
+        pool.write(filename, content, header=header)
+        return filename
+
     if not os.path.isfile(filename):
         mode = "w"
+        content = (header or "") + content
     else:
         mode = "a"
     with open(filename, mode) as f:
-        f.write("".join([s.replace(source_marker, output_marker) for s in sentence])+"\n")  # Add a secondary line break to keep things separated
+        f.write(content)
+    return filename
@@ -0,0 +1,216 @@
+""" Manifest of a build: the sentences, tokens, bytes and checksum of each output file, with the files it comes from.
+
+It is written as `manifest.json` in the output folder by `build` and `rebuild`, and read by `concat`, so that
+output files do not have to be counted again. Sentences, tokens and checksums are computed while files are
+written (See OutputCounter). An entry is only used while its file has not changed (See manifest_entry()).
+"""
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import hashlib
+import json
+import locale
+import os
+
+from .defaults import DEFAULT_COPY_SIZE
+
+
+__all__ = ["MANIFEST", "count_sentences", "OutputCounter", "write_manifest", "load_manifest", "manifest_entry"]
+
+
+MANIFEST = "manifest.json"
+
+
+def _count_lines(lines: Iterable[str], column_marker: str, in_sentence: bool = False) -> Tuple[int, int, bool]:
+    """ Count the sentences ended in LINES and their tokens
+
+    :return: Sentences, tokens and whether the last sentence is still open
+    """
+    sentences, tokens = 0, 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            sentences += in_sentence
+            in_sentence = False
+        elif not line.startswith(column_marker) or line.replace(column_marker, "").strip():
+            tokens += 1
+            in_sentence = True
+    return sentences, tokens, in_sentence
+
+
+def count_sentences(lines: Iterable[str], column_marker: str) -> Tuple[int, int]:
+    """ Count the sentences and tokens of the LINES of an output file, after its header, as concat reads them
+
+    >>> count_sentences(iter(["a\\tb\\n", "c\\td\\n", "\\n", "\\t\\n", "e\\tf\\n"]), "\\t")
+    (2, 3)
+    """
+    sentences, tokens, in_sentence = _count_lines(lines, column_marker)
+    return sentences + in_sentence, tokens
+
+
+def _written(lines: Iterator[str], write: Callable[[str], Any], counts: "_FileCount") -> Iterator[str]:
+    """ Write each of LINES with WRITE, and add it to the checksum of COUNTS, as it is read"""
+    written = []
+    for line in lines:
+        write(line)
+        written.append(line)
+        if len(written) == 1024:  # Lines are added to the checksum by batches, which is faster
+            counts.update("".join(written))
+            written.clear()
+        yield line
+    counts.update("".join(written))
+
+
+class _FileCount:
+    """ Counts of an output file being written, and checksum of its content"""
+    __slots__ = ("sentences", "tokens", "in_sentence", "header", "sha256", "checksum")
+
+    def __init__(self, sentences: int = 0, tokens: int = 0, header: bool = False, checksum: Optional[str] = None):
+        self.sentences: int = sentences
+        self.tokens: int = tokens
+        self.in_sentence: bool = False  # Whether the last sentence is still open
+        self.header: bool = header  # Whether the header was written
+        # Checksum of a file counted by another counter, which is not written anymore
+        self.checksum: Optional[str] = checksum
+        self.sha256 = hashlib.sha256()
+
+    def update(self, content: str) -> None:
+        """ Add CONTENT, as written in a file opened in text mode, to the checksum"""
+        if os.linesep != "\n":
+            content = content.replace("\n", os.linesep)
+        self.sha256.update(content.encode(locale.getpreferredencoding(False)))
+
+    def result(self) -> Tuple[int, int, str]:
+        return self.sentences + self.in_sentence, self.tokens, self.checksum or self.sha256.hexdigest()
+
+
+class OutputCounter:
+    """ Counts the sentences and tokens of output files while they are written, the way count_sentences() counts
+    them once the files are closed, and computes the sha256 of their content, so that files are not read again
+    to describe them.
+
+    The first line written to a file is its header. Files rewritten through `rewrite()` are counted from their new
+    lines, files changed in another way, or which held content before they were counted, have no counts.
+
+    >>> counter = OutputCounter("\\t")
+    >>> counter.write("out.tsv", "form\\tlemma\\n")
+    >>> counter.write("out.tsv", "a\\tb\\nc\\td\\n\\n")
+    >>> counter.write("out.tsv", "e\\tf\\n")
+    >>> counter.counts()["out.tsv"][:2]
+    (2, 3)
+    >>> written = []
+    >>> counter.rewrite("out.tsv", ["form\\tlemma\\n", "a\\tb\\n"], write=written.append)
+    >>> written
+    ['form\\tlemma\\n', 'a\\tb\\n']
+    >>> counter.counts()["out.tsv"] == (1, 1, hashlib.sha256("".join(written).encode()).hexdigest())
+    True
+    >>> counter.discard("out.tsv")
+    >>> counter.counts()
+    {'out.tsv': None}
+    """
+    def __init__(self, column_marker: str):
+        self.column_marker: str = column_marker
+        self._counts: Dict[str, Optional[_FileCount]] = {}
+
+    def open(self, path: str, size: int) -> None:
+        """ Note that the file at PATH is opened for writing while it holds SIZE bytes"""
+        if size and path not in self._counts:
+            self._counts[path] = None
+
+    def write(self, path: str, content: str) -> None:
+        """ Count CONTENT, complete lines written at the end of the file at PATH"""
+        counts = self._counts.get(path, False)
+        if counts is False:
+            counts = self._counts[path] = _FileCount()
+        if counts is None:
+            return
+        counts.update(content)
+        lines = content.split("\n")[:-1]
+        if lines and not counts.header:
+            counts.header = True
+            lines = lines[1:]
+        sentences, tokens, counts.in_sentence = _count_lines(lines, self.column_marker, counts.in_sentence)
+        counts.sentences += sentences
+        counts.tokens += tokens
+
+    def rewrite(self, path: str, lines: Iterable[str], write: Callable[[str], Any]) -> None:
+        """ Write LINES, complete lines which replace the content of the file at PATH, with WRITE and count them"""
+        self._counts[path] = None  # Until every line is written
+        counts = _FileCount()
+        lines = iter(lines)
+        header = next(lines, None)
+        if header is not None:
+            write(header)
+            counts.update(header)
+            counts.header = True
+        counts.sentences, counts.tokens, counts.in_sentence = _count_lines(
+            _written(lines, write, counts), self.column_marker
+        )
+        self._counts[path] = counts
+
+    def discard(self, path: str) -> None:
+        """ Forget the counts of the file at PATH, which was changed without being counted"""
+        self._counts[path] = None
+
+    def remove(self, path: str) -> None:
+        """ Forget the file at PATH, which was removed"""
+        self._counts.pop(path, None)
+
+    def counts(self) -> Dict[str, Optional[Tuple[int, int, str]]]:
+        """ Get the sentences, tokens and sha256 of each file, None for discarded files"""
+        return {
+            path: None if counts is None else counts.result()
+            for path, counts in self._counts.items()
+        }
+
+    def update(self, counts: Dict[str, Optional[Tuple[int, int, str]]]) -> None:
+        """ Add COUNTS of files written by another counter, such as the one of a worker process (See counts()).
+        Files written by both counters are discarded"""
+        for path, added in counts.items():
+            if path in self._counts or added is None:
+                self._counts[path] = None
+            else:
+                self._counts[path] = _FileCount(added[0], added[1], header=True, checksum=added[2])
+
+
+def file_checksum(path: str, block_size: int = DEFAULT_COPY_SIZE) -> str:
+    """ Compute the sha256 of the content of the file at PATH"""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def load_manifest(output_folder: str) -> Dict[str, Dict]:
+    """ Get the entries of the manifest of OUTPUT_FOLDER, by path of output file relative to it"""
+    try:
+        with open(os.path.join(output_folder, MANIFEST)) as f:
+            return json.load(f)["files"]
+    except (FileNotFoundError, ValueError, KeyError):
+        return {}
+
+
+def manifest_entry(manifest: Dict[str, Dict], output_folder: str, path: str) -> Optional[Dict]:
+    """ Get the entry of the output file at PATH in MANIFEST, if it was counted and its content did not change
+    since, which its sha256 tells"""
+    entry = manifest.get(os.path.relpath(path, output_folder))
+    if entry is not None and "sentences" in entry and "sha256" in entry and os.path.isfile(path) \
+            and entry["bytes"] == os.path.getsize(path) and entry["sha256"] == file_checksum(path):
+        return entry
+    return None
+
+
+def write_manifest(output_folder: str, outputs: Dict[str, List[str]],
+                   counts: Dict[str, Optional[Tuple[int, int, str]]]) -> None:
+    """ Describe OUTPUTS, output files with the source files they come from, in the manifest of OUTPUT_FOLDER.
+    Sentences, tokens and sha256 are taken from COUNTS (See OutputCounter.counts()): files without counts only
+    get their dataset, sources and size. Entries of other output files are kept"""
+    manifest = load_manifest(output_folder)
+    for path, sources in sorted(outputs.items()):
+        if os.path.isfile(path):
+            dataset = os.path.dirname(os.path.relpath(path, output_folder))
+            entry = {"dataset": dataset or "output", "sources": sorted(set(sources)), "bytes": os.path.getsize(path)}
+            if counts.get(path) is not None:
+                entry["sentences"], entry["tokens"], entry["sha256"] = counts[path]
+            manifest[os.path.relpath(path, output_folder)] = entry
+    with open(os.path.join(output_folder, MANIFEST), "w") as f:
+        json.dump({"files": manifest}, f, indent=2, sort_keys=True)
@@ -0,0 +1,267 @@
+""" Reading and writing of memory files, which record the dataset each chunk of each file was dispatched to.
+
+Memories are written as CSV, one row `file,start-end,dataset,offset,length` per chunk, unless their path ends
+with `.mem`, `.mem.gz` or `.mem.xz`. They are then written in a compact binary format, compressed with gzip or xz
+for the last two:
+
+- each segment starts with `MAGIC`, and a file can hold several segments (one per append)
+- a file is recorded once, the first time it has a chunk: byte 0, length of its path and its path in UTF-8.
+  Files are then referred to by their position in the segment
+- a chunk is recorded as one byte for its dataset (+128 when it has a byte offset) followed by varints: file,
+  start (from the end of the previous chunk of the file), end (from start) and, when there is one, offset
+  (from the end of the previous chunk of the file) and length
+
+>>> import os
+>>> from tempfile import TemporaryDirectory
+>>> rows = [["a.tsv", "1-3", "train", "10", "20"], ["b.tsv", "1-2", "dev"], ["a.tsv", "4-6", "test", "30", "15"]]
+>>> with TemporaryDirectory() as directory:
+...     path = os.path.join(directory, "memory.mem.gz")
+...     with open(path, "wb") as f:
+...         with closing(memory_writer(f, format_from_path(path))) as writer:
+...             writer.writerows(rows)
+...     print(format_from_content(path), list(read_memory(path)) == rows)
+mem.gz True
+"""
+from contextlib import closing, contextmanager
+from itertools import islice
+from typing import BinaryIO, Dict, IO, Iterator, List, Optional, Sequence, Tuple, Union
+import csv
+import gzip
+import lzma
+import shutil
+
+from .io_utils import append_file, replace_file
+
+
+__all__ = ["MAGIC", "format_from_path", "format_from_content", "read_memory", "memory_writer", "update_memory",
+           "convert_memory"]
+
+
+MAGIC = b"PGMEM\x01"
+DATASETS = ["train", "dev", "test", "output"]
+_FILE = 0
+_OFFSET = 128
+_GZIP_MAGIC = b"\x1f\x8b"
+_XZ_MAGIC = b"\xfd7zXZ\x00"
+_BLOCK_SIZE = 1024 * 1024
+
+
+def format_from_path(path: str) -> str:
+    """ Format of a memory written at PATH, from its extension: `csv`, `mem`, `mem.gz` or `mem.xz`"""
+    for memory_format in ("mem.gz", "mem.xz", "mem"):
+        if path.endswith("." + memory_format):
+            return memory_format
+    return "csv"
+
+
+def format_from_content(path: str) -> str:
+    """ Format of the memory at PATH, from its first bytes (See format_from_path() for empty files)"""
+    with open(path, "rb") as f:
+        start = f.read(len(MAGIC))
+    if not start:
+        return format_from_path(path)
+    elif start.startswith(_GZIP_MAGIC):
+        return "mem.gz"
+    elif start.startswith(_XZ_MAGIC):
+        return "mem.xz"
+    elif start == MAGIC:
+        return "mem"
+    return "csv"
+
+
+def is_binary(memory_format: str) -> bool:
+    """ Whether memories of MEMORY_FORMAT are opened in binary mode"""
+    return memory_format != "csv"
+
+
+def _varint(value: int, buffer: bytearray) -> None:
+    while value > 127:
+        buffer.append((value & 127) | 128)
+        value >>= 7
+    buffer.append(value)
+
+
+def _signed_varint(value: int, buffer: bytearray) -> None:
+    _varint(value * 2 if value >= 0 else -value * 2 - 1, buffer)
+
+
+def _read_varint(stream: Iterator[int]) -> int:
+    value, shift = 0, 0
+    for byte in stream:
+        value |= (byte & 127) << shift
+        if byte < 128:
+            return value
+        shift += 7
+    raise ValueError("Memory file is truncated")
+
+
+def _read_bytes(stream: Iterator[int], size: int) -> bytes:
+    data = bytes(islice(stream, size))
+    if len(data) != size:
+        raise ValueError("Memory file is truncated")
+    return data
+
+
+def _read_signed_varint(stream: Iterator[int]) -> int:
+    value = _read_varint(stream)
+    return value // 2 if value % 2 == 0 else -(value + 1) // 2
+
+
+class CSVMemoryWriter:
+    """ Writes memory rows to HANDLE, a file opened in text mode, as CSV"""
+    def __init__(self, handle: IO[str]):
+        self._writer = csv.writer(handle)
+
+    def writerow(self, row: Sequence[Union[str, int]]) -> None:
+        self._writer.writerow(row)
+
+    def writerows(self, rows: Iterator[Sequence[Union[str, int]]]) -> None:
+        self._writer.writerows(rows)
+
+    def close(self) -> None:
+        """ Nothing to finish, HANDLE is left open"""
+
+
+class CompactMemoryWriter:
+    """ Writes memory rows to HANDLE, a file opened in binary mode, in the compact format of MEMORY_FORMAT
+
+    Rows are the same as the ones of CSV memories, so that both writers can be used in place of each other"""
+    def __init__(self, handle: BinaryIO, memory_format: str = "mem"):
+        self._handle: BinaryIO = handle
+        self._format: str = memory_format
+        self._stream: Optional[IO[bytes]] = None  # Opened with the first row, so that no row means no segment
+        self._files: Dict[str, int] = {}
+        self._last: Dict[int, Tuple[int, int]] = {}  # End line and end byte of the last chunk of each file
+
+    def _open(self) -> IO[bytes]:
+        if self._format == "mem.gz":
+            self._stream = gzip.GzipFile(fileobj=self._handle, mode="wb", filename="", mtime=0)
+        elif self._format == "mem.xz":
+            self._stream = lzma.LZMAFile(self._handle, mode="wb")
+        else:
+            self._stream = self._handle
+        self._stream.write(MAGIC)
+        return self._stream
+
+    def writerow(self, row: Sequence[Union[str, int]]) -> None:
+        path, line_range, dataset, *span = row
+        buffer = bytearray()
+        file = self._files.get(path)
+        if file is None:
+            file = self._files[path] = len(self._files)
+            encoded = path.encode("utf-8")
+            buffer.append(_FILE)
+            _varint(len(encoded), buffer)
+            buffer.extend(encoded)
+
+        start, end = map(int, line_range.split("-"))
+        last_end, last_offset = self._last.get(file, (0, 0))
+        buffer.append(DATASETS.index(dataset) + 1 + (_OFFSET if span else 0))
+        _varint(file, buffer)
+        _signed_varint(start - last_end, buffer)
+        _signed_varint(end - start, buffer)
+        if span:
+            offset, length = map(int, span)
+            _signed_varint(offset - last_offset, buffer)
+            _varint(length, buffer)
+            last_offset = offset + length
+        self._last[file] = (end, last_offset)
+        (self._stream or self._open()).write(buffer)
+
+    def writerows(self, rows: Iterator[Sequence[Union[str, int]]]) -> None:
+        for row in rows:
+            self.writerow(row)
+
+    def close(self) -> None:
+        """ Finish the compressed stream, if any. HANDLE is left open"""
+        if self._stream is not None and self._stream is not self._handle:
+            self._stream.close()
+
+
+def memory_writer(handle: IO, memory_format: str) -> Union[CSVMemoryWriter, CompactMemoryWriter]:
+    """ Get a writer of memory rows to HANDLE in MEMORY_FORMAT, to be closed once every row is written.
+    HANDLE is opened in binary mode when is_binary(MEMORY_FORMAT)"""
+    if is_binary(memory_format):
+        return CompactMemoryWriter(handle, memory_format)
+    return CSVMemoryWriter(handle)
+
+
+def _bytes(handle: BinaryIO) -> Iterator[int]:
+    for block in iter(lambda: handle.read(_BLOCK_SIZE), b""):
+        yield from block
+
+
+def _read_compact(handle: BinaryIO) -> Iterator[List[str]]:
+    stream = _bytes(handle)
+    files: List[str] = []
+    last: Dict[int, Tuple[int, int]] = {}
+    for code in stream:
+        if code == MAGIC[0]:  # A new segment starts
+            if _read_bytes(stream, len(MAGIC) - 1) != MAGIC[1:]:
+                raise ValueError("Memory file is corrupted")
+            files, last = [], {}
+        elif code == _FILE:
+            files.append(_read_bytes(stream, _read_varint(stream)).decode("utf-8"))
+        else:
+            file = _read_varint(stream)
+            last_end, last_offset = last.get(file, (0, 0))
+            start = last_end + _read_signed_varint(stream)
+            end = start + _read_signed_varint(stream)
+            row = [files[file], f"{start}-{end}", DATASETS[(code & ~_OFFSET) - 1]]
+            if code & _OFFSET:
+                offset = last_offset + _read_signed_varint(stream)
+                length = _read_varint(stream)
+                last_offset = offset + length
+                row.extend([str(offset), str(length)])
+            last[file] = (end, last_offset)
+            yield row
+
+
+def read_memory(path: str) -> Iterator[List[str]]:
+    """ Read the rows of the memory at PATH, whatever its format, as csv.reader would read a CSV memory"""
+    memory_format = format_from_content(path)
+    if memory_format == "csv":
+        with open(path) as f:
+            yield from csv.reader(f)
+    elif memory_format == "mem.gz":
+        with gzip.open(path, "rb") as f:
+            yield from _read_compact(f)
+    elif memory_format == "mem.xz":
+        with lzma.open(path, "rb") as f:
+            yield from _read_compact(f)
+    else:
+        with open(path, "rb") as f:
+            yield from _read_compact(f)
+
+
+@contextmanager
+def update_memory(path: str, new_path: Optional[str] = None) -> Iterator[Union[CSVMemoryWriter, CompactMemoryWriter]]:
+    """ Yield a writer of rows which are appended to the memory at PATH once the block is exited or, with NEW_PATH,
+    written after the rows of PATH to NEW_PATH, in the format of its extension. If the block fails, nothing
+    is written"""
+    memory_format = format_from_content(path)
+    if new_path is None:
+        with append_file(path, binary=is_binary(memory_format)) as f:
+            with closing(memory_writer(f, memory_format)) as writer:
+                yield writer
+        return
+
+    new_format = format_from_path(new_path)
+    with replace_file(new_path, like=path, binary=is_binary(new_format)) as f:
+        if new_format == memory_format:  # New rows simply follow the old ones, in a new segment for compact memories
+            with open(path, "rb" if is_binary(memory_format) else "r") as previous:
+                shutil.copyfileobj(previous, f)
+        else:
+            with closing(memory_writer(f, new_format)) as writer:
+                writer.writerows(row for row in read_memory(path) if row)
+        with closing(memory_writer(f, new_format)) as writer:
+            yield writer
+
+
+def convert_memory(source: str, destination: str, memory_format: Optional[str] = None) -> None:
+    """ Write the rows of the memory at SOURCE to DESTINATION in MEMORY_FORMAT, given by the extension of
+    DESTINATION by default"""
+    memory_format = memory_format or format_from_path(destination)
+    with open(destination, "wb" if is_binary(memory_format) else "w") as f:
+        with closing(memory_writer(f, memory_format)) as writer:
+            writer.writerows(row for row in read_memory(source) if row)
@@ -1,35 +1,152 @@
-import tempfile
-import math
+import copy
 import random
 from abc import ABC, abstractmethod
-from collections import namedtuple
 from xml.etree.ElementTree import Element
-import csv
-from typing import List, ClassVar, Tuple, Dict, Optional, TYPE_CHECKING, Union, TextIO, Iterable
+from typing import (
+    List, ClassVar, Tuple, Dict, Optional, TYPE_CHECKING, Union, TextIO, Iterable, Iterator, NamedTuple, Any
+)
+from dataclasses import dataclass, field
 
 import regex as re
 
 if TYPE_CHECKING:
     from .configs import CorpusConfiguration
+    from .manifest import OutputCounter
 from .sentence_matchers import SentenceMatcherProto, SentenceRegexpMatcher
+from .io_utils import replace_file
 Numeric = Union[int, float]
+Row = Optional[List[str]]  # Values of a line of an output file, None for a blank line
 
 
-def adhoc_reader(file: TextIO, delimiter: str) -> Iterable[List[str]]:
-    for line in file.readlines():
-        line = line.strip()
-        if line:
-            yield line.split(delimiter)
+class _Columns:
+    """ Positions of the columns of a header, computed once per file, so that the values of a row are addressed
+    by index instead of going through a dict built for each line
+
+    Rows are read the way dict(zip(header, row)) would read them: a row whose length is not the one of the header,
+    or whose header repeats a column, is first brought to the values of this dict (See regular())
+
+    >>> columns = _Columns(["form", "lemma", "form"])
+    >>> columns.regular(["a", "b", "c"]), columns["lemma"]
+    (['c', 'b'], 1)
+    """
+    __slots__ = ("header", "positions", "_size")
+
+    def __init__(self, header: List[str]):
+        self.header: List[str] = header
+        self.positions: Dict[str, int] = {column: pos for pos, column in enumerate(dict.fromkeys(header))}
+        # Rows of this size are already the values of dict(zip(header, row))
+        self._size: int = len(header) if len(self.positions) == len(header) else -1
+
+    def __getitem__(self, column: str) -> int:
+        return self.positions[column]
+
+    def regular(self, row: List[str]) -> List[str]:
+        """ Values of ROW, one per column of the header, in its order"""
+        if len(row) == self._size:
+            return row
+        return list(dict(zip(self.header, row)).values())
+
+    def set(self, row: List[str], column: str, value: str) -> None:
+        """ Set the VALUE of COLUMN in ROW, a regular row. A column missing from ROW is added at its end"""
+        pos = self.positions.get(column)
+        if pos is not None and pos < len(row):
+            row[pos] = value
         else:
-            yield None
+            row.append(value)
+
+
+@dataclass
+class _LineState:
+    """ State of a post-processing while it modifies one file"""
+    file_path: str
+    line_no: int = 0  # Number of lines received so far
+    header: List[str] = field(default_factory=list)
+    columns: _Columns = field(default_factory=lambda: _Columns([]))
+
+    def set_header(self, header: List[str]) -> None:
+        self.header = header
+        self.columns = _Columns(header)
+
+
+def _split(line: str, delimiter: str) -> Row:
+    """ Split a LINE of an output file in its values, None for a blank line"""
+    line = line.strip()
+    if line:
+        return line.split(delimiter)
+    return None
+
+
+def _join(row: Row, delimiter: str) -> str:
+    """ Write a ROW back as a line"""
+    if row is None:
+        return "\n"
+    return delimiter.join(row) + "\n"
 
 
 class PostProcessing(ABC):
+    """ Post-processings modify output files once they are written.
+
+    They are applied line by line: the lines of a file are split once in rows (See Row) which are given one by one
+    to `modify_row()`, which returns the rows to write in their stead, and `close()` returns what is left at the end
+    of the file. Rows go from one post-processing to the next one without being written back, so that a chain of
+    post-processings reads, splits, joins and writes each line once (See apply_postprocessings()).
+
+    Rules that need statistics over the whole file before modifying it set RequiresScan: their `scan()` receives
+    every row of the file, as modified by the rules preceding them, before the first call to `modify_row()`.
+    """
     NodeName = "XML-NODE-LOCAL-NAME"  # Name of the node to match
+    RequiresScan: ClassVar[bool] = False
 
-    @abstractmethod
     def apply(self, file_path: str, config: "CorpusConfiguration"):
-        raise NotImplementedError
+        apply_postprocessings([self], [file_path], config)
+
+    @property
+    def streamable(self) -> bool:
+        """ Post-processings which override apply() are applied on their own, with their apply()"""
+        return type(self).apply is PostProcessing.apply
+
+    def new_state(self, file_path: str, config: "CorpusConfiguration") -> _LineState:
+        """ Create the state of the post-processing for modifying FILE_PATH
+        """
+        return _LineState(file_path=file_path)
+
+    def scan(self, rows: Iterable[Row], state: _LineState, config: "CorpusConfiguration") -> None:
+        """ Read the ROWS of the file before it is modified, when RequiresScan is True
+        """
+        pass
+
+    def modify_row(self, row: Row, state: _LineState, config: "CorpusConfiguration") -> List[Row]:
+        """ Modify the next ROW of the file
+
+        :returns: Rows to write in place of ROW
+        """
+        nb_line, state.line_no = state.line_no, state.line_no + 1
+        if row is None:
+            self._modify_line(state.header, None, state.file_path, config, state=state)
+            return [row]
+
+        if nb_line == 0:
+            state.set_header(row)
+            return [row]
+
+        return [self._modify_line(state.header, row, file_path=state.file_path, config=config, state=state)]
+
+    def modify(self, line: str, state: _LineState, config: "CorpusConfiguration") -> List[str]:
+        """ Modify the next LINE of the file (See modify_row())
+
+        :returns: Lines to write in place of LINE
+        """
+        return [
+            _join(row, config.column_marker)
+            for row in self.modify_row(_split(line, config.column_marker), state, config)
+        ]
+
+    def close(self, state: _LineState, config: "CorpusConfiguration") -> List[Row]:
+        """ End the file
+
+        :returns: Rows that still need to be written
+        """
+        return []
 
     @abstractmethod
     def from_xml(cls, node: Element) -> ClassVar["PostProcessing"]:
@@ -42,7 +159,11 @@ class PostProcessing(ABC):
         return node.tag == cls.NodeName
 
     def _modify_line(self, header: List[str], values: Optional[List[str]],
-                     file_path: str, config: "CorpusConfiguration"):
+                     file_path: str, config: "CorpusConfiguration", state: Any = None) -> Optional[List[str]]:
+        """ Modify the VALUES of a line, None for a blank line
+
+        :returns: Values to write, one per column of the header
+        """
         raise NotImplementedError
 
     def _stop_chunk(self, line: Optional[Dict[str, str]]) -> bool:
@@ -51,63 +172,125 @@ class PostProcessing(ABC):
     def _chunk_modify_routine(self, file_path: str, config: "CorpusConfiguration"):
         raise NotImplementedError
 
-    def _scan_chunks(self,
-                     file_path: str, config: "CorpusConfiguration",
-                     sentence_matcher: Optional[SentenceMatcherProto]) -> Tuple[int, int]:
-        """ Analyzes the FILE for the number of chunks
+    @staticmethod
+    def _count_chunks(rows: Iterable[Row], config: "CorpusConfiguration",
+                      sentence_matcher: Optional[SentenceMatcherProto]) -> Tuple[int, int]:
+        """ Count the chunks and the tokens in ROWS
 
         """
         chunks = 0
         tokens = 0
-        with open(file_path) as file:
-            for nb_line, line in enumerate(file):
-                vals = line.strip().split(config.column_marker)
-
-                if nb_line == 0:
-                    header = vals
-                    continue
-
-                if len(header) == len(vals):
-                    tokens += 1
-                    if sentence_matcher and sentence_matcher.match(header, vals):
-                        chunks += 1
-                elif sentence_matcher:
-                    chunks += sentence_matcher.match(header, None)
+        header = []
+        columns = _Columns(header)
+        for nb_line, vals in enumerate(rows):
+            if nb_line == 0:
+                header = vals
+                columns = _Columns(header)
+                continue
+
+            if vals is not None and len(header) == len(vals):
+                tokens += 1
+                if sentence_matcher and sentence_matcher.match(header, vals, columns):
+                    chunks += 1
+            elif sentence_matcher:
+                chunks += sentence_matcher.match(header, None)
 
         return chunks, tokens
 
-    def _single_line_modify_routine(self, file_path: str, config: "CorpusConfiguration"):
-        header: List[str] = []
-        temp = tempfile.TemporaryFile(mode="w+")  # 2
 
-        try:
-            with open(file_path) as file:
-                for nb_line, line in enumerate(file):
+def _feed(rows: Iterable[Row], chain: List[PostProcessing], states: List[_LineState],
+          config: "CorpusConfiguration") -> Iterator[Row]:
+    """ Pass ROWS through each post-processing of CHAIN, in order"""
+    for row in rows:
+        outputs = [row]
+        for postprocessing, state in zip(chain, states):
+            outputs = [out for output in outputs for out in postprocessing.modify_row(output, state, config)]
+            if not outputs:
+                break
+        yield from outputs
+
+
+def _close(chain: List[PostProcessing], states: List[_LineState], config: "CorpusConfiguration") -> Iterator[Row]:
+    """ End the file for each post-processing of CHAIN"""
+    # What a post-processing writes at the end of the file is still read by the following ones
+    for index, (postprocessing, state) in enumerate(zip(chain, states)):
+        outputs = postprocessing.close(state, config)
+        for following, following_state in zip(chain[index+1:], states[index+1:]):
+            outputs = [out for output in outputs for out in following.modify_row(output, following_state, config)]
+        yield from outputs
+
+
+def _run_chain(rows: Iterable[Row], chain: List[PostProcessing], states: List[_LineState],
+               config: "CorpusConfiguration") -> Iterator[Row]:
+    """ Pass the ROWS of a whole file through each post-processing of CHAIN, in order"""
+    yield from _feed(rows, chain, states, config)
+    yield from _close(chain, states, config)
+
+
+def _read_rows(file: TextIO, config: "CorpusConfiguration") -> Iterator[Row]:
+    """ Split each line of FILE once"""
+    for line in file:
+        yield _split(line, config.column_marker)
+
+
+def _apply_chain(chain: List[PostProcessing], files: List[str], config: "CorpusConfiguration",
+                 counter: Optional["OutputCounter"] = None):
+    """ Apply the streamable post-processings of CHAIN to FILES, reading and writing each file once"""
+    states: Dict[str, List[_LineState]] = {file_path: [] for file_path in files}
+
+    # States are prepared in the order in which separate applications would have prepared them
+    #  so that random draws stay the same
+    for index, postprocessing in enumerate(chain):
+        for file_path in files:
+            state = postprocessing.new_state(file_path, config)
+            if postprocessing.RequiresScan:
+                with open(file_path) as file:
+                    postprocessing.scan(
+                        _run_chain(_read_rows(file, config), chain[:index], copy.deepcopy(states[file_path]), config),
+                        state, config
+                    )
+            states[file_path].append(state)
 
-                    if not line.strip():
-                        temp.write(line)
-                        self._modify_line(header, None, file_path, config)
-                        continue
+    for file_path in files:
+        with replace_file(file_path) as temp:
+            with open(file_path) as file:
+                lines = (
+                    _join(row, config.column_marker)
+                    for row in _run_chain(_read_rows(file, config), chain, states[file_path], config)
+                )
+                if counter is None:
+                    temp.writelines(lines)
+                else:
+                    counter.rewrite(file_path, lines, temp.write)
 
-                    vals = line.strip().split(config.column_marker)
 
-                    if nb_line == 0:
-                        header = vals
-                        temp.write(line)
-                        continue
+def apply_postprocessings(postprocessings: List[PostProcessing], files: Iterable[str],
+                          config: "CorpusConfiguration", counter: Optional["OutputCounter"] = None):
+    """ Apply each post-processing to each file
 
-                    modified = self._modify_line(header, vals, file_path=file_path, config=config)
-                    temp.write(
-                        config.column_marker.join(
-                            [modified[head] for head in header]
-                        ) + "\n"
-                    )
+    The result is the same as applying each post-processing to every file, one after the other, but consecutive
+    streamable post-processings are fused: each file is read and written once for all of them.
 
-            with open(file_path, "w") as f:
-                temp.seek(0)
-                f.write(temp.read())
-        finally:
-            temp.close()  # 5
+    :param postprocessings: Post-processings to apply, in order
+    :param files: Files to modify
+    :param config: Configuration of the corpus the files come from
+    :param counter: [Optional] Counter of the sentences of the files, which counts them again as they are rewritten
+    """
+    files = list(files)
+    chain: List[PostProcessing] = []
+    for postprocessing in postprocessings:
+        if postprocessing.streamable:
+            chain.append(postprocessing)
+            continue
+        if chain:
+            _apply_chain(chain, files, config, counter=counter)
+            chain = []
+        for file_path in files:
+            postprocessing.apply(file_path, config)
+            if counter is not None:
+                counter.discard(file_path)
+    if chain:
+        _apply_chain(chain, files, config, counter=counter)
 
 
 class ApplyTo:
@@ -136,43 +319,31 @@ class Disambiguation(PostProcessing):
         self.default_value: str = default_value
         self.glue: str = glue
 
-    def apply(self, file_path: str, config: "CorpusConfiguration"):
-        temp = tempfile.TemporaryFile(mode="w+")  # 2
+    def modify_row(self, line: Row, state: _LineState, config: "CorpusConfiguration") -> List[Row]:
+        nb_line, state.line_no = state.line_no, state.line_no + 1
+        if nb_line == 0:
+            state.set_header(line)
+            return [line + [self.disambiguation_key]]
+        elif not line:
+            return [None]
+        columns = state.columns
+        line = columns.regular(line)
 
         try:
-            with open(file_path) as file:
-                csv_reader = adhoc_reader(file, delimiter=config.column_marker)
-                header: List[str] = []
-                for nb_line, line in enumerate(csv_reader):  # The file should already have been open
-                    if nb_line == 0:
-                        temp.write(config.column_marker.join(line + [self.disambiguation_key]) + "\n")
-                        header = line
-                        continue
-                    elif not line:
-                        temp.write("\n")
-                        continue
-                    lines = dict(zip(header, line))
-
-                    try:
-                        found = self.match_pattern.findall(lines[self.lemma_key])
-                    except KeyError:
-                        print(lines, nb_line)
-                        raise
-
-                    if found:
-                        lines[self.disambiguation_key] = found[0]
-                        if not isinstance(found[0], str):
-                            lines[self.disambiguation_key] = self.glue.join(found[0])
-                        if not self.keep:  # If we do not keep the original value, we remove it
-                            lines[self.lemma_key] = self.match_pattern.sub("", lines[self.lemma_key])
-                    else:
-                        lines[self.disambiguation_key] = self.default_value
-                    temp.write(config.column_marker.join(list(lines.values())) + "\n")
-            with open(file_path, "w") as f:
-                temp.seek(0)
-                f.write(temp.read())
-        finally:
-            temp.close()  # 5
+            lemma = columns[self.lemma_key]
+            found = self.match_pattern.findall(line[lemma])
+        except (KeyError, IndexError):
+            print(line, nb_line)
+            raise
+
+        if found:
+            columns.set(line, self.disambiguation_key,
+                        found[0] if isinstance(found[0], str) else self.glue.join(found[0]))
+            if not self.keep:  # If we do not keep the original value, we remove it
+                line[lemma] = self.match_pattern.sub("", line[lemma])
+        else:
+            columns.set(line, self.disambiguation_key, self.default_value)
+        return [line]
 
     @classmethod
     def from_xml(cls, node: Element) -> "Disambiguation":
@@ -200,40 +371,30 @@ class ReplacementSet(PostProcessing):
         self.replacement_pattern: str = replacement_pattern
         self.applies_to: List[ApplyTo] = applies_to
 
-    def apply(self, file_path: str, config: "CorpusConfiguration"):
-        temp = tempfile.TemporaryFile(mode="w+")
-        try:
-            with open(file_path) as file:
-                csv_reader = adhoc_reader(file, delimiter=config.column_marker)
-                header: List[str] = []
-                for nb_line, line in enumerate(csv_reader):  # The file should already have been open
-                    if nb_line == 0:
-                        temp.write(config.column_marker.join(line) + "\n")
-                        header = line
-                        continue
-                    elif not line:
-                        temp.write("\n")
-                        continue
-                    lines = dict(zip(header, line))
-
-                    for apply_to in self.applies_to:
-                        if self.match_pattern.search(lines[apply_to.source]):
-                            for target in apply_to.target:
-                                # If source and target are the same, we simply replace source by target
-                                if apply_to.source == target:
-                                    lines[apply_to.source] = self.match_pattern.sub(
-                                        self.replacement_pattern,
-                                        lines[apply_to.source]
-                                    )
-                                else:  # Otherwise, we just set the target value using this value
-                                    lines[target] = self.replacement_pattern
-
-                    temp.write(config.column_marker.join(list(lines.values())) + "\n")
-            with open(file_path, "w") as f:
-                temp.seek(0)
-                f.write(temp.read())
-        finally:
-            temp.close()  # 5
+    def modify_row(self, line: Row, state: _LineState, config: "CorpusConfiguration") -> List[Row]:
+        nb_line, state.line_no = state.line_no, state.line_no + 1
+        if nb_line == 0:
+            state.set_header(line)
+            return [line]
+        elif not line:
+            return [None]
+        columns = state.columns
+        line = columns.regular(line)
+
+        for apply_to in self.applies_to:
+            source = columns[apply_to.source]
+            if self.match_pattern.search(line[source]):
+                for target in apply_to.target:
+                    # If source and target are the same, we simply replace source by target
+                    if apply_to.source == target:
+                        line[source] = self.match_pattern.sub(
+                            self.replacement_pattern,
+                            line[source]
+                        )
+                    else:  # Otherwise, we just set the target value using this value
+                        columns.set(line, target, self.replacement_pattern)
+
+        return [line]
 
     @classmethod
     def from_xml(cls, node: Element) -> "ReplacementSet":
@@ -256,35 +417,21 @@ class Skip(PostProcessing):
         self.match_pattern: re.Regex = re.compile(match_pattern)
         self.source: str = source
 
-    def apply(self, file_path: str, config: "CorpusConfiguration"):
-        temp = tempfile.TemporaryFile(mode="w+")  # 2
+    def modify_row(self, line: Row, state: _LineState, config: "CorpusConfiguration") -> List[Row]:
+        nb_line, state.line_no = state.line_no, state.line_no + 1
+        if nb_line == 0:
+            state.set_header(line)
+            return [line]
+        elif not line:
+            return [None]
 
-        try:
-            with open(file_path) as file:
-                csv_reader = adhoc_reader(file, delimiter=config.column_marker)
-                header: List[str] = []
-                for nb_line, line in enumerate(csv_reader):  # The file should already have been open
-                    if nb_line == 0:
-                        temp.write(config.column_marker.join(line) + "\n")
-                        header = line
-                        continue
-                    elif not line:
-                        temp.write("\n")
-                        continue
-
-                    lines = dict(zip(header, line))
-
-                    # If it matches, we skip it
-                    if self.match_pattern.search(lines[self.source]):
-                        continue
-
-                    temp.write(config.column_marker.join(list(lines.values())) + "\n")
-
-            with open(file_path, "w") as f:
-                temp.seek(0)
-                f.write(temp.read())
-        finally:
-            temp.close()  # 5
+        line = state.columns.regular(line)
+
+        # If it matches, we skip it
+        if self.match_pattern.search(line[state.columns[self.source]]):
+            return []
+
+        return [line]
 
     @classmethod
     def from_xml(cls, node: Element) -> "Skip":
@@ -294,12 +441,21 @@ class Skip(PostProcessing):
         )
 
 
+@dataclass
+class _CliticState(_LineState):
+    sequence: List[List[str]] = field(default_factory=list)  # Lines of the current sequence
+    # [Int = Line to apply modifications to, Dict[Column position, Tuple[Glue, Value]]]
+    modifications: List[Tuple[int, Dict[int, Tuple[str, str]]]] = field(default_factory=list)
+
+
 class Clitic(PostProcessing):
     """ If the matchPattern matches target column, the line is removed from the post-processed output
     """
     NodeName = "clitic"
 
-    Transfer = namedtuple("Transfer", ["col", "glue"])
+    class Transfer(NamedTuple):
+        col: str
+        glue: str
 
     def __init__(
             self, match_pattern: str, source: str, glue: str, transfers: List[Tuple[str, bool]]
@@ -315,57 +471,42 @@ class Clitic(PostProcessing):
             if not print(key, has_glue)
         ]
 
-    def apply(self, file_path: str, config: "CorpusConfiguration"):
-        temp = tempfile.TemporaryFile(mode="w+")  # 2
-        default = ("", "")
-        try:
-            with open(file_path) as file:
-                csv_reader = adhoc_reader(file, delimiter=config.column_marker)
-                header: List[str] = []
-                sequence = []
-                # [Int = Line to apply modifications to, Dict[Column name, Tuple[Glue, Value]]]
-                modifications: List[Tuple[int, Dict[str, Tuple[str, str]]]] = []
-                for nb_line, line in enumerate(csv_reader):  # The file should already have been open
-                    if nb_line == 0:
-                        temp.write(config.column_marker.join(line) + "\n")
-                        header = line
-                        continue
-                    elif not line:
-                        for target_line, modif in modifications:
-                            sequence[target_line] = {
-                                column: modif.get(column, default)[0].join(
-                                    [value, modif.get(column, default)[1]]
-                                )
-                                for column, value in sequence[target_line].items()
-                            }
-                        temp.write("\n".join([
-                            config.column_marker.join(list(l.values()))
-                            for l in sequence
-                        ]) + "\n")
-                        sequence = []
-                        modifications = []
-                        continue
-
-                    lines = dict(zip(header, line))
-
-                    # If it matches, we give it to the previous / original line
-                    if self.match_pattern.match(lines[self.source]):
-                        modifications.append(
-                            (
-                                len(sequence) - 1 - len(modifications),
-                                {key: (keep, lines[key]) for (key, keep) in self.transfers}
-                            )
-                        )
-                        continue
-
-                    # config.column_marker.join(list(lines.values()))
-                    sequence.append(lines)
+    def new_state(self, file_path: str, config: "CorpusConfiguration") -> "_CliticState":
+        return _CliticState(file_path=file_path)
+
+    def modify_row(self, line: Row, state: "_CliticState", config: "CorpusConfiguration") -> List[Row]:
+        nb_line, state.line_no = state.line_no, state.line_no + 1
+        if nb_line == 0:
+            state.set_header(line)
+            return [line]
+        elif not line:
+            sequence = state.sequence
+            for target_line, modif in state.modifications:
+                target = sequence[target_line]
+                for pos, (glue, value) in modif.items():
+                    if pos < len(target):
+                        target[pos] = glue.join([target[pos], value])
+            state.sequence = []
+            state.modifications = []
+            if not sequence:
+                return [None]
+            return sequence
+
+        columns = state.columns
+        line = columns.regular(line)
+
+        # If it matches, we give it to the previous / original line
+        if self.match_pattern.match(line[columns[self.source]]):
+            state.modifications.append(
+                (
+                    len(state.sequence) - 1 - len(state.modifications),
+                    {columns[key]: (keep, line[columns[key]]) for (key, keep) in self.transfers}
+                )
+            )
+            return []
 
-            with open(file_path, "w") as f:
-                temp.seek(0)
-                f.write(temp.read())
-        finally:
-            temp.close()  # 5
+        state.sequence.append(line)
+        return []
 
     @classmethod
     def from_xml(cls, node: Element) -> "Clitic":
@@ -383,10 +524,18 @@ class Clitic(PostProcessing):
         )
 
 
+@dataclass
+class _CapitalizeState(_LineState):
+    chunks: List[bool] = field(default_factory=list)  # For each chunk, whether its first word is capitalized
+    tokens: List[bool] = field(default_factory=list)  # For each token, whether it is capitalized
+    first_word: bool = True  # True = next word is a first word
+
+
 class Capitalize(PostProcessing):
     """ Applies capitalization strategies to content
     """
     NodeName = "capitalize"
+    RequiresScan = True
     Marker: str = "🨁"  # NEUTRAL CHESS QUEEN
     RE_Upper: re.Regex = re.compile("(\p{Lu})")
 
@@ -403,11 +552,6 @@ class Capitalize(PostProcessing):
         self.column_lemma: Optional[str] = column_lemma
         self.apply_unicode_marker: bool = apply_unicode_marker
         self.sentence_matcher: Optional[SentenceMatcherProto] = sentence_matcher
-        self.first_word_state: bool = True  # Variable representing the current status
-        # (True = next word is a first word)
-
-        self._files_chunks: Dict[str, List[bool]] = {}
-        self._files_tokens: Dict[str, List[bool]] = {}
 
     @staticmethod
     def parse_when(value: str, ratio: Optional[str]) -> Numeric:
@@ -433,32 +577,35 @@ class Capitalize(PostProcessing):
         return 0, None
 
     def _modify_line(self, header: List[str], values: Optional[List[str]],
-                     file_path: str, config: "CorpusConfiguration") -> Dict[str, str]:
-        if self.first_word and self.sentence_matcher.match(header, values):
-            self.first_word_state = True
+                     file_path: str, config: "CorpusConfiguration",
+                     state: _CapitalizeState = None) -> Optional[List[str]]:
+        if self.first_word and self.sentence_matcher.match(header, values, state.columns):
+            state.first_word = True
             if values:
-                return dict(zip(header, values))
+                return state.columns.regular(values)
 
         if not values or len(header) != len(values):
-            return {}
+            return values
 
-        line = dict(zip(header, values))
+        line = state.columns.regular(values)
+        token = state.columns[self.column_token]
 
         # Sentence starts
-        if self.first_word > .0 and self.first_word_state and self._files_chunks[file_path].pop():
-            line[self.column_token] = line[self.column_token].capitalize()
+        if self.first_word > .0 and state.first_word and state.chunks.pop():
+            line[token] = line[token].capitalize()
             # Need to pop tokens as well
             if self.first_letters:
-                self._files_tokens[file_path].pop()
-        elif self.first_letters > .0 and self._files_tokens[file_path].pop():
-            line[self.column_token] = line[self.column_token].capitalize()
+                state.tokens.pop()
+        elif self.first_letters > .0 and state.tokens.pop():
+            line[token] = line[token].capitalize()
 
         if self.apply_unicode_marker:
-            line[self.column_token] = self.RE_Upper.sub(self._replace_caps, line[self.column_token])
+            line[token] = self.RE_Upper.sub(self._replace_caps, line[token])
             if self.column_lemma:
-                line[self.column_lemma] = self.RE_Upper.sub(self._replace_caps, line[self.column_lemma])
+                lemma = state.columns[self.column_lemma]
+                line[lemma] = self.RE_Upper.sub(self._replace_caps, line[lemma])
 
-        self.first_word_state = False
+        state.first_word = False
         return line
 
     def _replace_caps(self, value):
@@ -477,17 +624,18 @@ class Capitalize(PostProcessing):
             random.shuffle(out)
             return out
 
-    def apply(self, file_path: str, config: "CorpusConfiguration"):
+    def new_state(self, file_path: str, config: "CorpusConfiguration") -> _CapitalizeState:
+        return _CapitalizeState(file_path=file_path)
+
+    def scan(self, rows: Iterable[Row], state: _CapitalizeState, config: "CorpusConfiguration") -> None:
         # We scan the files
-        chunks, tokens = self._scan_chunks(file_path, config, sentence_matcher=self.sentence_matcher)
+        chunks, tokens = self._count_chunks(rows, config, sentence_matcher=self.sentence_matcher)
 
         # We store the dispatch of booleans
         if self.first_word > .0:
-            self._files_chunks[file_path] = self._transform_to_bool_list(chunks, self.first_word)
+            state.chunks = self._transform_to_bool_list(chunks, self.first_word)
         if self.first_letters > .0:
-            self._files_tokens[file_path] = self._transform_to_bool_list(tokens, self.first_letters)
-
-        self._single_line_modify_routine(file_path=file_path, config=config)
+            state.tokens = self._transform_to_bool_list(tokens, self.first_letters)
 
     @classmethod
     def from_xml(cls, node: Element) -> "Capitalize":
@@ -511,3 +659,61 @@ class Capitalize(PostProcessing):
             column_token=node.attrib["column-token"],
             column_lemma=node.attrib.get("column-lemma")
         )
+
+
+class InlinePostProcessings:
+    """ Applies post-processings to the content of output files before it is written, so that files are not read
+    and rewritten afterwards.
+
+    Post-processings run inline up to the first one which needs a scan of the whole file (RequiresScan) or which
+    is not streamable: this one and the following ones are kept in `remaining`, to be applied to the files once
+    they are written (See apply_postprocessings()).
+
+    >>> from protogenie.configs import CorpusConfiguration
+    >>> config = CorpusConfiguration(splitter="empty_line", column_marker="\\t", reader=None)
+    >>> inline = InlinePostProcessings([Skip(match_pattern="^x$", source="form")], config)
+    >>> inline.write("out.tsv", "x\\tX\\ny\\tY\\n\\n", header="form\\tlemma\\n")
+    'form\\tlemma\\ny\\tY\\n\\n'
+    >>> inline.close("out.tsv")
+    ''
+    """
+    def __init__(self, postprocessings: List[PostProcessing], config: "CorpusConfiguration"):
+        self.config: "CorpusConfiguration" = config
+        inline = 0
+        while inline < len(postprocessings) and postprocessings[inline].streamable \
+                and not postprocessings[inline].RequiresScan:
+            inline += 1
+        self.chain: List[PostProcessing] = postprocessings[:inline]
+        self.remaining: List[PostProcessing] = postprocessings[inline:]
+        self._states: Dict[str, List[_LineState]] = {}
+
+    def write(self, file_path: str, content: str, header: Optional[str] = None) -> str:
+        """ Post-process CONTENT, which is about to be written to FILE_PATH
+
+        :param file_path: Output file
+        :param content: Complete lines to write
+        :param header: Header of the file, post-processed before the first CONTENT of the file
+        :returns: Text to write instead of CONTENT (and HEADER)
+        """
+        states = self._states.get(file_path)
+        if states is None:
+            states = self._states[file_path] = [
+                postprocessing.new_state(file_path, self.config)
+                for postprocessing in self.chain
+            ]
+            content = (header or "") + content
+        # Post-processings read rows the way they would read them from the written file
+        rows = [_split(line, self.config.column_marker) for line in content.split("\n")[:-1]]
+        marker = self.config.column_marker
+        return "".join([_join(row, marker) for row in _feed(rows, self.chain, states, self.config)])
+
+    def close(self, file_path: str) -> str:
+        """ End FILE_PATH
+
+        :returns: Text that is still to be written at the end of the file
+        """
+        states = self._states.pop(file_path, None)
+        if states is None:
+            return ""
+        marker = self.config.column_marker
+        return "".join([_join(row, marker) for row in _close(self.chain, states, self.config)])
@@ -1,10 +1,11 @@
-from typing import List, Tuple, Dict, Union, Optional
+from operator import itemgetter
+from typing import Callable, List, Tuple, Dict, Union, Optional
 from xml.etree.ElementTree import Element
 
 
 class ColumnNotFound(Exception):
     def __init__(self, msg):
-        super(ColumnNotFound, self).__init__()
+        super(ColumnNotFound, self).__init__(msg)
         self.msg = msg
 
     def __repr__(self):
@@ -22,8 +23,9 @@ class Reader(object):
         self.column_marker: str = column_marker
         self.reader_type: str = reader_type
         self._header: List[str] = []
-
-        self._reverse_map = {}
+        # Accessor and position of each column of the header, compiled whenever the header is set
+        self._accessors: Dict[str, Callable[[List[str]], str]] = {}
+        self._positions: Dict[str, int] = {}
 
         if self.reader_type == "order":
             self.map_to = {int(key): mapped for key, mapped in keys if mapped}
@@ -31,22 +33,45 @@ class Reader(object):
                 self.map_to.get(item, "UNK"+str(item))
                 for item in range(max(self.map_to.keys())+1)
             ]
+            self._compile()
         elif self.reader_type == "explicit":
             self.map_to = {key: mapped or key for key, mapped in keys}
 
-    def get_column(self, line: List[str], column: str, raise_on_none: bool = False) -> str:
-        """ Given a list of tokens, chez if we have it in our header"""
-        if column in self._reverse_map:
-            if self._reverse_map[column] in line:
-                return line[self._reverse_map[column]]
-
-        for pos, (value, key) in enumerate(zip(line, self.header)):
-            if key == column:
-                self._reverse_map[column] = pos
-                return value
+    def _compile(self) -> None:
+        """ Compile an accessor for each column of the header, the first one for columns found twice"""
+        self._accessors, self._positions = {}, {}
+        for pos, column in enumerate(self._header):
+            if column not in self._accessors:
+                self._accessors[column] = itemgetter(pos)
+                self._positions[column] = pos
+
+    def get_column(self, line: List[str], column: str, raise_on_none: bool = False) -> Optional[str]:
+        """ Given a list of tokens, get the value of COLUMN, None if it is not in the header or if LINE is too short
+
+        :raise ColumnNotFound: When the value is None and RAISE_ON_NONE is True
+
+        >>> reader = Reader(reader_type="order", keys=[("0", "token"), ("1", "lemma")])
+        >>> reader.get_column(["a", "b"], "lemma")
+        'b'
+        >>> reader.get_column(["a"], "lemma", raise_on_none=True)
+        Traceback (most recent call last):
+         ...
+        protogenie.reader.ColumnNotFound: Column `lemma` is column 2 but Line=`a` has 1 column(s)
+        """
+        accessor = self._accessors.get(column)
+        if accessor is not None:
+            try:
+                return accessor(line)
+            except IndexError:
+                if raise_on_none:
+                    raise ColumnNotFound(
+                        f"Column `{column}` is column {self._positions[column] + 1} "
+                        f"but Line=`{'    '.join(line)}` has {len(line)} column(s)"
+                    )
+                return None
 
         if raise_on_none:
-            raise ColumnNotFound(f"Column not found for Line=`{'    '.join(line)}`")
+            raise ColumnNotFound(f"Column `{column}` not found for Line=`{'    '.join(line)}`")
 
     @property
     def has_header(self):
@@ -70,12 +95,21 @@ class Reader(object):
             for key in line.strip().split(self.column_marker)
             if key and key in self.map_to
         ]
+        self._compile()
         return self._header
 
     @property
     def header(self):
         return self._header
 
+    def copy(self) -> "Reader":
+        """ Get a new reader with the same configuration, so that headers of different files do not collide
+        """
+        reader = Reader(**self.init_params)
+        reader._header = list(self._header)
+        reader._compile()
+        return reader
+
     def __repr__(self):
         return "<Reader type='{}' keys=[{}] from=[{}] />".format(
             self.reader_type,
@@ -2,13 +2,16 @@ __all__ = ["SentenceMatcherProto", "SentenceRegexpMatcher", "SentenceEmptyLineMa
 
 from abc import ABC
 from xml.etree.ElementTree import Element
-from typing import Optional, List
+from typing import Optional, List, TYPE_CHECKING
 
 import regex as re
 
+if TYPE_CHECKING:
+    from .postprocessing import _Columns
+
 
 class SentenceMatcherProto:
-    def match(self, headers: List[str], values: Optional[List[str]]):
+    def match(self, headers: List[str], values: Optional[List[str]], columns: Optional["_Columns"] = None):
         raise NotImplementedError()
 
     @classmethod
@@ -23,9 +26,26 @@ class SentenceRegexpMatcher(SentenceMatcherProto):
         self.regexp: re.Regex = regexp
         self.column: str = column
 
-    def match(self, headers: List[str], values: Optional[List[str]]):
-        data = dict(zip(headers, values))
-        return self.regexp.match(data[self.column]) is not None
+    def match(self, headers: List[str], values: Optional[List[str]], columns: Optional["_Columns"] = None):
+        """ Whether the value of the column in VALUES, a line of HEADERS, is matched by the regexp
+
+        :param columns: Positions of the columns of HEADERS, kept by the caller for all the lines of a file
+
+        >>> from protogenie.postprocessing import _Columns
+        >>> matcher = SentenceRegexpMatcher(re.compile("[.]"), "form")
+        >>> matcher.match(["form", "lemma"], [".", "x"]), matcher.match(["lemma", "form"], ["a", "."])
+        (True, True)
+        >>> columns = _Columns(["lemma", "form"])
+        >>> matcher.match(columns.header, ["x", "."], columns), matcher.match(columns.header, [".", "x"], columns)
+        (True, False)
+        """
+        if columns is not None:
+            position = columns.positions.get(self.column)
+            if position is not None:
+                values = columns.regular(values)
+                if position < len(values):
+                    return self.regexp.match(values[position]) is not None
+        return self.regexp.match(dict(zip(headers, values))[self.column]) is not None
 
     @classmethod
     def from_xml(cls, node: Element) -> "SentenceRegexpMatcher":
@@ -39,5 +59,5 @@ class SentenceEmptyLineMatcher(SentenceMatcherProto):
     def __init__(self):
         pass
 
-    def match(self, headers: List[str], values: Optional[List[str]]):
+    def match(self, headers: List[str], values: Optional[List[str]], columns: Optional["_Columns"] = None):
         return not values or len(headers) != len(values)
@@ -6,7 +6,10 @@ when the CSV reader enters a new sentence.
 import regex as re
 import math
 import random
-from typing import Dict, Union, List, Tuple, Optional
+import itertools
+import hashlib
+from typing import Callable, Dict, FrozenSet, Union, List, Tuple, Optional, Iterator, Any
+from dataclasses import dataclass
 if not True:
     from .configs import CorpusConfiguration
     from .reader import Reader
@@ -19,15 +22,17 @@ SPACE_ONLY = re.compile("^\s+$")
 
 class _DispatcherSequential:
     @staticmethod
-    def dispatch(units_count, test_ratio=0.2, dev_ratio=0.0001) -> List[str]:
-        """ Get the ratios and builds a list of targets completely randomly and shuffled
+    def dataset_sizes(units_count, test_ratio=0.2, dev_ratio=0.0001) -> Dict[str, int]:
+        """ Compute the number of units each dataset receives
 
         :param units_count: Number of units to dispatch (either sentence or dispatch depending on self.splitter)
         :param test_ratio: Ratio of data to be put in test
         :param dev_ratio: Ratio of data to be put in dev
-        :return: List of dataset to dispatch to
-        """
+        :return: Number of units per dataset, in the order of dispatch
 
+        >>> _DispatcherSequential.dataset_sizes(100, test_ratio=0.2, dev_ratio=0.1)
+        {'train': 70, 'test': 20, 'dev': 10}
+        """
         train_number = units_count
         dev_number = 0
         if dev_ratio > 0.001:
@@ -36,35 +41,116 @@ class _DispatcherSequential:
         test_number = int(math.ceil(test_ratio * units_count))
         train_number = train_number - test_number
 
-        target_dataset = ["train"] * train_number + ["test"] * test_number + ["dev"] * dev_number
-        return target_dataset
+        return {"train": max(train_number, 0), "test": test_number, "dev": dev_number}
+
+    @staticmethod
+    def dispatch(units_count, test_ratio=0.2, dev_ratio=0.0001, seed=None) -> Iterator[str]:
+        """ Get the ratios and yields the targets in order: train first, then test and dev
+
+        :param units_count: Number of units to dispatch (either sentence or dispatch depending on self.splitter)
+        :param test_ratio: Ratio of data to be put in test
+        :param dev_ratio: Ratio of data to be put in dev
+        :param seed: Unused, sequential dispatch is not random
+        :return: Iterator over the dataset to dispatch to
+        """
+        sizes = _DispatcherSequential.dataset_sizes(units_count, test_ratio, dev_ratio)
+        return itertools.chain.from_iterable(
+            itertools.repeat(dataset, count)
+            for dataset, count in sizes.items()
+        )
 
 
 class _DispatcherRandom(object):
     @staticmethod
-    def dispatch(units_count, test_ratio=0.2, dev_ratio=0.0001) -> List[str]:
-        """ Get the ratios and builds a list of targets completely randomly and shuffled
+    def dispatch(units_count, test_ratio=0.2, dev_ratio=0.0001, seed=None) -> Iterator[str]:
+        """ Get the ratios and yields the targets completely randomly
+
+        Each target is drawn when it is needed, with a probability equal to the share of units its dataset
+        still has to receive (sequential selection): the number of units per dataset is exact, and no list of
+        targets is kept in memory.
 
         :param units_count: Number of units to dispatch (either sentence or dispatch depending on self.splitter)
         :param test_ratio: Ratio of data to be put in test
         :param dev_ratio: Ratio of data to be put in dev
-        :return: List of dataset to dispatch to
+        :param seed: [Optional] Seed of the draw. If none is given, the global random state is used
+        :return: Iterator over the dataset to dispatch to
+
+        >>> targets = list(_DispatcherRandom.dispatch(100, test_ratio=0.2, dev_ratio=0.1, seed=5))
+        >>> targets.count("train"), targets.count("test"), targets.count("dev")
+        (70, 20, 10)
+        >>> targets == list(_DispatcherRandom.dispatch(100, test_ratio=0.2, dev_ratio=0.1, seed=5))
+        True
         """
+        rng = random if seed is None else random.Random(seed)
+        remaining = _DispatcherSequential.dataset_sizes(units_count, test_ratio, dev_ratio)
+        left = sum(remaining.values())
+        while left:
+            draw = rng.randrange(left)
+            for dataset, count in remaining.items():
+                if draw < count:
+                    break
+                draw -= count
+            remaining[dataset] -= 1
+            left -= 1
+            yield dataset
+
+
+class _DispatcherHash(object):
+    """ Dispatch each unit from a salted hash of its content (`on="content"`) or of its position
+    (`on="index"`, the path of its file and its index in it) compared with the ratios.
+
+    No unit count is needed: the same unit always lands in the same dataset, whatever the other units are.
+
+    >>> dispatcher = _DispatcherHash(test_ratio=0.2, dev_ratio=0.1, salt="1")
+    >>> targets = [dispatcher(["sentence {}\\n".format(i)], "file.tsv", i) for i in range(1000)]
+    >>> targets.count("train"), targets.count("test"), targets.count("dev")
+    (694, 203, 103)
+    >>> dispatcher(["sentence 3\\n"], "other_file.tsv", 0) == targets[3]
+    True
+    """
+    HASH_ON = ("content", "index")
+
+    def __init__(self, test_ratio=0.2, dev_ratio=0.0001, salt: str = "", on: str = "content"):
+        if on not in self.HASH_ON:
+            raise ValueError("Hash dispatch uses either {}, not `{}`".format(" or ".join(self.HASH_ON), on))
+        self.on: str = on
+        self.test_threshold: float = test_ratio
+        self.dev_threshold: float = test_ratio
+        if dev_ratio > 0.001:
+            self.dev_threshold += dev_ratio
+        self._hash = hashlib.blake2b(salt.encode("utf-8") + b"\0", digest_size=8)
+
+    def __call__(self, sentence: List[str], file: str, index: int) -> str:
+        """ Get the dataset of the INDEX-th unit SENTENCE of FILE"""
+        unit_hash = self._hash.copy()
+        if self.on == "content":
+            unit_hash.update("".join(sentence).encode("utf-8"))
+        else:
+            unit_hash.update("{}\0{}".format(file, index).encode("utf-8"))
+        value = int.from_bytes(unit_hash.digest(), "big") / 2 ** 64
 
-        target_dataset = _DispatcherSequential.dispatch(units_count, test_ratio, dev_ratio)
-        random.shuffle(target_dataset)
-        return target_dataset
+        if value < self.test_threshold:
+            return "test"
+        elif value < self.dev_threshold:
+            return "dev"
+        return "train"
 
 
 class _SplitterPrototype(_DispatcherRandom):
     """ This will contain any needed function accross splitters
+
+    Splitters only hold their configuration: anything that changes while reading a file lives in the state
+    returned by `new_state()`, which is passed to each call. One splitter can then read many files at once.
     """
     def __init__(self, *args, **kwargs):
         pass
 
-    def reset(self) -> None:
-        """ Reset the splitter values for the second pass if necessary
+    def new_state(self, targets: Optional[Iterator[str]] = None) -> Any:
+        """ Create the state of the splitter for reading a new file
+
+        :param targets: Dataset targets of the file when dispatching, None when only counting units
         """
+        return None
 
     def _repr_options(self) -> str:
         """ Return options of the splitter"""
@@ -77,19 +163,78 @@ class _SplitterPrototype(_DispatcherRandom):
         line = line.split(corpus_configuration.column_marker)
         return line
 
-    def __call__(self, line, reader: "Reader") -> bool:
+    def __call__(self, line, reader: "Reader", state: Any = None) -> bool:
         """
         """
         raise NotImplemented
 
-    def set_targets(self, targets: List[str]) -> None:
-        pass
+
+# Character class made of literal characters only, such as `[;:.]` or `[\.!:]`
+_LITERAL_CLASS = re.compile(r"\[((?:[^\\\[\]^-]|\\[^\w\s])+)\]")
+_ESCAPED = re.compile(r"\\(.)")
+# Inline flags and named groups, which cannot be put in an alternation with other patterns
+_INLINE_FLAGS = re.compile(r"\(\?[a-zA-Z^]")
+
+
+def _literal_characters(pattern: str) -> Optional[FrozenSet[str]]:
+    """ Get the characters of PATTERN if it is a character class of literal characters, None otherwise
+
+    >>> sorted(_literal_characters(r"[\\.!:]"))
+    ['!', '.', ':']
+    >>> _literal_characters(r"[a-z]") is None, _literal_characters(r"[\\w]") is None
+    (True, True)
+    """
+    literal = _LITERAL_CLASS.fullmatch(pattern)
+    if literal is None:
+        return None
+    return frozenset(_ESCAPED.sub(r"\1", literal.group(1)))
+
+
+class _Searches:
+    """ Searches for any of MATCHERS in a value, for patterns which cannot be put in one alternation"""
+    def __init__(self, matchers: List[re.Regex]):
+        self.matchers: List[re.Regex] = matchers
+
+    def __call__(self, value: str) -> bool:
+        for matcher in self.matchers:
+            if matcher.search(value):
+                return True
+        return False
+
+
+def _compile_search(patterns: List[str]) -> Callable[[str], Any]:
+    """ Compile a function whose result is truthy when any of PATTERNS is found in a value.
+
+    When every pattern is a class of literal characters, values are only intersected with the set of these
+    characters. Otherwise, patterns are searched for with one alternation compiled once, unless some pattern
+    has groups or inline flags.
+
+    >>> search = _compile_search([r"[;:]", r"[\\.]"])
+    >>> bool(search("a.")), bool(search("a"))
+    (True, False)
+    >>> search = _compile_search([r"PONfrt", r"Ref\\."])
+    >>> search.__self__.pattern
+    '(?:PONfrt)|(?:Ref\\\\.)'
+    """
+    characters = [_literal_characters(pattern) for pattern in patterns]
+    if None not in characters:
+        return frozenset().union(*characters).intersection
+
+    matchers = [re.compile(pattern) for pattern in patterns]
+    if len(matchers) == 1:
+        return matchers[0].search
+    if any(matcher.groups or _INLINE_FLAGS.search(pattern) for matcher, pattern in zip(matchers, patterns)):
+        return _Searches(matchers)
+    return re.compile("|".join("(?:{})".format(pattern) for pattern in patterns)).search
 
 
 class RegExpSplitter(_SplitterPrototype):
     def __init__(self, column_marker="\t", matchPattern: List[str] = None, source: List[str] = None, **kwargs):
         """ Returns true if the line is a sentence splitter by being empty
 
+        Patterns of a same source column are tested together, so that the value of each column is read once
+        per line.
+
         :param column_marker: Marker that splits column in the CSV/TSV
         :param sentence_splitter: Marker that shows the end of a sentence
 
@@ -98,58 +243,95 @@ class RegExpSplitter(_SplitterPrototype):
         ...                 column_marker=" ")
         >>> reader.set_header("form lemma POS")
         ['token', 'lemma', 'POS']
-        >>> obj = RegExpSplitter(" ", matchPattern=[r"PONfrt", r"Ref\."], source=["POS", "lemma"])
+        >>> obj = RegExpSplitter(" ", matchPattern=[r"PONfrt", r"Ref\.", r"[;:]", r"PONfbh"],
+        ...                      source=["POS", "lemma", "token", "POS"])
         >>> obj("abc abc PONfbl", reader)
         False
         >>> obj("abc Ref. OUT", reader)
         True
-        >>> obj(". . PONfrt", reader)
-        True
-
+        >>> obj(". . PONfrt", reader), obj("- - PONfbh", reader), obj("; ; PON", reader)
+        (True, True, True)
+        >>> obj("abc abc", reader)
+        Traceback (most recent call last):
+         ...
+        protogenie.reader.ColumnNotFound: Column `POS` is column 3 but Line=`abc    abc` has 2 column(s)
         """
         self.column_marker = column_marker
         self.match_pattern: List[str] = matchPattern or ["["+DEFAULT_SENTENCE_MARKERS+"]"]
         self.matcher: List[re.Regex] = [re.compile(matcher) for matcher in self.match_pattern]
         self.source: List[str] = source or ["form"]
 
+        # Patterns by source column, in the order in which columns are first used
+        patterns: Dict[str, List[str]] = {}
+        for pattern, column in zip(self.match_pattern, self.source):
+            patterns.setdefault(column, []).append(pattern)
+        self._searches: List[Tuple[str, Callable[[str], Any]]] = [
+            (column, _compile_search(column_patterns)) for column, column_patterns in patterns.items()
+        ]
+        # Whether patterns of a same column are not next to each other, in which case a pattern can be tested
+        #  before a pattern of another column which comes first
+        self._interleaved: bool = len(patterns) != len([
+            column for column, _ in itertools.groupby(self.source[:len(self.match_pattern)])
+        ])
+
     def _repr_options(self):
         return " matchPattern='{}'".format(self.match_pattern)
 
-    def __call__(self, line: str, reader: "Reader" = None):
+    def _search_in_order(self, values: List[str], reader: "Reader") -> bool:
+        """ Test patterns one by one, so that a missing column raises only if no pattern before it matched"""
         for matcher, source in zip(self.matcher, self.source):
-            if matcher.search(
-                reader.get_column(
-                    line.strip().split(reader.column_marker),
-                    source,
-                    raise_on_none=True
-                )
-            ):
+            if matcher.search(reader.get_column(values, source, raise_on_none=True)):
                 return True
         return False
 
+    def __call__(self, line: str, reader: "Reader" = None, state: Any = None):
+        values = line.strip().split(reader.column_marker)
+        if self._interleaved and None in [reader.get_column(values, column) for column, _ in self._searches]:
+            return self._search_in_order(values, reader)
+
+        for column, search in self._searches:
+            value = reader.get_column(values, column)
+            if value is None:
+                return self._search_in_order(values, reader)
+            if search(value):
+                return True
+        return False
+
+
+@dataclass
+class _LineSplitterState:
+    # We set it to True so that starting empty lines are
+    #  not counting as separators
+    last_line_was_empty: bool = True
+
 
 class LineSplitter(_SplitterPrototype):
     def __init__(self, **kwargs):
         """ Class for applying a split on new lines (some data are formatted such as sentence are separated
         with empty lines
+
+        >>> splitter = LineSplitter()
+        >>> state = splitter.new_state()
+        >>> [splitter(line, state=state) for line in ["\\n", "a\\n", "\\n", "\\n"]]
+        [False, False, True, False]
         """
-        # We set it to True so that starting empty lines are
-        #  not counting as separators
-        self.last_line_was_empty = True
 
-    def __call__(self, line, reader=None):
+    def new_state(self, targets: Optional[Iterator[str]] = None) -> _LineSplitterState:
+        return _LineSplitterState()
+
+    def __call__(self, line, reader=None, state: _LineSplitterState = None):
         if line == "\n":
-            if self.last_line_was_empty:
+            if state.last_line_was_empty:
                 return False
-            self.last_line_was_empty = True
+            state.last_line_was_empty = True
             return True
-        self.last_line_was_empty = False
+        state.last_line_was_empty = False
         return False
 
-    def reset(self):
-        """ Reset the last line to True in case the file starts with empty lines
-        """
-        self.last_line_was_empty = True
+
+@dataclass
+class _TokenWindowSplitterState:
+    words: int = 0
 
 
 class TokenWindowSplitter(_SplitterPrototype):
@@ -159,23 +341,41 @@ class TokenWindowSplitter(_SplitterPrototype):
         :param window: Split as a sentence each N words
         """
         self.window = int(window)
-        self.words = 0
 
-    def __call__(self, line, reader=None):
+    def new_state(self, targets: Optional[Iterator[str]] = None) -> _TokenWindowSplitterState:
+        return _TokenWindowSplitterState()
+
+    def __call__(self, line, reader=None, state: _TokenWindowSplitterState = None):
         if not line.strip():
             return False
         # No body cares about line in here
-        self.words += 1
-        if self.words == self.window:
-            self.words = 0
+        state.words += 1
+        if state.words == self.window:
+            state.words = 0
             return True
         return False
 
     def _repr_options(self):
         return " window='{}'".format(self.window)
 
-    def reset(self):
-        self.words = 0
+
+class _FileTargets:
+    """ Dataset targets of a FileSplitter, which also knows the size of each dataset"""
+    def __init__(self, sizes: Dict[str, int]):
+        self.sizes: Dict[str, int] = sizes
+        self._targets: Iterator[str] = iter(list(sizes))
+
+    def __iter__(self) -> "_FileTargets":
+        return self
+
+    def __next__(self) -> str:
+        return next(self._targets)
+
+
+@dataclass
+class _FileSplitterState:
+    # Remaining size of each dataset, None if we are counting lines
+    sizes: Optional[List[int]] = None
 
 
 class FileSplitter(_SplitterPrototype):
@@ -184,45 +384,42 @@ class FileSplitter(_SplitterPrototype):
         The real main piece of this splitter is actually the line_counting function
         """
         super(FileSplitter, self).__init__(self, *args, **kwargs)
-        self.line_count = 0
-        self._sets_size: Dict[str, int] = {}
-        self._dispatching: bool = False  #
-        self._sizes: Optional[List[int]] = None
-        
-    def __call__(self, line, reader=None):
+
+    def new_state(self, targets: Optional[_FileTargets] = None) -> _FileSplitterState:
+        if targets is None:
+            return _FileSplitterState()
+        return _FileSplitterState(sizes=[
+            targets.sizes.get("train", 0),
+            targets.sizes.get("dev", 0),
+            targets.sizes.get("test", 0),
+        ])
+
+    def __call__(self, line, reader=None, state: _FileSplitterState = None):
         if not line.strip():
             return False
 
-        if not self._dispatching:  # If we are counting lines
+        if state.sizes is None:  # If we are counting lines
             return True
 
-        if self._sizes:
-            self._sizes[0] -= 1
+        if state.sizes:
+            state.sizes[0] -= 1
             # If we still have something in our size, we reduce the number
-            if self._sizes[0]:
+            if state.sizes[0]:
                 return False
             else:
-                self._sizes.pop(0)
+                state.sizes.pop(0)
                 return True
         else:
             raise Exception("Sizes should be set and were not found")
 
-    def reset(self) -> None:
-        self.line_count = 0
-        self._dispatching = True
-        self._sizes = [
-            self._sets_size.get("train", 0),
-            self._sets_size.get("dev", 0),
-            self._sets_size.get("test", 0),
-        ]
-
-    def dispatch(self, units_count, test_ratio=0.2, dev_ratio=0.0001) -> List[str]:
-        """ Get the ratios and builds a list of targets completely randomly and shuffled
+    def dispatch(self, units_count, test_ratio=0.2, dev_ratio=0.0001, seed=None) -> _FileTargets:
+        """ Get the ratios and compute the size of each dataset: the file is cut into one chunk per dataset
 
         :param units_count: Number of units to dispatch (either sentence or dispatch depending on self.splitter)
         :param test_ratio: Ratio of data to be put in test
         :param dev_ratio: Ratio of data to be put in dev
-        :return: List of dataset to dispatch to
+        :param seed: Unused, the file is cut in order
+        :return: Iterator over the dataset to dispatch to
         """
         train_number = units_count
         dev_number = 0
@@ -232,9 +429,9 @@ class FileSplitter(_SplitterPrototype):
         test_number = int(math.ceil(test_ratio * units_count))
         train_number = train_number - test_number
 
-        target_dataset = ["train"] * train_number + ["test"] * test_number + ["dev"] * dev_number
-        self._sets_size = {
-            key: target_dataset.count(key)
-            for key in filter(lambda x: x in target_dataset, ["train", "dev", "test"])
-        }
-        return list(filter(lambda x: x in target_dataset, ["train", "dev", "test"]))
+        sizes = {"train": train_number, "dev": dev_number, "test": test_number}
+        return _FileTargets({
+            key: sizes[key]
+            for key in ["train", "dev", "test"]
+            if sizes[key] > 0
+        })
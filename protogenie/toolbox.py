@@ -1,11 +1,10 @@
 if False:
     from .configs import CorpusConfiguration
-import tempfile
 import regex as re
 from xml.etree.ElementTree import Element
 import csv
 from typing import List
-from .postprocessing import ApplyTo, PostProcessing, adhoc_reader
+from .postprocessing import ApplyTo, PostProcessing, Row, _LineState
 
 
 class RomanNumeral(PostProcessing):
@@ -31,40 +30,28 @@ class RomanNumeral(PostProcessing):
                                                       r"(CM|CD|D?C{0,3})(XC|XL|L?X{0,3})(IX|I?V|V?I{1,3}))$")
         self.apply_to: ApplyTo = apply_to
 
-    def apply(self, file_path: str, config: "CorpusConfiguration"):
-        temp = tempfile.TemporaryFile(mode="w+")  # 2
+    def modify_row(self, line: Row, state: _LineState, config: "CorpusConfiguration") -> List[Row]:
+        nb_line, state.line_no = state.line_no, state.line_no + 1
+        if nb_line == 0:
+            state.set_header(line)
+            return [line]
+        elif not line:
+            return [None]
+        columns = state.columns
+        line = columns.regular(line)
+        source = columns[self.apply_to.source]
 
-        try:
-            with open(file_path) as file:
-                csv_reader = adhoc_reader(file, delimiter=config.column_marker)
-                header: List[str] = []
-                for nb_line, line in enumerate(csv_reader):  # The file should already have been open
-                    if nb_line == 0:
-                        temp.write(config.column_marker.join(line)+"\n")
-                        header = line
-                        continue
-                    elif not line:
-                        temp.write("\n")
-                        continue
-                    lines = dict(zip(header, line))
+        if self.match_pattern.search(line[source]):
+            result = str(self.from_roman(line[source]))
 
-                    if self.match_pattern.search(lines[self.apply_to.source]):
-                        # original = {k: v for k, v in lines.items()}
-                        result = str(self.from_roman(lines[self.apply_to.source]))
+            for target in self.apply_to.target:
+                # If source and target are the same, we simply replace source by target
+                if self.apply_to.source == target:
+                    line[source] = result
+                else:  # Otherwise, we just copy the result value to the target
+                    columns.set(line, target, result)
 
-                        for target in self.apply_to.target:
-                            # If source and target are the same, we simply replace source by target
-                            if self.apply_to.source == target:
-                                lines[self.apply_to.source] = result
-                            else:  # Otherwise, we just copy the result value to the target
-                                lines[target] = result
-
-                    temp.write(config.column_marker.join(list(lines.values()))+"\n")
-            with open(file_path, "w") as f:
-                temp.seek(0)
-                f.write(temp.read())
-        finally:
-            temp.close()  # 5
+        return [line]
 
     @classmethod
     def from_xml(cls, node: Element) -> "RomanNumeral":
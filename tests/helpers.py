@@ -15,7 +15,7 @@ class _TestHelper(TestCase):
     output_dir = "./tests/test_config/"
     def setUp(self):
         self.verbose = getenv("VERBOSE_TESTS", "0") == "1"  # Allows for more debugging during tests
-        files = glob.glob("./tests/tests_output/**/*.*")
+        files = glob.glob("./tests/tests_output/**/*.*", recursive=True)
         for file in files:
             os.remove(file)
         try:
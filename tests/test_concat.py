@@ -0,0 +1,273 @@
+from .helpers import _TestHelper
+from tempfile import TemporaryDirectory, mkstemp
+import os.path as p
+from typing import Optional
+import filecmp
+import glob
+import hashlib
+import json
+import os
+import math
+import random
+
+from protogenie.dispatch import glue, _read_sentences
+from protogenie.manifest import MANIFEST, load_manifest, manifest_entry
+
+
+# Columns of the output are the ones of the files, in the same order
+SAME_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<config>
+    <output column_marker="TAB"/>
+    <default-header>
+        <header type="explicit">
+            <key map-to="lemma">lem</key>
+            <key map-to="POS">pos</key>
+            <key map-to="token">tok</key>
+        </header>
+    </default-header>
+    <corpora>{corpora}</corpora>
+</config>"""
+
+SENTENCE_CORPUS = """
+        <corpus path="{path}" column_marker="TAB">
+            <splitter name="regexp">
+                <option matchPattern="[\\.!:]" source="token"/>
+            </splitter>
+            <header type="default" />
+        </corpus>"""
+
+EMPTY_LINE_CORPUS = """
+        <corpus path="{path}" column_marker="TAB">
+            <splitter name="empty_line"/>
+            <header type="default" />
+        </corpus>"""
+
+
+class TestConcat(_TestHelper):
+    def create_config(self, cur_dir: str, corpora: str, header: Optional[str] = None) -> str:
+        """ Create a temporary config file whose output columns are the ones of the files, or HEADER"""
+        _, config = mkstemp(dir=cur_dir, suffix=".xml")
+        content = SAME_HEADER.format(corpora=corpora)
+        if header:
+            content = content.replace('<output column_marker="TAB"/>', header)
+        with open(config, "w") as f:
+            f.write(content)
+        return config
+
+    def build(self, config: str, output_dir: str):
+        random.seed(1111)
+        _, config = self._dispatch(train=0.6, test=0.2, dev=0.2, config=config, output_dir=output_dir)
+        return config
+
+    def test_reduce(self):
+        """ Checks that reducing keeps the first sentences of each file and counts them """
+        with TemporaryDirectory(dir="./") as cur_dir:
+            config = self.build("./tests/test_config/sentence.xml", cur_dir)
+
+            full = {dataset: (chunks, tokens) for dataset, _, chunks, tokens in glue(config, cur_dir)}
+            contents = {}
+            for dataset in full:
+                with open(p.join(cur_dir, dataset + ".tsv")) as f:
+                    contents[dataset] = f.read()
+
+            reduced = {
+                dataset: (chunks, tokens)
+                for dataset, _, chunks, tokens in glue(config, cur_dir, reduce=0.5, prefix="reduced-")
+            }
+            for dataset, (chunks, tokens) in full.items():
+                self.assertEqual(reduced[dataset][0], math.ceil(chunks * 0.5), "Half of the chunks should be kept")
+                with open(p.join(cur_dir, "reduced-" + dataset + ".tsv")) as f:
+                    content = f.read()
+                self.assertTrue(contents[dataset].startswith(content), "First sentences should be kept")
+                self.assertEqual(content.count("\n\n"), reduced[dataset][0], "Each chunk is followed by a blank line")
+                self.assertEqual(
+                    len([line for line in content.split("\n")[1:] if line]), reduced[dataset][1],
+                    "Tokens of kept chunks should be counted"
+                )
+
+    def test_same_header_copied(self):
+        """ Checks that files whose header is the output one are copied with the same result as when parsed """
+        with TemporaryDirectory(dir="./") as cur_dir:
+            config = self.create_config(
+                cur_dir, SENTENCE_CORPUS.format(path=p.abspath("./tests/test_data/sentence.tsv"))
+            )
+            config = self.build(config, cur_dir)
+
+            for reduce in [None, 0.5]:
+                stats = {
+                    dataset: (chunks, tokens)
+                    for dataset, _, chunks, tokens in glue(config, cur_dir, reduce=reduce)
+                }
+                for dataset, (chunks, tokens) in stats.items():
+                    with open(p.join(cur_dir, dataset, "sentence.tsv")) as f:
+                        sentences = list(_read_sentences(f, "sentence.tsv", config.output))
+                    if reduce:
+                        sentences = sentences[:math.ceil(len(sentences) * reduce)]
+                    expected = "\t".join(config.output.header) + "\n" + "".join(
+                        "\n".join("\t".join(line) for line in sentence) + "\n\n" for sentence in sentences
+                    )
+                    with open(p.join(cur_dir, dataset + ".tsv")) as f:
+                        self.assertEqual(f.read(), expected, "Copied sentences should be the same as parsed ones")
+                    self.assertEqual((chunks, tokens), (len(sentences), sum(map(len, sentences))),
+                                     "Copied sentences and tokens should be counted")
+
+    def test_parallel_same_as_serial(self):
+        """ Checks that writing files in place with several processes produces the same outputs and statistics """
+        corpora = SENTENCE_CORPUS.format(path=p.abspath("./tests/test_data/sentence.tsv")) + \
+            EMPTY_LINE_CORPUS.format(path=p.abspath("./tests/test_data/empty_line.tsv"))
+        remapped = """<output column_marker="TAB"><header>""" \
+                   """<key>token</key><key>lemma</key><key>POS</key></header></output>"""
+
+        for header in [None, remapped]:
+            with TemporaryDirectory(dir="./") as cur_dir:
+                config = self.build(self.create_config(cur_dir, corpora, header=header), cur_dir)
+                for reduce in [None, 0.5]:
+                    serial = list(glue(config, cur_dir, reduce=reduce, prefix="serial-"))
+                    parallel = list(glue(config, cur_dir, reduce=reduce, prefix="parallel-", jobs=3))
+                    self.assertEqual(serial, parallel, "Statistics should be the same")
+                    self.assertEqual(len(serial), 6, "Each file should be concatenated")
+                    for dataset in ["train", "dev", "test"]:
+                        self.assertTrue(
+                            filecmp.cmp(p.join(cur_dir, "serial-" + dataset + ".tsv"),
+                                        p.join(cur_dir, "parallel-" + dataset + ".tsv"), shallow=False),
+                            "Concatenated files should be the same"
+                        )
+
+    def test_shards(self):
+        """ Checks that shards hold every sentence, in order, with balanced or bounded token counts """
+        corpora = SENTENCE_CORPUS.format(path=p.abspath("./tests/test_data/sentence.tsv")) + \
+            EMPTY_LINE_CORPUS.format(path=p.abspath("./tests/test_data/empty_line.tsv"))
+        with TemporaryDirectory(dir="./") as cur_dir:
+            config = self.build(self.create_config(cur_dir, corpora), cur_dir)
+            stats = list(glue(config, cur_dir))
+            with open(p.join(cur_dir, "train.tsv")) as f:
+                header, body = f.read().split("\n", 1)
+            sentences = [sentence.count("\n") + 1 for sentence in body.split("\n\n")[:-1]]
+
+            for options in [{"shards": 3}, {"shards": 3, "jobs": 2}, {"max_shard_tokens": 50}]:
+                self.assertEqual(list(glue(config, cur_dir, prefix="shard-", **options)), stats,
+                                 "Statistics should be the same")
+                with open(p.join(cur_dir, "shard-train.index.json")) as f:
+                    index = json.load(f)["shards"]
+
+                content = ""
+                for shard in index:
+                    with open(p.join(cur_dir, shard["file"])) as f:
+                        shard_header, shard_body = f.read().split("\n", 1)
+                    self.assertEqual(shard_header, header, "Each shard should have the header")
+                    self.assertEqual(shard_body.count("\n\n"), shard["sentences"], "Sentences should be indexed")
+                    self.assertEqual(shard_body.count("\n") - shard["sentences"], shard["tokens"],
+                                     "Tokens should be indexed")
+                    content += shard_body
+                self.assertEqual(content, body, "Shards should hold every sentence, in order")
+
+                tokens = [shard["tokens"] for shard in index]
+                if "shards" in options:
+                    self.assertEqual(len(index), 3, "There should be 3 shards")
+                    self.assertLessEqual(max(tokens) - min(tokens), max(sentences),
+                                         "Shards should be balanced up to a sentence")
+                else:
+                    for shard in index:
+                        self.assertTrue(shard["tokens"] <= 50 or shard["sentences"] == 1,
+                                        "Shards should not hold more tokens than asked")
+                    self.assertEqual(sum(tokens), sum(sentences), "Every token should be in a shard")
+
+    def test_shard_names(self):
+        """ Checks that shards sort in their order and that shards of a previous concatenation are removed """
+        with TemporaryDirectory(dir="./") as cur_dir:
+            with open(p.join(cur_dir, "many.tsv"), "w") as f:  # 300 sentences of one token
+                f.write("lem\tpos\ttok\n" + "".join("lem\tpos\ttok{}\n\n".format(i) for i in range(300)))
+            config = self.build(
+                self.create_config(cur_dir, EMPTY_LINE_CORPUS.format(path=p.abspath(p.join(cur_dir, "many.tsv")))),
+                cur_dir
+            )
+
+            def shards():
+                with open(p.join(cur_dir, "train.index.json")) as f:
+                    index = [shard["file"] for shard in json.load(f)["shards"]]
+                self.assertEqual(index, sorted(p.basename(f) for f in glob.glob(p.join(cur_dir, "train.*.tsv"))),
+                                 "Shard files should be the indexed ones and sort in their order")
+                return index
+
+            list(glue(config, cur_dir, shards=101))
+            self.assertEqual(shards()[:2], ["train.000.tsv", "train.001.tsv"], "Numbers should have 3 digits")
+            list(glue(config, cur_dir, max_shard_tokens=1))
+            self.assertEqual(len(shards()), 180, "Each sentence should have its shard")
+            self.assertEqual(shards()[0], "train.000.tsv", "Numbers should have 3 digits")
+            list(glue(config, cur_dir, shards=3))
+            self.assertEqual(shards(), ["train.00.tsv", "train.01.tsv", "train.02.tsv"])
+
+    def test_manifest(self):
+        """ Checks that the manifest of the build describes output files and gives the same results as counting """
+        with TemporaryDirectory(dir="./") as cur_dir:
+            config = self.build("./tests/test_config/sentence.xml", cur_dir)
+            with open(p.join(cur_dir, MANIFEST)) as f:
+                manifest = json.load(f)["files"]
+
+            stats = list(glue(config, cur_dir))
+            self.assertEqual(sorted(manifest), sorted(dataset + "/" + file for dataset, file, _, _ in stats),
+                             "Each output file should be described")
+            for dataset, file, chunks, tokens in stats:
+                entry = manifest[dataset + "/" + file]
+                with open(p.join(cur_dir, dataset, file), "rb") as f:
+                    content = f.read()
+                self.assertEqual(
+                    (entry["dataset"], entry["sentences"], entry["tokens"], entry["bytes"], entry["sha256"]),
+                    (dataset, chunks, tokens, len(content), hashlib.sha256(content).hexdigest()),
+                    "Output files should be described"
+                )
+                self.assertEqual(entry["sources"], [p.relpath("./tests/test_data/" + file)],
+                                 "Source files should be recorded")
+
+            reduced = list(glue(config, cur_dir, reduce=0.5, prefix="manifest-"))
+            # A file changed since the build, even without changing its size, is counted again
+            path = p.join(cur_dir, "train", "sentence.tsv")
+            self.assertIsNotNone(manifest_entry(load_manifest(cur_dir), cur_dir, path))
+            with open(path) as f:
+                content = f.read()
+            with open(path, "w") as f:
+                f.write(content.replace("\n\n", "\n ", 1))  # Merges the first two sentences
+            self.assertIsNone(manifest_entry(load_manifest(cur_dir), cur_dir, path),
+                              "A file changed since the build should not use its entry")
+            self.assertEqual(
+                [chunks for dataset, file, chunks, _ in glue(config, cur_dir) if dataset == "train"],
+                [manifest["train/sentence.tsv"]["sentences"] - 1]
+            )
+            with open(p.join(cur_dir, "train", "sentence.tsv"), "a") as f:
+                f.write("new\tnew\tnew\n\n" * 10)
+            changed = list(glue(config, cur_dir, reduce=0.5, prefix="changed-"))
+            os.remove(p.join(cur_dir, MANIFEST))
+            self.assertEqual(list(glue(config, cur_dir, reduce=0.5, prefix="counted-")), changed,
+                             "Files changed since the build should be counted")
+            self.assertNotEqual(reduced, changed, "Files changed since the build should be counted")
+
+    def test_manifest_post_processed(self):
+        """ Checks that files rewritten by post-processings are described once post-processed """
+        postprocessing = """<postprocessing>
+            <skip matchPattern="^PON" source="POS" />
+            <capitalize column-token="token">
+                <first-word when="always"><sentence-marker name="empty_line"/></first-word>
+                <first-letters when="never"/>
+            </capitalize>
+        </postprocessing>
+        <default-header>"""
+        for inline in (False, True):
+            with TemporaryDirectory(dir="./") as cur_dir:
+                config = self.create_config(
+                    cur_dir, SENTENCE_CORPUS.format(path=p.abspath("./tests/test_data/sentence.tsv"))
+                )
+                with open(config) as f:
+                    content = f.read().replace("<default-header>", postprocessing)
+                with open(config, "w") as f:
+                    f.write(content)
+                random.seed(1111)
+                _, config = self._dispatch(train=0.6, test=0.2, dev=0.2, config=config, output_dir=cur_dir,
+                                           inline_postprocessing=inline)
+                with open(p.join(cur_dir, MANIFEST)) as f:
+                    manifest = json.load(f)["files"]
+                os.remove(p.join(cur_dir, MANIFEST))
+
+                for dataset, file, chunks, tokens in glue(config, cur_dir):
+                    entry = manifest[dataset + "/" + file]
+                    self.assertEqual((entry["sentences"], entry["tokens"]), (chunks, tokens),
+                                     "Sentences and tokens should be the ones of the post-processed file")
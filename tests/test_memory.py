@@ -5,8 +5,10 @@ import os.path as p
 import random
 import glob
 import filecmp
+import csv
 
 from protogenie.dispatch import ConfigError
+from protogenie.memory import convert_memory, read_memory
 
 TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
 <?xml-model href="protogeneia/schema.rng" schematypens="http://relaxng.org/ns/structure/1.0"?>
@@ -130,6 +132,88 @@ class TestMemory(_TestHelper):
 
                 self.assertEqual(seen, 3, "With the current config, there should be three files produced")
 
+    def test_memory_content_without_offsets(self):
+        """ Checks that memory files without byte offsets (three columns) still recreate the same content """
+
+        with TemporaryDirectory(dir="./") as cur_dir:
+            random.seed(1111)
+            config1, memory_file = self.create_config(memory="$file$", corpora=DEFAULT_CORPUS, cur_dir=cur_dir)
+            output_dir_1 = p.join(cur_dir, "output")
+            self._dispatch(
+                train=0.8,
+                test=0.1,
+                dev=0.1,
+                config=config1,
+                output_dir=output_dir_1
+            )
+            name = p.splitext(p.basename(config1))[0]  # [0] form splitext is everything but .xml
+            memory_file = memory_file.replace("$file$", name)+".csv"
+
+            with open(memory_file) as f:
+                rows = list(csv.reader(f))
+            self.assertTrue(all(len(row) == 5 for row in rows), "Rows should hold the byte offset and length")
+            with open(memory_file, "w") as f:
+                csv.writer(f).writerows([row[:3] for row in rows])
+
+            random.seed(5555)
+            with TemporaryDirectory(dir="./") as second_dir:
+                config2, _ = self.create_config(memory="$file$", corpora=DEFAULT_CORPUS, cur_dir=second_dir)
+                output_dir_2 = p.join(second_dir, "output")
+                self._from_memory(memory_file=memory_file, config=config2, output_dir=output_dir_2)
+
+                seen = 0
+                for dataset_type in ["train", "dev", "test"]:
+                    for original_file in glob.glob(p.join(output_dir_1, dataset_type, "*.*")):
+                        base = p.basename(original_file)
+                        created_from_memory = p.join(output_dir_2, dataset_type, base)
+                        self.assertTrue(filecmp.cmp(original_file, created_from_memory, shallow=False),
+                                        "File %s should be the same" % original_file)
+                        seen += 1
+
+                self.assertEqual(seen, 3, "With the current config, there should be three files produced")
+
+    def test_memory_content_unordered(self):
+        """ Checks that memory files whose rows are not grouped by file nor sorted still recreate the same content """
+        newcorpus = DEFAULT_CORPUS + """<corpus path="../tests/test_data/sentence.tsv" column_marker="TAB">""" \
+                                     """<splitter name="regexp"><option matchPattern="[\\.:?!]"/></splitter> """ \
+                                     """<header type="default" /></corpus>"""
+        with TemporaryDirectory(dir="./") as cur_dir:
+            random.seed(1111)
+            config1, memory_file = self.create_config(memory="$file$", corpora=newcorpus, cur_dir=cur_dir)
+            output_dir_1 = p.join(cur_dir, "output")
+            self._dispatch(
+                train=0.8,
+                test=0.1,
+                dev=0.1,
+                config=config1,
+                output_dir=output_dir_1
+            )
+            name = p.splitext(p.basename(config1))[0]  # [0] form splitext is everything but .xml
+            memory_file = memory_file.replace("$file$", name)+".csv"
+
+            with open(memory_file) as f:
+                rows = [row for row in csv.reader(f) if row]
+            random.Random(42).shuffle(rows)
+            with open(memory_file, "w") as f:
+                csv.writer(f).writerows(rows)
+
+            random.seed(5555)
+            with TemporaryDirectory(dir="./") as second_dir:
+                config2, _ = self.create_config(memory="$file$", corpora=newcorpus, cur_dir=second_dir)
+                output_dir_2 = p.join(second_dir, "output")
+                self._from_memory(memory_file=memory_file, config=config2, output_dir=output_dir_2)
+
+                seen = 0
+                for dataset_type in ["train", "dev", "test"]:
+                    for original_file in glob.glob(p.join(output_dir_1, dataset_type, "*.*")):
+                        base = p.basename(original_file)
+                        created_from_memory = p.join(output_dir_2, dataset_type, base)
+                        self.assertTrue(filecmp.cmp(original_file, created_from_memory, shallow=False),
+                                        "File %s should be the same" % original_file)
+                        seen += 1
+
+                self.assertEqual(seen, 6, "With the current config, there should be 6 files produced")
+
     def test_memory_content_with_post_proc(self):
         """ Checks that postprocessing is carried the same way on memorized file """
 
@@ -322,3 +406,229 @@ class TestMemory(_TestHelper):
 
                 self.assertEqual(seen, 9, "9 files should be produced")
                 self.assertEqual(similar, 6, "6 of them are mirrored")
+
+    def test_memory_new_generation(self):
+        """ Checks that rows of new files are appended to the memory, or to a new memory that leaves the old
+        one untouched, and that a failing rebuild does not change the memory"""
+        newcorpus = DEFAULT_CORPUS + """<corpus path="../tests/test_data/file.tsv" column_marker="TAB">""" \
+                                     """<splitter name="file_split"/>""" \
+                                     """<header type="default" /></corpus>"""
+
+        with TemporaryDirectory(dir="./") as cur_dir:
+            random.seed(1111)
+            config1, memory_file = self.create_config(memory="$file$", corpora=DEFAULT_CORPUS, cur_dir=cur_dir)
+            self._dispatch(train=0.8, test=0.1, dev=0.1, config=config1, output_dir=p.join(cur_dir, "output"))
+            name = p.splitext(p.basename(config1))[0]  # [0] form splitext is everything but .xml
+            memory_file = memory_file.replace("$file$", name)+".csv"
+            with open(memory_file) as f:
+                original = f.read()
+
+            with TemporaryDirectory(dir="./") as second_dir:
+                config2, _ = self.create_config(memory="$file$", corpora=newcorpus, cur_dir=second_dir)
+                with self.assertRaises(ConfigError):
+                    self._from_memory(memory_file=memory_file, config=config2,
+                                      output_dir=p.join(second_dir, "output"))
+                with open(memory_file) as f:
+                    self.assertEqual(f.read(), original, "A failing rebuild should not touch the memory")
+
+                new_memory = p.join(second_dir, "memory.csv")
+                self._from_memory(memory_file=memory_file, config=config2, output_dir=p.join(second_dir, "output"),
+                                  test_ratio=0.2, dev_ratio=0.1, new_memory_file=new_memory)
+                with open(memory_file) as f:
+                    self.assertEqual(f.read(), original, "The old memory should be untouched")
+                with open(new_memory) as f:
+                    generation = f.read()
+                self.assertTrue(generation.startswith(original), "The new memory should hold the old rows first")
+                self.assertIn("file.tsv", generation[len(original):], "Rows of the new file should follow")
+
+                self._from_memory(memory_file=memory_file, config=config2, output_dir=p.join(second_dir, "output"),
+                                  test_ratio=0.2, dev_ratio=0.1)
+                with open(memory_file) as f:
+                    appended = f.read()
+                self.assertTrue(appended.startswith(original), "Rows should be appended to the memory")
+                self.assertIn("file.tsv", appended[len(original):], "Rows of the new file should be appended")
+
+    def test_memory_compact(self):
+        """ Checks that compact memories recreate the same content, take the rows of new files and convert back
+        to the same CSV"""
+        newcorpus = DEFAULT_CORPUS + """<corpus path="../tests/test_data/file.tsv" column_marker="TAB">""" \
+                                     """<splitter name="file_split"/>""" \
+                                     """<header type="default" /></corpus>"""
+
+        with TemporaryDirectory(dir="./") as cur_dir:
+            random.seed(1111)
+            config1, memory_file = self.create_config(memory="$file$", corpora=DEFAULT_CORPUS, cur_dir=cur_dir)
+            output_dir_1 = p.join(cur_dir, "output")
+            self._dispatch(train=0.8, test=0.1, dev=0.1, config=config1, output_dir=output_dir_1)
+            name = p.splitext(p.basename(config1))[0]  # [0] form splitext is everything but .xml
+            memory_file = memory_file.replace("$file$", name)+".csv"
+
+            for extension in [".mem", ".mem.gz", ".mem.xz"]:
+                compact = p.join(cur_dir, "memory" + extension)
+                convert_memory(memory_file, compact)
+                self.assertEqual(list(read_memory(compact)), list(read_memory(memory_file)),
+                                 "Rows should be the same in both formats")
+
+                with TemporaryDirectory(dir="./") as second_dir:
+                    config2, _ = self.create_config(memory="$file$", corpora=newcorpus, cur_dir=second_dir)
+                    output_dir_2 = p.join(second_dir, "output")
+                    self._from_memory(memory_file=compact, config=config2, output_dir=output_dir_2,
+                                      test_ratio=0.2, dev_ratio=0.1)
+
+                    seen = 0
+                    for dataset_type in ["train", "dev", "test"]:
+                        for original_file in glob.glob(p.join(output_dir_1, dataset_type, "*.*")):
+                            created_from_memory = p.join(output_dir_2, dataset_type, p.basename(original_file))
+                            self.assertTrue(filecmp.cmp(original_file, created_from_memory, shallow=False),
+                                            "File %s should be the same" % original_file)
+                            seen += 1
+                    self.assertEqual(seen, 3, "With the current config, there should be three files produced")
+
+                rows = list(read_memory(compact))
+                self.assertEqual(rows[:len(list(read_memory(memory_file)))], list(read_memory(memory_file)),
+                                 "Old rows should be kept")
+                self.assertTrue(any(row[0].endswith("file.tsv") for row in rows), "Rows of the new file are added")
+
+                converted = p.join(cur_dir, "converted.csv")
+                convert_memory(compact, converted)
+                with open(converted) as f:
+                    self.assertEqual(list(csv.reader(f)), rows, "Converting back to CSV should keep every row")
+
+    def test_parallel_rebuild_same_as_serial(self):
+        """ Checks that rebuilding files in parallel with a seed produces the same outputs and memory"""
+        corpora = DEFAULT_CORPUS + """<corpus path="../tests/test_data/sentence.tsv" column_marker="TAB">""" \
+                                   """<splitter name="regexp"><option matchPattern="[\\.:?!]"/></splitter> """ \
+                                   """<header type="default" /></corpus>"""
+        newcorpus = corpora + """<corpus path="../tests/test_data/file.tsv" column_marker="TAB">""" \
+                              """<splitter name="file_split"/>""" \
+                              """<header type="default" /></corpus>"""
+        with TemporaryDirectory(dir="./") as cur_dir:
+            random.seed(1111)
+            config1, memory_file = self.create_config(memory="", corpora=corpora, cur_dir=cur_dir,
+                                                      postprocessing=DEFAULT_PROCESSING)
+            self._dispatch(train=0.8, test=0.1, dev=0.1, config=config1, output_dir=p.join(cur_dir, "output"))
+
+            outputs = []
+            for jobs in [1, 3]:
+                directory = p.join(cur_dir, "jobs%s" % jobs)
+                config2, _ = self.create_config(memory="", corpora=newcorpus, cur_dir=cur_dir,
+                                                postprocessing=DEFAULT_PROCESSING)
+                self._from_memory(memory_file=memory_file + ".csv", config=config2, output_dir=directory,
+                                  test_ratio=0.2, dev_ratio=0.1, seed=1111, jobs=jobs,
+                                  new_memory_file=directory + ".csv")
+                outputs.append((directory, directory + ".csv"))
+
+            (output_dir_1, memory_1), (output_dir_2, memory_2) = outputs
+            self.assertTrue(filecmp.cmp(memory_1, memory_2, shallow=False), "Memory files should be the same")
+
+            seen = 0
+            for dataset_type in ["train", "dev", "test"]:
+                for original_file in glob.glob(p.join(output_dir_1, dataset_type, "*.*")):
+                    parallel_file = p.join(output_dir_2, dataset_type, p.basename(original_file))
+                    self.assertTrue(filecmp.cmp(original_file, parallel_file, shallow=False),
+                                    "File %s should be the same" % original_file)
+                    seen += 1
+            self.assertEqual(seen, 9, "With the current config, there should be 9 files produced")
+
+    def test_single_pass_same_as_two_passes(self):
+        """ Checks that reading files only once produces the same outputs and memory as the two passes dispatch"""
+        corpora = DEFAULT_CORPUS + """<corpus path="../tests/test_data/sentence.tsv" column_marker="TAB">""" \
+                                   """<splitter name="regexp"><option matchPattern="[\\.:?!]"/></splitter> """ \
+                                   """<header type="default" /></corpus>""" \
+                                   """<corpus path="../tests/test_data/file.tsv" column_marker="TAB">""" \
+                                   """<splitter name="file_split"/>""" \
+                                   """<header type="default" /></corpus>"""
+        with TemporaryDirectory(dir="./") as cur_dir, TemporaryDirectory(dir="./") as second_dir:
+            outputs = []
+            for directory, single_pass in [(cur_dir, False), (second_dir, True)]:
+                random.seed(1111)
+                config, memory_file = self.create_config(memory="", corpora=corpora, cur_dir=directory,
+                                                         postprocessing=DEFAULT_PROCESSING)
+                self._dispatch(
+                    train=0.8,
+                    test=0.1,
+                    dev=0.1,
+                    config=config,
+                    output_dir=p.join(directory, "output"),
+                    single_pass=single_pass
+                )
+                outputs.append((p.join(directory, "output"), memory_file + ".csv"))
+
+            (output_dir_1, memory_1), (output_dir_2, memory_2) = outputs
+            self.assertTrue(filecmp.cmp(memory_1, memory_2, shallow=False), "Memory files should be the same")
+
+            seen = 0
+            for dataset_type in ["train", "dev", "test"]:
+                for original_file in glob.glob(p.join(output_dir_1, dataset_type, "*.*")):
+                    single_pass_file = p.join(output_dir_2, dataset_type, p.basename(original_file))
+                    self.assertTrue(filecmp.cmp(original_file, single_pass_file, shallow=False),
+                                    "File %s should be the same" % original_file)
+                    seen += 1
+            self.assertEqual(seen, 9, "With the current config, there should be 9 files produced")
+
+    def test_single_pass_lone_carriage_return(self):
+        """ Checks that carriage returns inside lines are kept in lines when reading files only once"""
+        with TemporaryDirectory(dir="./") as cur_dir:
+            with open(p.join(cur_dir, "carriage_return.tsv"), "w", newline="") as f:
+                for index in range(30):
+                    f.write("lem{0}\tpos{0}\tto\rk{0}\n".format(index) + ("\n" if index % 3 == 2 else ""))
+            corpora = DEFAULT_CORPUS.replace("../tests/test_data/roman_numbers.tsv", "carriage_return.tsv")
+
+            outputs = []
+            for memory, single_pass in [("1", False), ("2", True)]:
+                config, _ = self.create_config(memory=memory, corpora=corpora, cur_dir=cur_dir)
+                self._dispatch(
+                    train=0.8,
+                    test=0.1,
+                    dev=0.1,
+                    config=config,
+                    output_dir=p.join(cur_dir, "output" + memory),
+                    seed=1111,
+                    single_pass=single_pass
+                )
+                outputs.append(p.join(cur_dir, "output" + memory))
+
+            seen = 0
+            for dataset_type in ["train", "dev", "test"]:
+                for original_file in glob.glob(p.join(outputs[0], dataset_type, "*.*")):
+                    single_pass_file = p.join(outputs[1], dataset_type, p.basename(original_file))
+                    self.assertTrue(filecmp.cmp(original_file, single_pass_file, shallow=False),
+                                    "File %s should be the same" % original_file)
+                    seen += 1
+            self.assertEqual(seen, 3, "With the current config, there should be 3 files produced")
+
+    def test_parallel_same_as_serial(self):
+        """ Checks that dispatching files in parallel with a seed produces the same outputs and memory"""
+        corpora = DEFAULT_CORPUS + """<corpus path="../tests/test_data/sentence.tsv" column_marker="TAB">""" \
+                                   """<splitter name="regexp"><option matchPattern="[\\.:?!]"/></splitter> """ \
+                                   """<header type="default" /></corpus>""" \
+                                   """<corpus path="../tests/test_data/file.tsv" column_marker="TAB">""" \
+                                   """<splitter name="file_split"/>""" \
+                                   """<header type="default" /></corpus>"""
+        with TemporaryDirectory(dir="./") as cur_dir, TemporaryDirectory(dir="./") as second_dir:
+            outputs = []
+            for directory, jobs in [(cur_dir, 1), (second_dir, 3)]:
+                config, memory_file = self.create_config(memory="", corpora=corpora, cur_dir=directory,
+                                                         postprocessing=DEFAULT_PROCESSING)
+                self._dispatch(
+                    train=0.8,
+                    test=0.1,
+                    dev=0.1,
+                    config=config,
+                    output_dir=p.join(directory, "output"),
+                    seed=1111,
+                    jobs=jobs
+                )
+                outputs.append((p.join(directory, "output"), memory_file + ".csv"))
+
+            (output_dir_1, memory_1), (output_dir_2, memory_2) = outputs
+            self.assertTrue(filecmp.cmp(memory_1, memory_2, shallow=False), "Memory files should be the same")
+
+            seen = 0
+            for dataset_type in ["train", "dev", "test"]:
+                for original_file in glob.glob(p.join(output_dir_1, dataset_type, "*.*")):
+                    parallel_file = p.join(output_dir_2, dataset_type, p.basename(original_file))
+                    self.assertTrue(filecmp.cmp(original_file, parallel_file, shallow=False),
+                                    "File %s should be the same" % original_file)
+                    seen += 1
+            self.assertEqual(seen, 9, "With the current config, there should be 9 files produced")
@@ -1,4 +1,12 @@
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
 from .helpers import _TestHelper
+from protogenie.configs import ProtogenieConfiguration
+from protogenie.postprocessing import apply_postprocessings
 
 
 class TestPostProcessing(_TestHelper):
@@ -180,6 +188,135 @@ class TestPostProcessing(_TestHelper):
         self.assertEqual(clitics, 300*0.8*0.2, "There should be 2 clitics for 8 words")
 
 
+    def test_fused_same_as_separate(self):
+        """Test that a chain of post-processings applied at once gives the same result as separate applications"""
+        self._dispatch(output_dir="./tests/tests_output/", train=0.8, dev=0.1, test=0.1,
+                       config=self._general_config_write(""))
+        config = ProtogenieConfiguration.from_xml(self._general_config_write("""
+        <replacement matchPattern="^lem_[a-f]" replacementPattern="LEM">
+            <applyTo source="lemma"><target>lemma</target></applyTo>
+        </replacement>
+        <capitalize column-token="token">
+            <first-word when="never"><sentence-marker name="empty_line"/></first-word>
+            <first-letters when="ratio" ratio="0.3"/>
+        </capitalize>
+        <skip matchPattern="^pos_[a-c]" source="POS" />
+        <disambiguation matchPattern="([xyz])$" source="lemma" new-column="dis"/>
+        <capitalize column-token="token" column-lemma="lemma" utf8-marker-for-caps="true">
+            <first-word when="never"><sentence-marker name="empty_line"/></first-word>
+            <first-letters when="ratio" ratio="0.2"/>
+        </capitalize>"""))
+        corpus = next(iter(config.corpora.values()))
+
+        with tempfile.TemporaryDirectory() as directory:
+            separate, fused = os.path.join(directory, "separate.tsv"), os.path.join(directory, "fused.tsv")
+            shutil.copy(self.path("train", "generic.tsv"), separate)
+            shutil.copy(self.path("train", "generic.tsv"), fused)
+
+            random.seed(1111)
+            for postprocessing in config.postprocessings:
+                postprocessing.apply(separate, corpus)
+            random.seed(1111)
+            apply_postprocessings(config.postprocessings, [fused], corpus)
+
+            with open(separate) as f, open(fused) as g:
+                self.assertEqual(f.read(), g.read(), "Fused post-processings should write the same file")
+
+    def test_chain_same_as_sequential(self):
+        """Test that a chain of post-processings gives the file written by each rule reading and writing lines"""
+        self._dispatch(output_dir="./tests/tests_output/", train=0.8, dev=0.1, test=0.1,
+                       config=self._general_config_write(""))
+        config = ProtogenieConfiguration.from_xml(self._general_config_write("""
+        <replacement matchPattern="^lem_[a-f]" replacementPattern="LEM">
+            <applyTo source="lemma"><target>lemma</target></applyTo>
+        </replacement>
+        <skip matchPattern="^pos_[a-c]" source="POS" />
+        <capitalize column-token="token">
+            <first-word when="ratio" ratio="0.5"><sentence-marker name="empty_line"/></first-word>
+            <first-letters when="ratio" ratio="0.3"/>
+        </capitalize>
+        <clitic type="enclitic" glue_char="+" matchPattern="^lem_[x-z]" source="lemma">
+            <transfer>lemma</transfer>
+        </clitic>
+        <disambiguation matchPattern="([xyz])$" source="lemma" new-column="dis"/>"""))
+        corpus = next(iter(config.corpora.values()))
+
+        with tempfile.TemporaryDirectory() as directory:
+            sequential, chained = os.path.join(directory, "sequential.tsv"), os.path.join(directory, "chained.tsv")
+            shutil.copy(self.path("train", "generic.tsv"), sequential)
+            shutil.copy(self.path("train", "generic.tsv"), chained)
+
+            # Reference: each rule reads the lines written by the previous one, and splits and joins them itself
+            random.seed(1111)
+            for postprocessing in config.postprocessings:
+                state = postprocessing.new_state(sequential, corpus)
+                with open(sequential) as f:
+                    lines = f.readlines()
+                if postprocessing.RequiresScan:
+                    postprocessing.scan([line.strip().split("\t") if line.strip() else None for line in lines],
+                                        state, corpus)
+                lines = [out for line in lines for out in postprocessing.modify(line, state, corpus)] + [
+                    "\t".join(row) + "\n" if row is not None else "\n"
+                    for row in postprocessing.close(state, corpus)
+                ]
+                with open(sequential, "w") as f:
+                    f.writelines(lines)
+            random.seed(1111)
+            apply_postprocessings(config.postprocessings, [chained], corpus)
+
+            with open(sequential) as f, open(chained) as g:
+                self.assertEqual(f.read(), g.read(), "A chain should write the file written rule after rule")
+
+
+    def test_inline_same_as_after(self):
+        """Test that post-processings applied while dispatching give the same files as applied afterwards"""
+        conf = self._general_config_write("""
+        <replacement matchPattern="^lem_[a-f]" replacementPattern="LEM">
+            <applyTo source="lemma"><target>lemma</target></applyTo>
+        </replacement>
+        <skip matchPattern="^pos_[a-c]" source="POS" />
+        <clitic type="enclitic" glue_char="+" matchPattern="^lem_[x-z]" source="lemma">
+            <transfer>lemma</transfer>
+        </clitic>
+        <capitalize column-token="token">
+            <first-word when="never"><sentence-marker name="empty_line"/></first-word>
+            <first-letters when="ratio" ratio="0.3"/>
+        </capitalize>
+        <disambiguation matchPattern="([xyz])$" source="lemma" new-column="dis"/>""")
+
+        contents = []
+        for inline_postprocessing in [False, True]:
+            self._dispatch(output_dir="./tests/tests_output/", train=0.8, dev=0.1, test=0.1, config=conf,
+                           seed=1111, inline_postprocessing=inline_postprocessing)
+            content = {}
+            for dataset in ["train", "dev", "test"]:
+                with self.open(dataset, "generic.tsv") as f:
+                    content[dataset] = f.read()
+            contents.append(content)
+            self.setUp()
+
+        self.assertEqual(contents[0], contents[1], "Inline post-processings should write the same files")
+
+
+    def test_failure_keeps_file(self):
+        """Test that a post-processing failing halfway leaves the output file untouched"""
+        self._dispatch(output_dir="./tests/tests_output/", train=0.8, dev=0.1, test=0.1,
+                       config=self._general_config_write(""))
+        config = ProtogenieConfiguration.from_xml(self._general_config_write("""
+        <skip matchPattern="^pos_" source="unknown-column" />"""))
+        with open(self.path("train", "generic.tsv")) as f:
+            before = f.read()
+
+        with self.assertRaises(KeyError):
+            apply_postprocessings(config.postprocessings, [self.path("train", "generic.tsv")],
+                                  next(iter(config.corpora.values())))
+
+        with open(self.path("train", "generic.tsv")) as f:
+            self.assertEqual(before, f.read(), "The file should not have been modified")
+        self.assertEqual(os.listdir("./tests/tests_output/train"), ["generic.tsv"],
+                         "The temporary file should have been removed")
+
+
 class TestCapitalize(TestPostProcessing):
     """ Check that capitalization are dealt with correctly"""
 
@@ -332,3 +469,62 @@ class TestCapitalize(TestPostProcessing):
         )
 
         self.assertEqual(tokens, 500 * 0.8, "There should be 80% of total tokens")
+
+    def test_seeded_capitalize_independent_of_hash_seed(self):
+        """ Ensure that a seeded build capitalizes the same tokens whatever the hash seed of the interpreter"""
+        conf = self._general_config_write("""
+         <capitalize column-token="token">
+            <first-word when="ratio" ratio="0.5">
+                <sentence-marker name="empty_line"/>
+            </first-word>
+            <first-letters when="ratio" ratio="0.3"/>
+        </capitalize>""")
+
+        with tempfile.TemporaryDirectory(dir="./") as cur_dir:
+            outputs = []
+            for hash_seed in ["1", "2", "3"]:
+                output = os.path.join(cur_dir, "output" + hash_seed)
+                subprocess.run(
+                    [sys.executable, "-c", "from protogenie.cli import main; main()",
+                     "build", conf, "--output", output, "--seed", "1111", "--dev", "0.1", "--test", "0.1"],
+                    env=dict(os.environ, PYTHONHASHSEED=hash_seed), check=True, stdout=subprocess.DEVNULL
+                )
+                outputs.append(output)
+
+            for dataset_type in ["train", "dev", "test"]:
+                path = os.path.join(dataset_type, "generic.tsv")
+                with open(os.path.join(outputs[0], path)) as f:
+                    expected = f.read()
+                for output in outputs[1:]:
+                    with open(os.path.join(output, path)) as f:
+                        self.assertEqual(expected, f.read(), "File %s should be the same" % path)
+
+    def test_sentence_regexp_matcher_per_file(self):
+        """ Ensure that a regexp sentence marker finds its column in each file, without keeping it on the matcher"""
+        config = ProtogenieConfiguration.from_xml(self._general_config_write("""
+         <capitalize column-token="token">
+            <first-word when="always">
+                <sentence-marker name="regexp">
+                    <sentence-marker regexp="^PON$" column="pos"/>
+                </sentence-marker>
+            </first-word>
+            <first-letters when="never"/>
+        </capitalize>"""))
+        capitalize = config.postprocessings[0]
+        matcher_attributes = dict(vars(capitalize.sentence_matcher))
+
+        with tempfile.TemporaryDirectory() as directory:
+            first, second = os.path.join(directory, "first.tsv"), os.path.join(directory, "second.tsv")
+            with open(first, "w") as f:
+                f.write("token\tlemma\tpos\na\tx\tPON\nb\ty\tV\n.\t.\tPON\nc\tz\tV\n")
+            with open(second, "w") as f:
+                f.write("pos\ttoken\tlemma\nPON\ta\tx\nV\tb\ty\nV\td\tw\nPON\t.\t.\nV\tc\tz\n")
+
+            apply_postprocessings(config.postprocessings, [first, second], next(iter(config.corpora.values())))
+
+            with open(first) as f:
+                self.assertEqual(f.read(), "token\tlemma\tpos\na\tx\tPON\nB\ty\tV\n.\t.\tPON\nC\tz\tV\n")
+            with open(second) as f:
+                self.assertEqual(f.read(), "pos\ttoken\tlemma\nPON\ta\tx\nV\tB\ty\nV\td\tw\nPON\t.\t.\nV\tC\tz\n")
+        self.assertEqual(vars(capitalize.sentence_matcher), matcher_attributes,
+                         "The matcher should not keep the state of a file")
@@ -0,0 +1,64 @@
+from unittest import TestCase
+
+from protogenie.reader import Reader, ColumnNotFound
+
+
+class TestReader(TestCase):
+    def explicit(self) -> Reader:
+        return Reader(reader_type="explicit", keys=[("form", "token"), ("lemma", None), ("POS", "pos")],
+                      column_marker="\t")
+
+    def test_short_rows(self):
+        """Test that a column beyond the end of a row is None, or raises when asked to"""
+        reader = self.explicit()
+        reader.set_header("form\tlemma\tPOS")
+
+        self.assertEqual(reader.get_column(["a", "b", "c"], "pos"), "c")
+        self.assertIsNone(reader.get_column(["a", "b"], "pos"), "A short row has no value for the column")
+        with self.assertRaises(ColumnNotFound) as error:
+            reader.get_column(["a", "b"], "pos", raise_on_none=True)
+        self.assertEqual(error.exception.msg, "Column `pos` is column 3 but Line=`a    b` has 2 column(s)")
+
+        self.assertIsNone(reader.get_column(["a", "b", "c"], "unknown"), "An unknown column has no value")
+        with self.assertRaises(ColumnNotFound):
+            reader.get_column(["a", "b", "c"], "unknown", raise_on_none=True)
+
+    def test_set_header(self):
+        """Test that columns are found at their position in the last header which was set"""
+        reader = self.explicit()
+        self.assertIsNone(reader.get_column(["a", "b", "c"], "token"), "No column is known before the header")
+
+        self.assertEqual(reader.set_header("form\tlemma\tPOS"), ["token", "lemma", "pos"])
+        self.assertEqual(reader.get_column(["a", "b", "c"], "token"), "a")
+
+        self.assertEqual(reader.set_header("POS\tform\tunknown\tlemma\n"), ["pos", "token", "lemma"])
+        self.assertEqual(
+            [reader.get_column(["a", "b", "c"], column) for column in ["pos", "token", "lemma"]], ["a", "b", "c"],
+            "Columns which are not mapped should not be counted"
+        )
+
+        reader.set_header("lemma\tform\tform")
+        self.assertEqual(reader.get_column(["a", "b", "c"], "token"), "b", "The first column found twice is read")
+        self.assertIsNone(reader.get_column(["a", "b", "c"], "pos"), "A column of an old header is not kept")
+
+    def test_order_header(self):
+        """Test that readers by order know their columns without a header"""
+        reader = Reader(reader_type="order", keys=[("2", "token"), ("0", "lemma")], column_marker="\t")
+        self.assertEqual(reader.header, ["lemma", "UNK1", "token"])
+        self.assertEqual(reader.get_column(["a", "b", "c"], "token"), "c")
+        self.assertEqual(reader.get_column(["a", "b", "c"], "UNK1"), "b")
+
+    def test_copy(self):
+        """Test that a copy reads the same columns, and that setting its header leaves the original untouched"""
+        reader = self.explicit()
+        reader.set_header("POS\tlemma\tform")
+        copy = reader.copy()
+
+        self.assertEqual(copy.header, reader.header)
+        self.assertEqual(copy.init_params, reader.init_params)
+        self.assertEqual(copy.get_column(["a", "b", "c"], "token"), "c")
+
+        copy.set_header("form\tlemma\tPOS")
+        self.assertEqual(copy.get_column(["a", "b", "c"], "token"), "a")
+        self.assertEqual(reader.header, ["pos", "lemma", "token"], "The header of the original should be kept")
+        self.assertEqual(reader.get_column(["a", "b", "c"], "token"), "c")
@@ -1,4 +1,5 @@
 import random
+import os
 from .helpers import _TestHelper
 
 random.seed(78000)
@@ -197,3 +198,158 @@ class TestConfigs(_TestHelper):
             sum(train) / sum(dev), 8,
             "10% of test for 80% of dev, which makes 8 sequence of train for 1 of dev"
         )
+
+    def test_seed(self):
+        """Test that a seed gives the same dispatch whatever the global random state"""
+        contents = []
+        for global_seed in [1, 2]:
+            random.seed(global_seed)
+            self._dispatch(
+                output_dir="./tests/tests_output/",
+                train=0.8,
+                dev=0.1,
+                test=0.1,
+                config="./tests/test_config/sentence.xml",
+                seed=33
+            )
+            content = {}
+            for dataset in ["train", "dev", "test"]:
+                with self.open(dataset, "sentence.tsv") as f:
+                    content[dataset] = f.read()
+            contents.append(content)
+            self.setUp()
+
+        self.assertEqual(contents[0], contents[1], "Seeded dispatch should not depend on the global random state")
+
+    def test_hash_dispatch(self):
+        """Test that hash dispatch does not depend on randomness and keeps the ratio approximately"""
+        contents = []
+        for global_seed in [1, 2]:
+            random.seed(global_seed)
+            self._dispatch(
+                output_dir="./tests/tests_output/",
+                train=0.6,
+                dev=0.2,
+                test=0.2,
+                config="./tests/test_config/window.xml",
+                hash_dispatch="index",
+                salt="protogenie"
+            )
+            content = {}
+            for dataset in ["train", "dev", "test"]:
+                with self.open(dataset, "window.tsv") as f:
+                    content[dataset] = f.read()
+            contents.append(content)
+            self.setUp()
+
+        self.assertEqual(contents[0], contents[1], "Hash dispatch should not depend on the global random state")
+        self.assertTrue(all(contents[0].values()), "Each dataset should have received units")
+
+    def test_interleaved_files(self):
+        """Test that one splitter can read several files at the same time"""
+        from protogenie.configs import ProtogenieConfiguration
+        from protogenie.dispatch import _read_units
+        config = ProtogenieConfiguration.from_xml("./tests/test_config/empty_line.xml")
+        file, current_config = next(iter(config.corpora.items()))
+        file = os.path.join(config.dir, file)
+
+        def units():
+            return _read_units(file, current_config, current_config.reader.copy(), current_config.splitter.new_state())
+
+        sequential = list(units())
+        interleaved = [unit for pair in zip(units(), units()) for unit in pair]
+        self.assertEqual(interleaved[::2], sequential, "Reading another file should not change the units")
+        self.assertEqual(interleaved[1::2], sequential, "Reading another file should not change the units")
+
+    def test_counted_preview(self):
+        """Test that counting lines without reading them one by one finds the units found line by line"""
+        from tempfile import TemporaryDirectory
+        from protogenie.configs import CorpusConfiguration
+        from protogenie.dispatch import _preview
+        from protogenie.reader import Reader
+
+        class ByLine:  # Splitters whose class is not one of the counted ones are read line by line
+            def __init__(self, splitter):
+                self.splitter = splitter
+
+            def __call__(self, line, reader=None, state=None):
+                return self.splitter(line, reader=reader, state=state)
+
+            def new_state(self, targets=None):
+                return self.splitter.new_state(targets)
+
+        with TemporaryDirectory() as cur_dir:
+            crafted = os.path.join(cur_dir, "crafted.tsv")
+            with open(crafted, "wb") as f:
+                f.write("lem\tPOS\ttok\r\n\r\n\r\na\tb\tc\r\n \r\n\r\n\r\n　\r\na\tb\tc".encode("utf-8"))
+            for file in ["./tests/test_data/empty_line.tsv", "./tests/test_data/window.tsv", crafted]:
+                for splitter, options in [("empty_line", {}), ("token_window", {"window": "3"}), ("file_split", {})]:
+                    reader = Reader("explicit", [("lem", "lemma"), ("POS", "POS"), ("tok", "token")], "\t")
+                    config = CorpusConfiguration(splitter=splitter, column_marker="\t", reader=reader, **options)
+                    counted = _preview(file, config, reader=reader.copy())
+                    config.splitter = ByLine(config.splitter)
+                    self.assertEqual(counted, _preview(file, config, reader=reader.copy()),
+                                     "Counted units and lines should be the ones found line by line")
+
+    def _regexp_reader(self):
+        from protogenie.reader import Reader
+        reader = Reader(reader_type="explicit", keys=[("form", "token"), ("lemma", "lemma"), ("POS", "POS")],
+                        column_marker=" ")
+        reader.set_header("form lemma POS")
+        return reader
+
+    def test_regexp_grouped_patterns(self):
+        """Test that patterns of a same column searched at once match the lines matched one by one"""
+        import regex as re
+        from protogenie.splitters import RegExpSplitter
+        reader = self._regexp_reader()
+        lines = ["a a PONfrt", "a Ref. x", "a a PONfbh", "a a PONfbl", "ab a x", "a a (a)b", "a a XYZ", "a a xyz",
+                 "Ref. PONfrt a", "a REF. y", "a a ab"]
+
+        for patterns, sources in [
+            (["PONfrt", r"Ref\.", "PONfbh", "PONfb[a-z]l?$"], ["POS", "lemma", "POS", "POS"]),
+            (["PONfrt", "(a)b", "(?i)xyz", "PONfbh"], ["POS", "POS", "POS", "POS"]),
+            (["^a$", "[A-Z]", r"(?i)ref\.", "b$"], ["token", "lemma", "lemma", "POS"])
+        ]:
+            splitter = RegExpSplitter(" ", matchPattern=patterns, source=sources)
+            for line in lines:
+                values = line.split(" ")
+                expected = any(
+                    re.search(pattern, values[["token", "lemma", "POS"].index(source)])
+                    for pattern, source in zip(patterns, sources)
+                )
+                self.assertEqual(splitter(line, reader), expected,
+                                 "Line `{}` should be matched as by each of {}".format(line, patterns))
+
+        splitter = RegExpSplitter(" ", matchPattern=["PONfrt", r"Ref\.", "PONfbh"], source=["POS", "lemma", "POS"])
+        self.assertEqual(dict(splitter._searches)["POS"].__self__.pattern, "(?:PONfrt)|(?:PONfbh)",
+                         "Patterns of a same column should be searched with one alternation")
+
+    def test_regexp_literal_characters(self):
+        """Test that classes of literal characters are searched without a regular expression"""
+        import regex as re
+        from protogenie.splitters import RegExpSplitter
+        reader = self._regexp_reader()
+
+        for patterns in [None, [r"[\.!:]"], ["[;]", r"[\]\\\-]"]]:
+            splitter = RegExpSplitter(" ", matchPattern=patterns, source=["token"] * len(patterns or [None]))
+            (column, search), = splitter._searches
+            self.assertIsInstance(search.__self__, frozenset, "Literal characters should be searched as a set")
+            for token in [".", "a", "a;b", "...", "-", "\\", "]", "!", ":", "[", "é", "a,b"]:
+                expected = any(re.search(pattern, token) for pattern in splitter.match_pattern)
+                self.assertEqual(bool(splitter(token + " x y", reader)), expected,
+                                 "Token `{}` should be matched as by {}".format(token, splitter.match_pattern))
+
+    def test_regexp_missing_interleaved_column(self):
+        """Test that a missing column raises only when no pattern tested before it matched"""
+        from protogenie.reader import ColumnNotFound
+        from protogenie.splitters import RegExpSplitter
+        reader = self._regexp_reader()
+        splitter = RegExpSplitter(" ", matchPattern=[r"^\.", "PONfrt", r"\.$"], source=["token", "POS", "token"])
+
+        self.assertTrue(splitter(". x", reader), "The first pattern matches before the missing column")
+        self.assertFalse(splitter("a x y", reader), "No pattern should match")
+        self.assertTrue(splitter("a. x PONfrt", reader), "The last pattern should match")
+        with self.assertRaises(ColumnNotFound):
+            # The last pattern matches, but only after the pattern of the missing column
+            splitter("a. x", reader)